@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Script to backfill user_id on webhook events stored before the
+user_id/timestamp index existed, so get_events can query them
+"""
+
+import os
+import sys
+
+import boto3
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lambdas'))
+from common.event_codec import decode_event_data
+from common.ingest import extract_user_id
+
+EVENTS_TABLE_NAME = os.environ.get('EVENTS_TABLE_NAME', 'InstaAI-WebhookEvents')
+
+def backfill(table, dry_run=False):
+    """Scan for events missing user_id and set it from the stored payload"""
+    scan_kwargs = {
+        'FilterExpression': 'attribute_not_exists(user_id)',
+        'ProjectionExpression': 'event_id, event_data'
+    }
+    scanned = updated = skipped = 0
+    
+    while True:
+        response = table.scan(**scan_kwargs)
+        for item in response.get('Items', []):
+            scanned += 1
+            try:
+                user_id = extract_user_id(decode_event_data(item.get('event_data')))
+            except ValueError:
+                user_id = None
+            
+            if not user_id:
+                skipped += 1
+                continue
+            
+            if not dry_run:
+                table.update_item(
+                    Key={'event_id': item['event_id']},
+                    UpdateExpression='set user_id = :u',
+                    ExpressionAttributeValues={':u': str(user_id)}
+                )
+            updated += 1
+        
+        last_key = response.get('LastEvaluatedKey')
+        if not last_key:
+            break
+        scan_kwargs['ExclusiveStartKey'] = last_key
+    
+    return scanned, updated, skipped
+
+if __name__ == '__main__':
+    dry_run = '--dry-run' in sys.argv
+    table = boto3.resource('dynamodb').Table(EVENTS_TABLE_NAME)
+    scanned, updated, skipped = backfill(table, dry_run=dry_run)
+    action = "Would update" if dry_run else "Updated"
+    print(f"Scanned {scanned} events without user_id")
+    print(f"{action} {updated} events, {skipped} had no recognizable user_id")
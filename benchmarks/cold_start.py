@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Cold-init benchmark: milliseconds to import each Lambda handler in a
+fresh interpreter, which is what a cold start pays before the first
+request
+
+Usage: python3 benchmarks/cold_start.py [--runs N] [--max-ms MS] [handler ...]
+Exits non-zero if any handler's median exceeds --max-ms.
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+LAMBDAS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'lambdas')
+
+# Runs in the child: time the import, then report which heavy modules it pulled in
+PROBE = """
+import sys, time
+start = time.perf_counter()
+import {module}
+elapsed = (time.perf_counter() - start) * 1000
+heavy = [m for m in ('boto3', 'botocore.client', 'botocore.exceptions', 'requests', 'aiohttp', 'asyncio') if m in sys.modules]
+print(f"{{elapsed:.1f}} {{','.join(heavy) or '-'}}")
+"""
+
+def handler_modules():
+    """Every module in lambdas/ that defines a lambda_handler"""
+    modules = []
+    for name in sorted(os.listdir(LAMBDAS_DIR)):
+        if name.endswith('.py'):
+            with open(os.path.join(LAMBDAS_DIR, name)) as f:
+                if 'def lambda_handler' in f.read():
+                    modules.append(name[:-3])
+    return modules
+
+def measure(module, runs):
+    """Median import time in ms over runs fresh interpreters, plus heavy modules loaded"""
+    env = dict(os.environ, AWS_DEFAULT_REGION=os.environ.get('AWS_DEFAULT_REGION', 'us-east-1'),
+               PYTHONDONTWRITEBYTECODE='1')
+    times = []
+    heavy = '-'
+    for _ in range(runs):
+        result = subprocess.run([sys.executable, '-c', PROBE.format(module=module)], cwd=LAMBDAS_DIR,
+                                env=env, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"{module} failed to import:\n{result.stderr}")
+        elapsed, heavy = result.stdout.split()[-2:]
+        times.append(float(elapsed))
+    return statistics.median(times), heavy
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('handlers', nargs='*', help='handler modules (default: all)')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--max-ms', type=float, help='fail if any median import exceeds this')
+    args = parser.parse_args()
+    
+    over_budget = []
+    print(f"{'handler':<20} {'import ms':>10}  heavy modules at import")
+    for module in args.handlers or handler_modules():
+        median, heavy = measure(module, args.runs)
+        print(f"{module:<20} {median:>10.1f}  {heavy}")
+        if args.max_ms is not None and median > args.max_ms:
+            over_budget.append(module)
+    
+    if over_budget:
+        print(f"\nOver {args.max_ms} ms: {', '.join(over_budget)}")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
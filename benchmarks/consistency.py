@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Consistency checks for the shortcuts the handlers take: runs the handlers
+in-process against moto and the handlers.py Graph stub, and checks that
+skipping work never hides data from a client
+
+Usage: python3 benchmarks/consistency.py [check ...]
+Exits non-zero if a check fails.
+"""
+
+import json
+import os
+import sys
+import tempfile
+import time
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from handlers import (USER_ID, close_async_session, configure_environment, create_tables, delivery, seed,
+                      start_graph_stub, ttl_deletes)
+
+def get_events_response(**params):
+    import get_events as handler
+    return handler.lambda_handler({'httpMethod': 'GET', 'queryStringParameters': params}, None)
+
+def get_events(**params):
+    return json.loads(get_events_response(**params)['body'])
+
+def ingest(*bodies, at=None):
+    """Store deliveries; with at (ms), as if written at that time."""
+    from common import ingest as module
+    at = at or int(time.time() * 1000)
+    with mock.patch.object(module.time, 'time', return_value=at / 1000):
+        return module.ingest_deliveries([(body, at) for body in bodies])
+
+def mids(page):
+    return [event['messaging'][0]['message']['mid'] for event in page['events']]
+
+def mid(body):
+    return body['entry'][0]['messaging'][0]['message']['mid']
+
+def check_index_lag():
+    """An event the index has not caught up with is returned by a later poll."""
+    import get_events as handler
+    cursor = get_events(user_id=USER_ID, last_minutes='5')['next_cursor']
+    body = delivery()
+    ingest(body)
+
+    # The query right after the publish misses the event
+    with mock.patch.object(handler, 'query_user_events', return_value=[]):
+        page = get_events(user_id=USER_ID, cursor=cursor)
+    assert page['count'] == 0, page
+
+    page = get_events(user_id=USER_ID, cursor=page['next_cursor'], wait='1')
+    assert mids(page) == [mid(body)], mids(page)
+
+    # Settled again: the next poll skips the query
+    with mock.patch.object(handler, 'query_user_events', side_effect=AssertionError('queried')):
+        page = get_events(user_id=USER_ID, cursor=page['next_cursor'])
+    assert page['count'] == 0, page
+
+def check_late_event():
+    """An event stamped before the cursor but visible after it is still returned."""
+    time.sleep(0.01)
+    newer = delivery()
+    ingest(newer)
+    cursor = get_events(user_id=USER_ID, last_minutes='5')['next_cursor']
+
+    older = delivery()
+    ingest(older, at=int(time.time() * 1000) - 2000)
+    page = get_events(user_id=USER_ID, cursor=cursor)
+    assert mids(page) == [mid(older)], mids(page)
+
+    page = get_events(user_id=USER_ID, cursor=page['next_cursor'])
+    assert page['count'] == 0, mids(page)
+
+def check_same_millisecond_pages():
+    """Events sharing a millisecond are all returned across truncated pages."""
+    cursor = get_events(user_id=USER_ID, last_minutes='5')['next_cursor']
+    bodies = [delivery() for _ in range(3)]
+    at = int(time.time() * 1000)
+    ingest(*bodies, at=at)
+
+    returned = []
+    for _ in range(len(bodies)):
+        page = get_events(user_id=USER_ID, cursor=cursor, limit='1')
+        returned += mids(page)
+        cursor = page['next_cursor']
+    expected = sorted(mid(body) for body in bodies)
+    assert sorted(returned) == expected, returned
+    assert get_events(user_id=USER_ID, cursor=cursor)['count'] == 0
+
+def revalidate(module_name, etag, **params):
+    """Status of a conditional GET carrying etag."""
+    import importlib
+    handler = importlib.import_module(module_name).lambda_handler
+    event = {'httpMethod': 'GET', 'queryStringParameters': params}
+    if etag:
+        event['headers'] = {'If-None-Match': etag}
+    response = handler(event, None)
+    return response['statusCode'], response['headers'].get('ETag')
+
+def check_send_invalidates():
+    """A successful send, single or bulk, stops 304s for ETags from before it."""
+    import send_message
+    sends = {
+        'single': {'user_id': USER_ID, 'recipient_id': '2', 'message': 'hi'},
+        'bulk': {'user_id': USER_ID, 'messages': [{'recipient_id': '2', 'message': 'hi'}]},
+    }
+    pages = {
+        'get_messages': {'user_id': USER_ID, 'conversation_id': 'c0'},
+        'get_conversations': {'user_id': USER_ID},
+    }
+    for send, body in sends.items():
+        etags = {}
+        for module_name, params in pages.items():
+            _, etag = revalidate(module_name, None, **params)
+            status, _ = revalidate(module_name, etag, **params)
+            assert status == 304, f"{module_name} before {send} send: {status}"
+            etags[module_name] = etag
+
+        time.sleep(0.002)
+        response = send_message.lambda_handler({'httpMethod': 'POST', 'body': json.dumps(body)}, None)
+        assert response['statusCode'] == 200, response
+
+        for module_name, params in pages.items():
+            status, _ = revalidate(module_name, etags[module_name], **params)
+            assert status == 200, f"{module_name} after {send} send: {status}"
+
+def check_ttl_archive():
+    """Events TTL deletes from the table can be read back from the archive."""
+    import archive_events
+    from common.archive import read_archived_events
+    start = int(time.time() * 1000) - 1000
+    batch = ttl_deletes(5)
+    expected = sorted(record['dynamodb']['OldImage']['event_id']['S'] for record in batch['Records'])
+    # Deletes made by anything but TTL are not archived
+    batch['Records'].append(dict(ttl_deletes(1)['Records'][0], userIdentity=None))
+    assert archive_events.lambda_handler(batch, None) == {'batchItemFailures': []}
+
+    records, _ = read_archived_events(USER_ID, start, int(time.time() * 1000), 100)
+    assert sorted(record['event_id'] for record in records) == expected, len(records)
+    assert get_events(user_id=USER_ID, archive='true', start=str(start))['count'] == len(expected)
+
+    for bounds in ({'start': str(10 ** 20)}, {'start': '5', 'end': '5'}, {'start': 'x'}):
+        status = get_events_response(user_id=USER_ID, archive='true', **bounds)['statusCode']
+        assert status == 400, (bounds, status)
+
+CHECKS = {
+    'index_lag': check_index_lag,
+    'late_event': check_late_event,
+    'same_millisecond_pages': check_same_millisecond_pages,
+    'send_invalidates': check_send_invalidates,
+    'ttl_archive': check_ttl_archive,
+}
+
+def main():
+    names = sys.argv[1:] or list(CHECKS)
+    unknown = [name for name in names if name not in CHECKS]
+    if unknown:
+        sys.exit(f"unknown checks: {', '.join(unknown)} (choose from {', '.join(CHECKS)})")
+
+    configure_environment(start_graph_stub(0), tempfile.mkdtemp(prefix='instaai-consistency-'))
+    os.environ.setdefault('EVENTS_BROKER_POLL_INTERVAL', '0.05')
+    from moto import mock_aws
+    failures = 0
+    with mock_aws():
+        create_tables()
+        seed()
+        for name in names:
+            try:
+                CHECKS[name]()
+                print(f"ok    {name}")
+            except AssertionError as e:
+                failures += 1
+                print(f"FAIL  {name}: {e}")
+        close_async_session()
+    return 1 if failures else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for the event_data storage codec: stored bytes and
+encode/decode CPU per event, legacy JSON strings vs compressed Binary
+
+Usage: python3 benchmarks/event_codec.py [--events N]
+"""
+
+import argparse
+import json
+import math
+import os
+import sys
+import time
+import zlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'lambdas'))
+from common.event_codec import CODEC_ZLIB_JSON, decode_event_data
+
+def sample_event(i):
+    """A representative single-item messaging entry as stored by the webhook"""
+    return {
+        'id': '17841400000000000',
+        'time': 1700000000 + i,
+        'object': 'instagram',
+        'messaging': [{
+            'sender': {'id': f'{1000000000000000 + i}'},
+            'recipient': {'id': '17841400000000000'},
+            'timestamp': 1700000000000 + i,
+            'message': {
+                'mid': 'aWdfZAG1faXRlbToxOklHTWVzc2FnZAUlEOjE3ODQxNDAwMDAwMDAwMDAwOjM0MDI4MjM2Njg0MTcxMDMwMTI0NDI1OTc0Mzg4MjM0MjU0NDY' + str(i),
+                'text': f'Hi! Is the item from your latest post still available? Order #{i}',
+                'attachments': [{'type': 'image', 'payload': {'url': f'https://lookaside.fbsbx.com/ig_messaging_cdn/?asset_id={i}&signature=abcdef0123456789'}}]
+            }
+        }]
+    }
+
+def timed(fn, values, repeat):
+    """Best per-item time in microseconds over repeat runs"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for value in values:
+            fn(value)
+        best = min(best, time.perf_counter() - start)
+    return best / len(values) * 1e6
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--events', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    
+    events = [sample_event(i) for i in range(args.events)]
+    legacy = [json.dumps(e) for e in events]
+    
+    print(f"{'codec':<12} {'bytes/event':>12} {'encode us':>10} {'decode us':>10}")
+    rows = [('json (v0)', sum(len(v.encode('utf-8')) for v in legacy), timed(json.dumps, events, args.repeat), timed(decode_event_data, legacy, args.repeat))]
+    
+    for level in (1, 6, 9):
+        def encode(data, level=level):
+            return bytes([CODEC_ZLIB_JSON]) + zlib.compress(json.dumps(data, separators=(',', ':')).encode('utf-8'), level)
+        encoded = [encode(e) for e in events]
+        rows.append((f'zlib-{level} (v1)', sum(len(v) for v in encoded), timed(encode, events, args.repeat), timed(decode_event_data, encoded, args.repeat)))
+    
+    base = rows[0][1]
+    for name, size, enc, dec in rows:
+        print(f"{name:<12} {size / args.events:>12.0f} {enc:>10.1f} {dec:>10.1f}   ({100 * size / base:.0f}% of json)")
+    
+    # DynamoDB bills reads per 4 KB of summed item size on a query, so a
+    # full get_events poll of 500 events costs roughly this many units
+    print()
+    for name, size, _, _ in rows:
+        print(f"{name:<12} ~{math.ceil(size / args.events * 500 / 4096)} read units per 500-event poll")
+
+if __name__ == '__main__':
+    main()
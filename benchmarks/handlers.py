@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+"""
+Offline benchmark for every Lambda handler: runs each one in-process
+against moto (DynamoDB, S3) and a local Graph API stub server, and
+reports latency, peak allocations and Graph/DynamoDB calls per request
+
+Usage: python3 benchmarks/handlers.py [--iterations N] [--graph-latency-ms MS]
+                                      [--save-baseline] [--save-calls] [--max-regression PCT] [scenario ...]
+Exits non-zero if a scenario makes more Graph or DynamoDB calls than
+benchmarks/handlers_calls.json (committed; the counts are deterministic)
+records; --save-calls updates it after an intended change. Latency and
+allocations are compared against benchmarks/handlers_baseline.json when it
+exists; that baseline is machine-specific, so it is not committed: save one
+before a change, compare after.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_PATH = os.path.join(ROOT, 'benchmarks', 'handlers_baseline.json')
+CALLS_PATH = os.path.join(ROOT, 'benchmarks', 'handlers_calls.json')
+CALLS = ('graph_calls', 'graph_async_calls', 'ddb_calls')
+
+USER_ID = '1'
+CONVERSATIONS = 20
+MESSAGES_PER_CONVERSATION = 25
+SEEDED_EVENTS = 200
+# Latency differences smaller than this are noise, whatever the percentage
+NOISE_MS = 1.0
+
+class GraphStub(BaseHTTPRequestHandler):
+    """Answers the Graph endpoints the handlers call with canned data."""
+
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out in separate writes; with Nagle on, keep-alive
+    # clients wait for a delayed ACK on every response
+    disable_nagle_algorithm = True
+    latency = 0.0
+
+    def do_GET(self):
+        self.respond(self.route('GET', urlparse(self.path).path))
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        self.respond(self.route('POST', urlparse(self.path).path))
+
+    def route(self, method, path):
+        parts = [p for p in path.split('/') if p and p != 'v22.0']
+        if method == 'POST' and parts == ['oauth', 'access_token']:
+            return {'access_token': 'short-token', 'user_id': USER_ID}
+        if parts == ['access_token']:
+            return {'access_token': 'long-token', 'token_type': 'bearer', 'expires_in': 5184000}
+        if parts == ['me']:
+            return {'user_id': USER_ID, 'username': 'bench', 'id': USER_ID}
+        if parts == ['me', 'conversations']:
+            return {'data': [{'id': f"c{i}", 'updated_time': '2025-01-01T00:00:00+0000'} for i in range(CONVERSATIONS)]}
+        if method == 'POST' and parts == ['me', 'messages']:
+            return {'recipient_id': '2', 'message_id': f"sent-{time.monotonic_ns()}"}
+        if len(parts) == 2 and parts[1] == 'messages':
+            return {'data': [stub_message(parts[0], i) for i in reversed(range(MESSAGES_PER_CONVERSATION))]}
+        if len(parts) == 1:
+            return stub_message('c0', 0, message_id=parts[0])
+        return None
+
+    def respond(self, data):
+        if self.latency:
+            time.sleep(self.latency)
+        status = 200 if data is not None else 404
+        body = json.dumps(data if data is not None else {'error': {'message': 'Unknown path', 'code': 100}}).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+def stub_message(conversation_id, i, message_id=None):
+    return {
+        'id': message_id or f"{conversation_id}-m{i}",
+        'created_time': f"2025-01-01T00:{i // 60:02d}:{i % 60:02d}+0000",
+        'from': {'id': '2', 'username': 'peer'},
+        'to': {'data': [{'id': USER_ID}]},
+        'message': f"message {i}"
+    }
+
+def start_graph_stub(latency_ms):
+    GraphStub.latency = latency_ms / 1000
+    server = ThreadingHTTPServer(('127.0.0.1', 0), GraphStub)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}"
+
+def configure_environment(graph_host, archive_dir):
+    """Point the handlers at moto and the stub; must run before they are imported."""
+    os.environ.update({
+        'AWS_DEFAULT_REGION': 'us-east-1',
+        'AWS_ACCESS_KEY_ID': 'testing',
+        'AWS_SECRET_ACCESS_KEY': 'testing',
+        'GRAPH_HOST': graph_host,
+        'OAUTH_TOKEN_URL': f"{graph_host}/oauth/access_token",
+        # Background prefetch would make call counts depend on timing
+        'GRAPH_PREFETCH': 'false',
+        'METRICS_ENABLED': 'false',
+        'LOG_LEVEL': 'ERROR',
+        'LOG_SAMPLE_RATE': '0',
+        # Token re-reads would make call counts depend on run time
+        'TOKEN_CACHE_TTL': '3600',
+        'EVENTS_ARCHIVE_DIR': archive_dir,
+        # Otherwise bulk sends measure the per-account send limiter
+        'SEND_RATE_PER_SECOND': '1000000',
+        'SEND_BURST': '1000000',
+    })
+    sys.path.insert(0, os.path.join(ROOT, 'lambdas'))
+
+def create_tables():
+    """Create the tables deploy/scripts/1_create_dynamodb_tables.sh creates."""
+    import boto3
+    ddb = boto3.client('dynamodb')
+
+    def create(name, key, index=None, attributes=()):
+        kwargs = {
+            'TableName': name,
+            'KeySchema': [{'AttributeName': key, 'KeyType': 'HASH'}],
+            'AttributeDefinitions': [{'AttributeName': key, 'AttributeType': 'S'}] +
+                                    [{'AttributeName': a, 'AttributeType': t} for a, t in attributes],
+            'BillingMode': 'PAY_PER_REQUEST'
+        }
+        if index:
+            kwargs['GlobalSecondaryIndexes'] = [{
+                'IndexName': index[0],
+                'KeySchema': [{'AttributeName': index[1], 'KeyType': 'HASH'},
+                              {'AttributeName': index[2], 'KeyType': 'RANGE'}],
+                'Projection': {'ProjectionType': 'ALL'}
+            }]
+        ddb.create_table(**kwargs)
+
+    create('InstaAI-Tokens', 'user_id')
+    create('InstaAI-Conversations', 'user_id')
+    create('InstaAI-WebhookEvents', 'event_id', ('user_id-timestamp-index', 'user_id', 'timestamp'),
+           [('user_id', 'S'), ('timestamp', 'N')])
+    create('InstaAI-Messages', 'message_id', ('conversation_id-created_time-index', 'conversation_id', 'created_time'),
+           [('conversation_id', 'S'), ('created_time', 'S')])
+
+_sequence = iter(range(10 ** 9))
+
+def delivery(entries=1):
+    """A webhook delivery with unique message ids, so dedup never skips it."""
+    now = int(time.time() * 1000)
+    return {'object': 'instagram', 'entry': [{
+        'id': USER_ID,
+        'time': now // 1000,
+        'messaging': [{
+            'sender': {'id': '2'},
+            'recipient': {'id': USER_ID},
+            'timestamp': now,
+            'message': {'mid': f"mid-{next(_sequence)}", 'text': 'hello from the benchmark'}
+        }]
+    } for _ in range(entries)]}
+
+def seed():
+    """Tokens for the benchmark accounts and a page-worth of webhook events."""
+    from common.aws import get_table
+    from common.ingest import ingest_deliveries
+    for user_id in (USER_ID, '2'):
+        get_table('InstaAI-Tokens').put_item(Item={'user_id': user_id, 'access_token': 'long-token', 'token_version': 1})
+    now = int(time.time() * 1000)
+    ingest_deliveries([(delivery(), now) for _ in range(SEEDED_EVENTS)])
+
+def ttl_deletes(count=100):
+    """An events table stream batch of TTL deletes, as archive_events receives it."""
+    import base64
+    from common.aws import to_item
+    from common.ingest import split_webhook_events
+    now = int(time.time() * 1000)
+    records = []
+    for item in split_webhook_events(delivery(entries=count), now):
+        item['timestamp'] = now
+        image = {name: {'B': base64.b64encode(bytes(value['B'])).decode()} if 'B' in value else value
+                 for name, value in to_item(item).items()}
+        records.append({
+            'eventName': 'REMOVE',
+            'userIdentity': {'type': 'Service', 'principalId': 'dynamodb.amazonaws.com'},
+            'dynamodb': {'OldImage': image, 'SequenceNumber': str(next(_sequence))}
+        })
+    return {'Records': records}
+
+def clear_conversations_cache():
+    from common.aws import get_table
+    get_table('InstaAI-Conversations').delete_item(Key={'user_id': USER_ID})
+
+def scenarios():
+    """name -> (handler module, event factory, per-iteration setup or None)"""
+    from common.event_queue import encode_delivery
+
+    def get(**params):
+        return lambda: {'httpMethod': 'GET', 'queryStringParameters': dict(params)}
+
+    def post(body_factory):
+        return lambda: {'httpMethod': 'POST', 'body': json.dumps(body_factory())}
+
+    def revalidate(module_name, **params):
+        """GETs carrying the ETag of an earlier response, as a browser cache sends."""
+        etag = []
+        def make_event():
+            if not etag:
+                import importlib
+                response = importlib.import_module(module_name).lambda_handler(get(**params)(), None)
+                etag.append(response['headers']['ETag'])
+            return {**get(**params)(), 'headers': {'If-None-Match': etag[0]}}
+        return make_event
+
+    return {
+        'webhook': ('webhook', post(delivery), None),
+        'webhook_batch': ('webhook', post(lambda: delivery(entries=10)), None),
+        'webhook_consumer': ('webhook_consumer', lambda: {'Records': [
+            {'body': encode_delivery(delivery(), int(time.time() * 1000))} for _ in range(10)]}, None),
+        'get_events': ('get_events', get(user_id=USER_ID, limit='50'), None),
+        'get_conversations': ('get_conversations', get(user_id=USER_ID), None),
+        'get_conversations_304': ('get_conversations', revalidate('get_conversations', user_id=USER_ID), None),
+        'get_conversations_uncached': ('get_conversations', get(user_id=USER_ID), clear_conversations_cache),
+        'get_messages': ('get_messages', get(user_id=USER_ID), None),
+        'get_messages_conversation': ('get_messages', get(user_id=USER_ID, conversation_id='c0'), None),
+        'get_messages_conversation_304': ('get_messages', revalidate('get_messages', user_id=USER_ID, conversation_id='c0'), None),
+        'send_message': ('send_message', post(lambda: {'user_id': USER_ID, 'recipient_id': '2', 'message': 'hi'}), None),
+        'send_message_bulk': ('send_message', post(lambda: {'user_id': USER_ID, 'messages': [
+            {'recipient_id': str(i), 'message': 'hi'} for i in range(10)]}), None),
+        'store_token': ('store_token', post(lambda: {'access_token': 'long-token', 'token_type': 'long_lived'}), None),
+        'exchange_token': ('exchange_token', post(lambda: {'code': 'auth-code'}), None),
+        'delete_user': ('delete_user', post(lambda: {'user_id': '2', 'is_deleted': False}), None),
+        'archive_events': ('archive_events', ttl_deletes, None),
+    }
+
+def close_async_session():
+    """Close graph_async's shared session, which Lambda never needs to do."""
+    graph_async = sys.modules.get('common.graph_async')
+    if graph_async and graph_async._session:
+        graph_async.run(graph_async._session.close())
+
+def invoke(handler, event):
+    from common import metrics
+    result = handler(event, None)
+    status = result.get('statusCode') if isinstance(result, dict) else None
+    if status is not None and status >= 400:
+        raise RuntimeError(f"returned {status}: {result.get('body')}")
+    _, counts = metrics.snapshot()
+    return {name: counts.get(name, 0) for name in CALLS}
+
+def run_scenario(module_name, make_event, setup, iterations):
+    """Median/p95 ms, peak KiB allocated and calls for one request."""
+    import importlib
+    handler = importlib.import_module(module_name).lambda_handler
+
+    # Warm up: first calls build clients and sessions, as a cold start would
+    for _ in range(2):
+        setup and setup()
+        invoke(handler, make_event())
+
+    times = []
+    for _ in range(iterations):
+        setup and setup()
+        event = make_event()
+        start = time.perf_counter()
+        calls = invoke(handler, event)
+        times.append((time.perf_counter() - start) * 1000)
+
+    setup and setup()
+    event = make_event()
+    tracemalloc.start()
+    invoke(handler, event)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    times.sort()
+    return {
+        'median_ms': round(statistics.median(times), 2),
+        'p95_ms': round(times[min(len(times) - 1, int(len(times) * 0.95))], 2),
+        'peak_kib': round(peak / 1024, 1),
+        **calls
+    }
+
+def regressions(name, result, baseline, max_regression):
+    """Reasons result is slower or larger than a local baseline."""
+    allowed = 1 + max_regression / 100
+    reasons = []
+    if result['median_ms'] > baseline['median_ms'] * allowed and result['median_ms'] - baseline['median_ms'] > NOISE_MS:
+        reasons.append(f"median {baseline['median_ms']} -> {result['median_ms']} ms")
+    if result['peak_kib'] > baseline['peak_kib'] * allowed:
+        reasons.append(f"peak {baseline['peak_kib']} -> {result['peak_kib']} KiB")
+    return [f"{name}: {reason}" for reason in reasons]
+
+def call_regressions(name, result, counts):
+    """Reasons result makes more calls than the committed counts."""
+    return [f"{name}: {calls} {counts.get(calls, 0)} -> {result[calls]}"
+            for calls in CALLS if result[calls] > counts.get(calls, 0)]
+
+def load_json(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+def save_json(path, results):
+    """Merge results into the JSON file at path."""
+    saved = load_json(path)
+    saved.update(results)
+    with open(path, 'w') as f:
+        json.dump(saved, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('scenarios', nargs='*', help='scenarios to run (default: all)')
+    parser.add_argument('--iterations', type=int, default=30)
+    parser.add_argument('--graph-latency-ms', type=float, default=0, help='added to every stub Graph response')
+    parser.add_argument('--save-baseline', action='store_true', help=f"write results to {os.path.relpath(BASELINE_PATH, ROOT)}")
+    parser.add_argument('--save-calls', action='store_true', help=f"write call counts to {os.path.relpath(CALLS_PATH, ROOT)}")
+    parser.add_argument('--max-regression', type=float, default=25, help='percent slower or larger allowed (default 25)')
+    args = parser.parse_args()
+
+    configure_environment(start_graph_stub(args.graph_latency_ms), tempfile.mkdtemp(prefix='instaai-bench-'))
+    from moto import mock_aws
+    with mock_aws():
+        create_tables()
+        seed()
+        available = scenarios()
+        names = args.scenarios or list(available)
+        unknown = [name for name in names if name not in available]
+        if unknown:
+            parser.error(f"unknown scenarios: {', '.join(unknown)} (choose from {', '.join(available)})")
+
+        results = {}
+        print(f"{'scenario':<28} {'median ms':>10} {'p95 ms':>9} {'peak KiB':>9} {'graph':>6} {'async':>6} {'ddb':>5}")
+        for name in names:
+            result = results[name] = run_scenario(*available[name], args.iterations)
+            print(f"{name:<28} {result['median_ms']:>10.2f} {result['p95_ms']:>9.2f} {result['peak_kib']:>9.1f} "
+                  f"{result['graph_calls']:>6} {result['graph_async_calls']:>6} {result['ddb_calls']:>5}")
+        close_async_session()
+
+    if args.save_calls:
+        save_json(CALLS_PATH, {name: {calls: result[calls] for calls in CALLS} for name, result in results.items()})
+        print(f"\nSaved call counts to {CALLS_PATH}")
+    if args.save_baseline:
+        save_json(BASELINE_PATH, results)
+        print(f"\nSaved baseline to {BASELINE_PATH}")
+    if args.save_calls or args.save_baseline:
+        return 0
+
+    counts = load_json(CALLS_PATH)
+    failures = [reason for name, result in results.items() if name in counts
+                for reason in call_regressions(name, result, counts[name])]
+    missing = [name for name in results if name not in counts]
+    if missing:
+        print(f"\nNo committed call counts for {', '.join(missing)}; run with --save-calls")
+
+    baseline = load_json(BASELINE_PATH)
+    failures += [reason for name, result in results.items() if name in baseline
+                 for reason in regressions(name, result, baseline[name], args.max_regression)]
+    for failure in failures:
+        print(f"REGRESSION {failure}")
+    return 1 if failures else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Benchmark response serialization: the old per-handler json.dumps with a
+Decimal fallback against common.response.dumps, with orjson and with
+its stdlib fallback
+
+Usage: python3 benchmarks/serialization.py [--events N] [--messages N]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'lambdas'))
+from common import response
+
+def handle_decimal(obj):
+    """The fallback get_events used before the shared response module"""
+    if isinstance(obj, Decimal):
+        return float(obj)
+    raise TypeError
+
+def events_payload(n):
+    """A get_events body: decoded webhook entries plus DynamoDB numbers"""
+    events = [{
+        'id': '17841400000000000',
+        'time': Decimal(1700000000 + i),
+        'object': 'instagram',
+        'messaging': [{
+            'sender': {'id': str(1000000000000000 + i)},
+            'recipient': {'id': '17841400000000000'},
+            'timestamp': Decimal(1700000000000 + i),
+            'message': {'mid': f'aWdfZAG1faXRlbToxOklHTWVzc2FnZAUlE{i:012d}', 'text': f'Is this still available? #{i}'}
+        }]
+    } for i in range(n)]
+    return {'events': events, 'count': n, 'next_cursor': 'eyJ0cyI6MTcwMDAwMDAwMDAwMCwiaWRzIjpbXX0=', 'has_more': False}
+
+def messages_payload(n):
+    """A get_messages body"""
+    messages = [{
+        'id': f'aWdfZAG1faXRlbToxOklHTWVzc2FnZAUlE{i:012d}',
+        'created_time': f'2024-11-14T22:{i % 60:02d}:00+0000',
+        'from': {'id': str(1000000000000000 + i % 2), 'username': 'customer' if i % 2 else 'shop'},
+        'to': {'data': [{'id': str(1000000000000000 + (i + 1) % 2)}]},
+        'message': f'Message number {i} with a little more text to look like a real DM thread'
+    } for i in range(n)]
+    return {'messages': messages, 'conversation_id': 'aWdfZAG06MTpJR01lc3NhZA2VUaHJlYWQ', 'paging': {'after': None, 'has_more': False}}
+
+def timed(fn, repeat):
+    """Best wall time in ms over repeat runs"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--events', type=int, default=500)
+    parser.add_argument('--messages', type=int, default=500)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+    
+    orjson = response.orjson
+    payloads = [('get_events', events_payload(args.events)), ('get_messages', messages_payload(args.messages))]
+    print(f"orjson: {'available' if orjson else 'not installed'}")
+    print(f"{'payload':<14} {'json.dumps ms':>14} {'stdlib ms':>10} {'orjson ms':>10} {'bytes':>9} {'compact':>9}")
+    for name, payload in payloads:
+        baseline = timed(lambda: json.dumps(payload, default=handle_decimal), args.repeat)
+        response.orjson = None
+        stdlib = timed(lambda: response.dumps(payload), args.repeat)
+        response.orjson = orjson
+        fast = timed(lambda: response.dumps(payload), args.repeat) if orjson else float('nan')
+        old_size = len(json.dumps(payload, default=handle_decimal))
+        new_size = len(response.dumps(payload))
+        print(f"{name:<14} {baseline:>14.2f} {stdlib:>10.2f} {fast:>10.2f} {old_size:>9} {new_size:>9}")
+
+if __name__ == '__main__':
+    main()
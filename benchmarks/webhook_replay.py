@@ -0,0 +1,406 @@
+#!/usr/bin/env python3
+"""
+Record, synthesize and replay webhook traffic against webhook.lambda_handler
+and get_events, in-process against moto
+
+Usage:
+  python3 benchmarks/webhook_replay.py record --hours 24 -o recording.ndjson
+  python3 benchmarks/webhook_replay.py record --queue-file /tmp/instaai-webhook-queue.ndjson -o recording.ndjson
+  python3 benchmarks/webhook_replay.py synthesize --rate 5 --duration 60 -o synthetic.ndjson
+  python3 benchmarks/webhook_replay.py replay recording.ndjson --speed 10 [--ingest-mode queue]
+
+A recording is NDJSON, one {"offset_ms": ..., "body": <delivery>} per line.
+record reads deliveries from the events table (or a local file queue) and
+sanitizes them: IDs and usernames are replaced by stable pseudonyms, text
+by filler of the same length, and URLs by a placeholder. replay reports
+ingest throughput, DynamoDB write amplification and how long events take
+to become visible to a get_events cursor poll.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'lambdas'))
+
+# Keys whose values identify people, accounts or messages
+ID_KEYS = {'id', 'mid', 'user_id', 'comment_id', 'parent_id', 'media_id', 'post_id'}
+NAME_KEYS = {'username', 'name'}
+TEXT_KEYS = {'text', 'title', 'payload', 'ref'}
+
+def pseudonym(value, salt):
+    """Stable stand-in for an ID, numeric if the ID was."""
+    digest = hashlib.sha256(f"{salt}:{value}".encode()).hexdigest()
+    if str(value).isdigit():
+        return str(int(digest, 16))[:len(str(value))]
+    return f"anon-{digest[:16]}"
+
+def sanitize(value, salt, key=None):
+    """Copy of a delivery with IDs, names, text and URLs replaced."""
+    if isinstance(value, dict):
+        return {k: sanitize(v, salt, k) for k, v in value.items()}
+    if isinstance(value, list):
+        return [sanitize(v, salt, key) for v in value]
+    if not isinstance(value, (str, int)) or isinstance(value, bool):
+        return value
+    if key in ID_KEYS:
+        return pseudonym(value, salt) if isinstance(value, str) else int(pseudonym(value, salt))
+    if not isinstance(value, str):
+        return value
+    if key in NAME_KEYS:
+        return f"user_{pseudonym(value, salt)[-8:]}"
+    if value.startswith(('http://', 'https://')):
+        return 'https://example.invalid/redacted'
+    if key in TEXT_KEYS:
+        return 'x' * len(value)
+    return value
+
+def deliveries_from_table(table_name, since_ms):
+    """(timestamp, body) for events stored since since_ms, regrouped into deliveries.
+
+    Events split from one delivery share its receipt time (received_at) and account,
+    so they are put back together as one multi-entry delivery.
+    """
+    import boto3
+    from common.event_codec import decode_event_data
+
+    table = boto3.resource('dynamodb').Table(table_name)
+    scan_kwargs = {
+        'FilterExpression': '#ts >= :since',
+        'ExpressionAttributeNames': {'#ts': 'timestamp'},
+        'ExpressionAttributeValues': {':since': since_ms},
+        'ProjectionExpression': '#ts, received_at, user_id, event_data'
+    }
+    grouped = defaultdict(list)
+    while True:
+        response = table.scan(**scan_kwargs)
+        for item in response.get('Items', []):
+            try:
+                entry = decode_event_data(item.get('event_data'))
+            except ValueError:
+                continue
+            received_at = int(item.get('received_at', item['timestamp']))
+            grouped[(received_at, item.get('user_id', ''), entry.pop('object', 'instagram'))].append(entry)
+        last_key = response.get('LastEvaluatedKey')
+        if not last_key:
+            break
+        scan_kwargs['ExclusiveStartKey'] = last_key
+    return sorted(((ts, {'object': obj, 'entry': entries}) for (ts, _, obj), entries in grouped.items()),
+                  key=lambda delivery: delivery[0])
+
+def deliveries_from_queue_file(path):
+    """(timestamp, body) for the raw deliveries waiting in a file queue (left in place)."""
+    from common.event_queue import decode_delivery
+    with open(path) as f:
+        return sorted(((ts, body) for body, ts in (decode_delivery(line) for line in f if line.strip())),
+                      key=lambda delivery: delivery[0])
+
+def write_recording(path, deliveries):
+    """Write (timestamp, body) pairs as a recording, offsets relative to the first."""
+    start = deliveries[0][0] if deliveries else 0
+    with open(path, 'w') as f:
+        for timestamp, body in deliveries:
+            f.write(json.dumps({'offset_ms': timestamp - start, 'body': body}) + '\n')
+
+def read_recording(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def record(args):
+    if args.queue_file:
+        deliveries = deliveries_from_queue_file(args.queue_file)
+    else:
+        since_ms = int((time.time() - args.hours * 3600) * 1000)
+        deliveries = deliveries_from_table(args.table, since_ms)
+    salt = args.salt or os.urandom(8).hex()
+    write_recording(args.output, [(ts, sanitize(body, salt)) for ts, body in deliveries])
+    print(f"Recorded {len(deliveries)} deliveries to {args.output}")
+
+class Synthesizer:
+    """Webhook deliveries in the shapes Meta sends, including the ones that
+    batch several entries or carry no message: reactions, reads and comment
+    changes."""
+
+    # kind -> relative weight
+    MIX = {'message': 45, 'echo': 10, 'reaction': 10, 'read': 10, 'batch': 10, 'comment': 10, 'edit': 5}
+
+    def __init__(self, accounts, seed):
+        self.random = random.Random(seed)
+        self.accounts = [str(17841400000000000 + i) for i in range(accounts)]
+        self.sequence = 0
+        # account -> recent mids, targets for reactions and reads
+        self.recent = defaultdict(list)
+
+    def delivery(self, now_ms):
+        kind = self.random.choices(list(self.MIX), weights=list(self.MIX.values()))[0]
+        account = self.random.choice(self.accounts)
+        if kind == 'comment':
+            return {'object': 'instagram', 'entry': [self.comment_entry(account, now_ms)]}
+        if kind == 'batch':
+            entries = [self.messaging_entry(self.random.choice(self.accounts), 'message', now_ms)
+                       for _ in range(self.random.randint(2, 5))]
+            return {'object': 'instagram', 'entry': entries}
+        return {'object': 'instagram', 'entry': [self.messaging_entry(account, kind, now_ms)]}
+
+    def next_mid(self, account):
+        self.sequence += 1
+        mid = f"aWdfZAG1faXRlbToxOklHTWVzc2FnZAUlEOj{self.sequence:012d}"
+        self.recent[account] = (self.recent[account] + [mid])[-50:]
+        return mid
+
+    def target_mid(self, account):
+        return self.random.choice(self.recent[account]) if self.recent[account] else self.next_mid(account)
+
+    def messaging_entry(self, account, kind, now_ms):
+        peer = str(900000000000000 + self.random.randrange(1000))
+        item = {'sender': {'id': peer}, 'recipient': {'id': account}, 'timestamp': now_ms}
+        if kind == 'message':
+            item['message'] = {'mid': self.next_mid(account), 'text': 'x' * self.random.randint(5, 200)}
+        elif kind == 'echo':
+            item = {'sender': {'id': account}, 'recipient': {'id': peer}, 'timestamp': now_ms,
+                    'message': {'mid': self.next_mid(account), 'text': 'x' * self.random.randint(5, 200), 'is_echo': True}}
+        elif kind == 'reaction':
+            item['reaction'] = {'mid': self.target_mid(account), 'action': 'react', 'reaction': 'love', 'emoji': '❤'}
+        elif kind == 'read':
+            item['read'] = {'mid': self.target_mid(account)}
+        elif kind == 'edit':
+            item['message_edit'] = {'mid': self.target_mid(account), 'text': 'x' * 20, 'num_edit': 1}
+        return {'id': account, 'time': now_ms // 1000, 'messaging': [item]}
+
+    def comment_entry(self, account, now_ms):
+        self.sequence += 1
+        return {'id': account, 'time': now_ms // 1000, 'changes': [{
+            'field': 'comments',
+            'value': {
+                'from': {'id': str(900000000000000 + self.random.randrange(1000)), 'username': 'commenter'},
+                'media': {'id': str(18000000000000000 + self.random.randrange(100)), 'media_product_type': 'FEED'},
+                'id': str(17900000000000000 + self.sequence),
+                'text': 'x' * self.random.randint(5, 100)
+            }
+        }]}
+
+def synthesize(args):
+    synthesizer = Synthesizer(args.accounts, args.seed)
+    start_ms = int(time.time() * 1000)
+    offset = 0.0
+    deliveries = []
+    while offset < args.duration:
+        timestamp = start_ms + int(offset * 1000)
+        deliveries.append((timestamp, synthesizer.delivery(timestamp)))
+        # Poisson arrivals
+        offset += synthesizer.random.expovariate(args.rate)
+    write_recording(args.output, deliveries)
+    print(f"Wrote {len(deliveries)} synthetic deliveries ({args.rate}/s for {args.duration}s) to {args.output}")
+
+def percentiles(values):
+    if not values:
+        return 'n/a'
+    values = sorted(values)
+    pick = lambda pct: values[min(len(values) - 1, int(len(values) * pct / 100))]
+    return f"p50 {pick(50):.1f}  p95 {pick(95):.1f}  p99 {pick(99):.1f}  max {values[-1]:.1f}"
+
+class CapacityCounter:
+    """Totals DynamoDB calls and consumed capacity by operation kind."""
+
+    WRITES = {'PutItem', 'UpdateItem', 'DeleteItem', 'BatchWriteItem', 'TransactWriteItems'}
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.totals = defaultdict(float)
+
+    def __call__(self, parsed, model, **kwargs):
+        consumed = parsed.get('ConsumedCapacity') or []
+        if isinstance(consumed, dict):
+            consumed = [consumed]
+        kind = 'write' if model.name in self.WRITES else 'read'
+        with self.lock:
+            self.totals[f"{kind}_calls"] += 1
+            self.totals[f"{kind}_units"] += sum(c.get('CapacityUnits', 0) for c in consumed)
+
+class VisibilityProbe:
+    """Polls get_events with a cursor, like the dashboard, and times how long
+    sampled messages take to show up after their delivery was sent."""
+
+    def __init__(self, get_events, poll_interval):
+        self.get_events = get_events
+        self.poll_interval = poll_interval
+        self.lock = threading.Lock()
+        self.pending = {}  # mid -> (account, sent_at)
+        self.cursors = {}
+        self.visible_ms = []
+        self.poll_ms = []
+        self.stopped = threading.Event()
+
+    def watch(self, body, sent_at):
+        with self.lock:
+            for entry in body.get('entry') or []:
+                for item in entry.get('messaging') or []:
+                    mid = (item.get('message') or {}).get('mid')
+                    if mid and entry.get('id'):
+                        self.pending[mid] = (str(entry['id']), sent_at)
+
+    def poll(self, account):
+        params = {'user_id': account, 'limit': '500'}
+        if self.cursors.get(account):
+            params['cursor'] = self.cursors[account]
+        start = time.perf_counter()
+        response = self.get_events({'httpMethod': 'GET', 'queryStringParameters': params}, None)
+        found_at = time.perf_counter()
+        self.poll_ms.append((found_at - start) * 1000)
+        if response['statusCode'] != 200:
+            return
+        data = json.loads(response['body'])
+        self.cursors[account] = data.get('next_cursor') or self.cursors.get(account)
+        with self.lock:
+            for event in data['events']:
+                for item in event.get('messaging') or []:
+                    mid = (item.get('message') or {}).get('mid')
+                    if mid in self.pending:
+                        self.visible_ms.append((found_at - self.pending.pop(mid)[1]) * 1000)
+
+    def run(self):
+        while not self.stopped.is_set():
+            with self.lock:
+                accounts = {account for account, _ in self.pending.values()}
+            for account in accounts:
+                self.poll(account)
+            time.sleep(self.poll_interval)
+
+def replay(args):
+    recording = read_recording(args.recording)
+    if not recording:
+        sys.exit(f"{args.recording} has no deliveries")
+
+    # Must be set before the handlers are imported
+    os.environ.update({
+        'AWS_DEFAULT_REGION': 'us-east-1',
+        'AWS_ACCESS_KEY_ID': 'testing',
+        'AWS_SECRET_ACCESS_KEY': 'testing',
+        'METRICS_ENABLED': 'false',
+        'LOG_LEVEL': 'ERROR',
+        'LOG_SAMPLE_RATE': '0',
+        'INGEST_MODE': args.ingest_mode,
+        'EVENTS_QUEUE_BACKEND': 'memory',
+    })
+    from handlers import create_tables
+    from moto import mock_aws
+
+    with mock_aws():
+        create_tables()
+        import get_events
+        import webhook
+        import webhook_consumer
+        from common.aws import get_client, get_table
+
+        capacity = CapacityCounter()
+        for client in (get_client('dynamodb'), get_table(get_events.EVENTS_TABLE_NAME).meta.client):
+            client.meta.events.register('after-call.dynamodb.*', capacity)
+
+        probe = VisibilityProbe(get_events.lambda_handler, args.poll_interval)
+        probe_thread = threading.Thread(target=probe.run, daemon=True)
+        probe_thread.start()
+
+        consumer_stop = threading.Event()
+        def consume():
+            # Stands in for the SQS event source mapping's batching window
+            while not consumer_stop.is_set():
+                webhook_consumer.drain_local_queue()
+                consumer_stop.wait(args.drain_interval)
+        consumer_thread = threading.Thread(target=consume, daemon=True)
+        if args.ingest_mode == 'queue':
+            consumer_thread.start()
+
+        webhook_ms, lateness_ms = [], []
+        received_bytes = 0
+        def deliver(index, body, scheduled_at):
+            started = time.perf_counter()
+            lateness_ms.append((started - scheduled_at) * 1000)
+            if index % args.probe_every == 0:
+                probe.watch(body, started)
+            response = webhook.lambda_handler({'httpMethod': 'POST', 'body': json.dumps(body)}, None)
+            webhook_ms.append((time.perf_counter() - started) * 1000)
+            if response['statusCode'] != 200:
+                print(f"webhook returned {response['statusCode']}: {response['body']}", file=sys.stderr)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            for index, line in enumerate(recording):
+                scheduled_at = start + line['offset_ms'] / 1000 / args.speed
+                delay = scheduled_at - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                received_bytes += len(json.dumps(line['body']))
+                pool.submit(deliver, index, line['body'], scheduled_at)
+        acked_at = time.perf_counter()
+
+        if args.ingest_mode == 'queue':
+            consumer_stop.set()
+            consumer_thread.join()
+            webhook_consumer.drain_local_queue()
+        stored_at = time.perf_counter()
+
+        deadline = time.time() + args.visibility_timeout
+        while probe.pending and time.time() < deadline:
+            time.sleep(args.poll_interval)
+        probe.stopped.set()
+        probe_thread.join()
+
+        stored = get_client('dynamodb').scan(TableName='InstaAI-WebhookEvents', Select='COUNT')['Count']
+
+    offered = recording[-1]['offset_ms'] / 1000 / args.speed
+    elapsed = stored_at - start
+    events = max(stored, 1)
+    print(f"Replayed {len(recording)} deliveries over {offered:.1f}s (x{args.speed}, {args.ingest_mode} ingest, {args.concurrency} workers)")
+    print(f"  offered rate           {len(recording) / max(offered, 1e-9):.1f} deliveries/s")
+    print(f"  ingest throughput      {stored / elapsed:.1f} events/s stored ({stored} events in {elapsed:.2f}s, acked in {acked_at - start:.2f}s)")
+    print(f"  webhook latency ms     {percentiles(webhook_ms)}")
+    print(f"  dispatch lateness ms   {percentiles(lateness_ms)}")
+    print(f"  write calls per event  {capacity.totals['write_calls'] / events:.2f}")
+    print(f"  write units per event  {capacity.totals['write_units'] / events:.2f} "
+          f"({capacity.totals['write_units'] / max(received_bytes / 1024, 1e-9):.2f} per KiB received)")
+    print(f"  get_events poll ms     {percentiles(probe.poll_ms)}")
+    print(f"  visible after ms       {percentiles(probe.visible_ms)}")
+    if probe.pending:
+        print(f"  never visible          {len(probe.pending)} sampled messages within {args.visibility_timeout}s")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    parser_record = commands.add_parser('record', help='capture sanitized deliveries')
+    parser_record.add_argument('-o', '--output', required=True)
+    parser_record.add_argument('--table', default=os.environ.get('EVENTS_TABLE_NAME', 'InstaAI-WebhookEvents'))
+    parser_record.add_argument('--hours', type=float, default=1, help='how far back to read the table')
+    parser_record.add_argument('--queue-file', help='read raw deliveries from a file queue instead')
+    parser_record.add_argument('--salt', help='pseudonym salt, to keep IDs stable across recordings')
+
+    parser_synth = commands.add_parser('synthesize', help='generate deliveries')
+    parser_synth.add_argument('-o', '--output', required=True)
+    parser_synth.add_argument('--rate', type=float, default=5, help='deliveries per second')
+    parser_synth.add_argument('--duration', type=float, default=60, help='seconds')
+    parser_synth.add_argument('--accounts', type=int, default=10)
+    parser_synth.add_argument('--seed', type=int, default=1)
+
+    parser_replay = commands.add_parser('replay', help='replay a recording')
+    parser_replay.add_argument('recording')
+    parser_replay.add_argument('--speed', type=float, default=1, help='multiple of the recorded rate')
+    parser_replay.add_argument('--concurrency', type=int, default=8, help='concurrent webhook invocations')
+    parser_replay.add_argument('--ingest-mode', choices=('sync', 'queue'), default='sync')
+    parser_replay.add_argument('--drain-interval', type=float, default=1.0, help='seconds between consumer batches (queue mode)')
+    parser_replay.add_argument('--probe-every', type=int, default=10, help='time visibility of every Nth delivery')
+    parser_replay.add_argument('--poll-interval', type=float, default=0.1, help='seconds between get_events polls')
+    parser_replay.add_argument('--visibility-timeout', type=float, default=10)
+
+    args = parser.parse_args()
+    {'record': record, 'synthesize': synthesize, 'replay': replay}[args.command](args)
+
+if __name__ == '__main__':
+    main()
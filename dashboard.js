@@ -19,8 +19,16 @@ document.addEventListener('DOMContentLoaded', function() {
         currentConversationId: null,
         currentRecipientId: null,
         events: [],
+        eventsCursor: null,
         pollingIntervalId: null
     };
+    
+    // Bumped each time polling starts, so older long-poll loops stop
+    let eventsPollGeneration = 0;
+    
+    // get_events holds a cursor poll open until new events arrive or this many seconds pass
+    const LONG_POLL_WAIT_SECONDS = 20;
+    const EVENTS_RETRY_MS = 30000;
 
     // Initialize
     initializeApp();
@@ -406,8 +414,9 @@ document.addEventListener('DOMContentLoaded', function() {
                 
                 debugLog('Events fetched: ' + JSON.stringify(data).substring(0, 200) + '...', 'success');
                 
-                // Store events in state
+                // Store events and the cursor for incremental polls
                 state.events = data.events || [];
+                state.eventsCursor = data.next_cursor || null;
                 
                 // Display events
                 displayEvents(state.events);
@@ -419,6 +428,56 @@ document.addEventListener('DOMContentLoaded', function() {
             });
     }
     
+    // Fetch only events newer than the last cursor and merge them in,
+    // waiting up to wait seconds for them; resolves to the number received
+    function pollEvents(wait = 0) {
+        if (!state.eventsCursor) {
+            fetchEvents();
+            return Promise.resolve(0);
+        }
+        
+        const waitParam = wait > 0 ? `&wait=${wait}` : '';
+        return fetch(`${LAMBDA_APIS.getEvents}?user_id=${state.userId}&cursor=${encodeURIComponent(state.eventsCursor)}${waitParam}`)
+            .then(response => response.json())
+            .then(data => {
+                if (data.error) {
+                    throw new Error(data.error.message || 'Error polling events');
+                }
+                
+                state.eventsCursor = data.next_cursor || state.eventsCursor;
+                const newEvents = data.events || [];
+                if (newEvents.length > 0) {
+                    debugLog(`Received ${newEvents.length} new events`, 'success');
+                    state.events = newEvents.concat(state.events).slice(0, 200);
+                    displayEvents(state.events);
+                }
+                return newEvents.length;
+            })
+            .catch(error => {
+                debugLog('Error polling events: ' + error.message, 'error');
+                return 0;
+            });
+    }
+    
+    // Keep one long poll open while connected
+    function longPollEvents(generation) {
+        if (!state.isConnected || generation !== eventsPollGeneration) {
+            return;
+        }
+        if (document.getElementById('events-content').style.display === 'none') {
+            setTimeout(() => longPollEvents(generation), EVENTS_RETRY_MS);
+            return;
+        }
+        
+        const started = Date.now();
+        pollEvents(LONG_POLL_WAIT_SECONDS).then(received => {
+            // An empty reply that came back at once was not held (error or
+            // no cursor yet), so back off instead of spinning
+            const delay = received === 0 && Date.now() - started < 1000 ? EVENTS_RETRY_MS : 0;
+            setTimeout(() => longPollEvents(generation), delay);
+        });
+    }
+    
     // Display events in the UI
     function displayEvents(events) {
         const eventsList = document.getElementById('events-list');
@@ -468,14 +527,13 @@ document.addEventListener('DOMContentLoaded', function() {
             clearInterval(state.pollingIntervalId);
         }
         
+        // Events arrive over a long poll
+        eventsPollGeneration += 1;
+        longPollEvents(eventsPollGeneration);
+        
         // Set up new polling interval
         state.pollingIntervalId = setInterval(() => {
-            // Only poll if we're connected and on the events tab
-            if (state.isConnected && document.getElementById('events-content').style.display !== 'none') {
-                fetchEvents();
-            }
-            
-            // Also check for new messages if in a conversation
+            // Check for new messages if in a conversation
             if (state.isConnected && state.currentConversationId) {
                 fetchMessages(state.currentConversationId);
             }
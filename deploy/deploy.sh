@@ -27,9 +27,23 @@ cd scripts
 ./2_deploy_lambdas.sh
 cd ..
 
-# Step 3: Create API Gateway
+# Step 3: Create the webhook queue
 echo ""
-echo "Step 3: Creating API Gateway..."
+echo "Step 3: Creating webhook queue..."
+cd scripts
+./6_create_webhook_queue.sh
+cd ..
+
+# Step 4: Connect the events archive
+echo ""
+echo "Step 4: Connecting events archive..."
+cd scripts
+./7_connect_event_archive.sh
+cd ..
+
+# Step 5: Create API Gateway
+echo ""
+echo "Step 5: Creating API Gateway..."
 cd scripts
 ./3_create_api_gateway.sh
 cd ..
@@ -5,6 +5,36 @@ source ../config.sh
 
 echo "Creating DynamoDB tables..."
 
+# Add a global secondary index to an existing table if it is missing.
+# Usage: ensure_index TABLE INDEX HASH_KEY HASH_TYPE RANGE_KEY RANGE_TYPE
+# Returns 0 if the index was added, 1 if it already existed.
+ensure_index() {
+    local TABLE=$1
+    local INDEX=$2
+    local HASH_KEY=$3
+    local HASH_TYPE=$4
+    local RANGE_KEY=$5
+    local RANGE_TYPE=$6
+    
+    if aws dynamodb describe-table --table-name ${TABLE} --region ${AWS_REGION} \
+            --query "Table.GlobalSecondaryIndexes[?IndexName=='${INDEX}'].IndexName" \
+            --output text 2>/dev/null | grep -q "${INDEX}"; then
+        return 1
+    fi
+    
+    echo "Adding ${INDEX} to ${TABLE}..."
+    aws dynamodb wait table-exists --table-name ${TABLE} --region ${AWS_REGION}
+    aws dynamodb update-table \
+        --table-name ${TABLE} \
+        --attribute-definitions \
+            AttributeName=${HASH_KEY},AttributeType=${HASH_TYPE} \
+            AttributeName=${RANGE_KEY},AttributeType=${RANGE_TYPE} \
+        --global-secondary-index-updates \
+            "[{\"Create\":{\"IndexName\":\"${INDEX}\",\"KeySchema\":[{\"AttributeName\":\"${HASH_KEY}\",\"KeyType\":\"HASH\"},{\"AttributeName\":\"${RANGE_KEY}\",\"KeyType\":\"RANGE\"}],\"Projection\":{\"ProjectionType\":\"ALL\"}}}]" \
+        --region ${AWS_REGION} || echo "Index may already be building"
+    return 0
+}
+
 # Create InstagramTokens table
 echo "Creating ${TOKENS_TABLE} table..."
 aws dynamodb create-table \
@@ -19,24 +49,77 @@ aws dynamodb create-table \
 
 # Create InstagramWebhookEvents table
 echo "Creating ${EVENTS_TABLE} table..."
+# The user_id/timestamp index lets get_events query one account's recent
+# events instead of scanning the whole table.
+EVENTS_USER_INDEX=${EVENTS_USER_INDEX:-user_id-timestamp-index}
 aws dynamodb create-table \
     --table-name ${EVENTS_TABLE} \
     --attribute-definitions \
         AttributeName=event_id,AttributeType=S \
+        AttributeName=user_id,AttributeType=S \
+        AttributeName=timestamp,AttributeType=N \
     --key-schema \
         AttributeName=event_id,KeyType=HASH \
+    --global-secondary-indexes \
+        "IndexName=${EVENTS_USER_INDEX},KeySchema=[{AttributeName=user_id,KeyType=HASH},{AttributeName=timestamp,KeyType=RANGE}],Projection={ProjectionType=ALL}" \
+    --stream-specification StreamEnabled=true,StreamViewType=OLD_IMAGE \
     --billing-mode PAY_PER_REQUEST \
     --region ${AWS_REGION} \
     --tags Key=Project,Value=InstaAI Key=Environment,Value=Production || echo "Table may already exist"
 
+# Add the index to an events table created before it existed
+if ensure_index ${EVENTS_TABLE} ${EVENTS_USER_INDEX} user_id S timestamp N; then
+    echo "Run backfill_event_user_ids.py once the index is ACTIVE to index older events."
+fi
+
+# Expire events after EVENTS_RETENTION_DAYS (expires_at is set by the
+# webhook). archive_events reads the deleted items from the table's stream
+# and copies them to the archive.
+aws dynamodb wait table-exists --table-name ${EVENTS_TABLE} --region ${AWS_REGION}
+if [ "$(aws dynamodb describe-table --table-name ${EVENTS_TABLE} --region ${AWS_REGION} \
+        --query 'Table.StreamSpecification.StreamEnabled' --output text)" != "True" ]; then
+    echo "Enabling the ${EVENTS_TABLE} stream..."
+    aws dynamodb update-table \
+        --table-name ${EVENTS_TABLE} \
+        --stream-specification StreamEnabled=true,StreamViewType=OLD_IMAGE \
+        --region ${AWS_REGION} > /dev/null
+    aws dynamodb wait table-exists --table-name ${EVENTS_TABLE} --region ${AWS_REGION}
+fi
+aws dynamodb update-time-to-live \
+    --table-name ${EVENTS_TABLE} \
+    --time-to-live-specification Enabled=true,AttributeName=expires_at \
+    --region ${AWS_REGION} > /dev/null || echo "TTL may already be enabled"
+
 # Create InstagramMessages table
 echo "Creating ${MESSAGES_TABLE} table..."
+# The conversation_id/created_time index lets get_messages serve history
+# from the table and only ask Graph for newer messages.
+MESSAGES_CONVERSATION_INDEX=${MESSAGES_CONVERSATION_INDEX:-conversation_id-created_time-index}
 aws dynamodb create-table \
     --table-name ${MESSAGES_TABLE} \
     --attribute-definitions \
         AttributeName=message_id,AttributeType=S \
+        AttributeName=conversation_id,AttributeType=S \
+        AttributeName=created_time,AttributeType=S \
     --key-schema \
         AttributeName=message_id,KeyType=HASH \
+    --global-secondary-indexes \
+        "IndexName=${MESSAGES_CONVERSATION_INDEX},KeySchema=[{AttributeName=conversation_id,KeyType=HASH},{AttributeName=created_time,KeyType=RANGE}],Projection={ProjectionType=ALL}" \
+    --billing-mode PAY_PER_REQUEST \
+    --region ${AWS_REGION} \
+    --tags Key=Project,Value=InstaAI Key=Environment,Value=Production || echo "Table may already exist"
+
+# Add the index to a messages table created before it existed
+ensure_index ${MESSAGES_TABLE} ${MESSAGES_CONVERSATION_INDEX} conversation_id S created_time S || true
+
+# Create InstagramConversations table (cached conversation lists)
+echo "Creating ${CONVERSATIONS_TABLE} table..."
+aws dynamodb create-table \
+    --table-name ${CONVERSATIONS_TABLE} \
+    --attribute-definitions \
+        AttributeName=user_id,AttributeType=S \
+    --key-schema \
+        AttributeName=user_id,KeyType=HASH \
     --billing-mode PAY_PER_REQUEST \
     --region ${AWS_REGION} \
     --tags Key=Project,Value=InstaAI Key=Environment,Value=Production || echo "Table may already exist"
@@ -45,6 +128,7 @@ echo "Waiting for tables to be active..."
 aws dynamodb wait table-exists --table-name ${TOKENS_TABLE} --region ${AWS_REGION}
 aws dynamodb wait table-exists --table-name ${EVENTS_TABLE} --region ${AWS_REGION}
 aws dynamodb wait table-exists --table-name ${MESSAGES_TABLE} --region ${AWS_REGION}
+aws dynamodb wait table-exists --table-name ${CONVERSATIONS_TABLE} --region ${AWS_REGION}
 
 echo "DynamoDB tables created successfully!"
 
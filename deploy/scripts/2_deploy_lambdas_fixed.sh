@@ -22,11 +22,30 @@ deploy_lambda() {
     # Copy Lambda function
     cp ../../lambdas/${LAMBDA_FILE} ${FUNCTION_NAME}/lambda_function.py
     
+    # Copy only the shared helpers this handler imports, so packages stay
+    # small and don't pull in dependencies they never use
+    mkdir -p ${FUNCTION_NAME}/common
+    cp ../../lambdas/common/__init__.py ${FUNCTION_NAME}/common/
+    for MODULE in $(python3 ../scripts/common_modules.py ../../lambdas/${LAMBDA_FILE}); do
+        cp ../../lambdas/common/${MODULE} ${FUNCTION_NAME}/common/
+    done
+    
     # Install dependencies (boto3 is already available in Lambda runtime)
     # Only install requests if needed
-    if grep -q "import requests" ${FUNCTION_NAME}/lambda_function.py; then
+    if grep -rq "import requests" --include="*.py" ${FUNCTION_NAME}; then
         pip3 install requests -t ${FUNCTION_NAME} --quiet 2>/dev/null || true
     fi
+    # aiohttp and orjson ship compiled extensions, so fetch the Lambda
+    # (manylinux) builds rather than ones for this machine;
+    # common/response.py falls back to the stdlib json if orjson is missing
+    if grep -rq "import aiohttp" --include="*.py" ${FUNCTION_NAME}; then
+        pip3 install aiohttp -t ${FUNCTION_NAME} --platform manylinux2014_x86_64 \
+            --only-binary=:all: --python-version 3.11 --quiet 2>/dev/null || true
+    fi
+    if grep -rq "import orjson" --include="*.py" ${FUNCTION_NAME}; then
+        pip3 install orjson -t ${FUNCTION_NAME} --platform manylinux2014_x86_64 \
+            --only-binary=:all: --python-version 3.11 --quiet 2>/dev/null || true
+    fi
     
     # Create zip file
     cd ${FUNCTION_NAME}
@@ -106,17 +125,21 @@ deploy_lambda ${EXCHANGE_TOKEN_FUNCTION} "lambda_function.lambda_handler" "excha
 
 deploy_lambda ${STORE_TOKEN_FUNCTION} "lambda_function.lambda_handler" "store_token.py" '{"TOKEN_TABLE_NAME":"'${TOKENS_TABLE}'"}'
 
-deploy_lambda ${GET_CONVERSATIONS_FUNCTION} "lambda_function.lambda_handler" "get_conversations.py" '{"TOKEN_TABLE_NAME":"'${TOKENS_TABLE}'"}'
+deploy_lambda ${GET_CONVERSATIONS_FUNCTION} "lambda_function.lambda_handler" "get_conversations.py" '{"TOKEN_TABLE_NAME":"'${TOKENS_TABLE}'","CONVERSATIONS_TABLE_NAME":"'${CONVERSATIONS_TABLE}'"}'
 
-deploy_lambda ${GET_MESSAGES_FUNCTION} "lambda_function.lambda_handler" "get_messages.py" '{"TOKEN_TABLE_NAME":"'${TOKENS_TABLE}'","MESSAGES_TABLE_NAME":"'${MESSAGES_TABLE}'"}'
+deploy_lambda ${GET_MESSAGES_FUNCTION} "lambda_function.lambda_handler" "get_messages.py" '{"TOKEN_TABLE_NAME":"'${TOKENS_TABLE}'","MESSAGES_TABLE_NAME":"'${MESSAGES_TABLE}'","CONVERSATIONS_TABLE_NAME":"'${CONVERSATIONS_TABLE}'"}'
 
 deploy_lambda ${SEND_MESSAGE_FUNCTION} "lambda_function.lambda_handler" "send_message.py" '{"TOKEN_TABLE_NAME":"'${TOKENS_TABLE}'"}'
 
-deploy_lambda ${GET_EVENTS_FUNCTION} "lambda_function.lambda_handler" "get_events.py" '{"EVENTS_TABLE_NAME":"'${EVENTS_TABLE}'"}'
+deploy_lambda ${GET_EVENTS_FUNCTION} "lambda_function.lambda_handler" "get_events.py" '{"EVENTS_TABLE_NAME":"'${EVENTS_TABLE}'","EVENTS_ARCHIVE_BUCKET":"'${EVENTS_ARCHIVE_BUCKET}'","CONVERSATIONS_TABLE_NAME":"'${CONVERSATIONS_TABLE}'"}'
 
 deploy_lambda ${DELETE_USER_FUNCTION} "lambda_function.lambda_handler" "delete_user.py" '{"TOKEN_TABLE_NAME":"'${TOKENS_TABLE}'"}'
 
-deploy_lambda ${WEBHOOK_FUNCTION} "lambda_function.lambda_handler" "webhook.py" '{"VERIFY_TOKEN":"'${VERIFY_TOKEN}'","EVENTS_TABLE_NAME":"'${EVENTS_TABLE}'"}'
+deploy_lambda ${WEBHOOK_FUNCTION} "lambda_function.lambda_handler" "webhook.py" '{"VERIFY_TOKEN":"'${VERIFY_TOKEN}'","EVENTS_TABLE_NAME":"'${EVENTS_TABLE}'","CONVERSATIONS_TABLE_NAME":"'${CONVERSATIONS_TABLE}'"}'
+
+deploy_lambda ${WEBHOOK_CONSUMER_FUNCTION} "lambda_function.lambda_handler" "webhook_consumer.py" '{"EVENTS_TABLE_NAME":"'${EVENTS_TABLE}'","CONVERSATIONS_TABLE_NAME":"'${CONVERSATIONS_TABLE}'"}'
+
+deploy_lambda ${ARCHIVE_EVENTS_FUNCTION} "lambda_function.lambda_handler" "archive_events.py" '{"EVENTS_ARCHIVE_BUCKET":"'${EVENTS_ARCHIVE_BUCKET}'"}'
 
 echo "Lambda functions deployed successfully!"
 
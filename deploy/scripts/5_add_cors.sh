@@ -69,7 +69,7 @@ add_cors_to_endpoint() {
         --resource-id ${RESOURCE_ID} \
         --http-method OPTIONS \
         --status-code 200 \
-        --response-parameters '{"method.response.header.Access-Control-Allow-Headers":"'\''Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token'\''","method.response.header.Access-Control-Allow-Methods":"'\''GET,POST,OPTIONS'\''","method.response.header.Access-Control-Allow-Origin":"'\''*'\''"}' \
+        --response-parameters '{"method.response.header.Access-Control-Allow-Headers":"'\''Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token,If-None-Match'\''","method.response.header.Access-Control-Allow-Methods":"'\''GET,POST,OPTIONS'\''","method.response.header.Access-Control-Allow-Origin":"'\''*'\''"}' \
         --region ${AWS_REGION} 2>&1 | grep -v "already exists" || true
     
     echo "  ✓ CORS configured for ${METHOD} ${PATH_NAME}"
@@ -0,0 +1,58 @@
+#!/bin/bash
+
+# Load configuration
+source ../config.sh
+
+# Webhook batching: the consumer receives up to BATCH_SIZE deliveries,
+# waiting at most BATCH_WINDOW seconds to fill a batch
+BATCH_SIZE=${WEBHOOK_BATCH_SIZE:-100}
+BATCH_WINDOW=${WEBHOOK_BATCH_WINDOW:-2}
+
+echo "Creating webhook queue ${WEBHOOK_QUEUE}..."
+
+QUEUE_URL=$(aws sqs create-queue \
+    --queue-name ${WEBHOOK_QUEUE} \
+    --attributes VisibilityTimeout=60,MessageRetentionPeriod=345600 \
+    --region ${AWS_REGION} \
+    --query 'QueueUrl' --output text)
+
+QUEUE_ARN=$(aws sqs get-queue-attributes \
+    --queue-url ${QUEUE_URL} \
+    --attribute-names QueueArn \
+    --region ${AWS_REGION} \
+    --query 'Attributes.QueueArn' --output text)
+
+echo "Queue: ${QUEUE_URL}"
+
+# Connect the queue to the consumer Lambda
+MAPPING_UUID=$(aws lambda list-event-source-mappings \
+    --function-name ${WEBHOOK_CONSUMER_FUNCTION} \
+    --event-source-arn ${QUEUE_ARN} \
+    --region ${AWS_REGION} \
+    --query 'EventSourceMappings[0].UUID' --output text)
+
+if [ -z "$MAPPING_UUID" ] || [ "$MAPPING_UUID" == "None" ]; then
+    echo "Creating event source mapping..."
+    aws lambda create-event-source-mapping \
+        --function-name ${WEBHOOK_CONSUMER_FUNCTION} \
+        --event-source-arn ${QUEUE_ARN} \
+        --batch-size ${BATCH_SIZE} \
+        --maximum-batching-window-in-seconds ${BATCH_WINDOW} \
+        --region ${AWS_REGION} > /dev/null
+else
+    echo "Updating event source mapping..."
+    aws lambda update-event-source-mapping \
+        --uuid ${MAPPING_UUID} \
+        --batch-size ${BATCH_SIZE} \
+        --maximum-batching-window-in-seconds ${BATCH_WINDOW} \
+        --region ${AWS_REGION} > /dev/null
+fi
+
+# Switch the webhook to ack-first ingestion
+echo "Switching ${WEBHOOK_FUNCTION} to queue mode..."
+aws lambda update-function-configuration \
+    --function-name ${WEBHOOK_FUNCTION} \
+    --environment "Variables={VERIFY_TOKEN=${VERIFY_TOKEN},EVENTS_TABLE_NAME=${EVENTS_TABLE},CONVERSATIONS_TABLE_NAME=${CONVERSATIONS_TABLE},INGEST_MODE=queue,EVENTS_QUEUE_URL=${QUEUE_URL}}" \
+    --region ${AWS_REGION} > /dev/null
+
+echo "Webhook queue created successfully!"
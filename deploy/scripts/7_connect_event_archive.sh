@@ -0,0 +1,75 @@
+#!/bin/bash
+
+# Load configuration
+source ../config.sh
+
+# Archive batching: archive_events receives up to BATCH_SIZE deleted events,
+# waiting at most BATCH_WINDOW seconds to fill a batch (fewer archive writes)
+BATCH_SIZE=${ARCHIVE_BATCH_SIZE:-1000}
+BATCH_WINDOW=${ARCHIVE_BATCH_WINDOW:-60}
+OLD_RULE_NAME="${PREFIX}ArchiveEventsSchedule"
+
+echo "Creating archive bucket ${EVENTS_ARCHIVE_BUCKET}..."
+if [ "${AWS_REGION}" == "us-east-1" ]; then
+    aws s3api create-bucket --bucket ${EVENTS_ARCHIVE_BUCKET} --region ${AWS_REGION} > /dev/null || echo "Bucket may already exist"
+else
+    aws s3api create-bucket --bucket ${EVENTS_ARCHIVE_BUCKET} --region ${AWS_REGION} \
+        --create-bucket-configuration LocationConstraint=${AWS_REGION} > /dev/null || echo "Bucket may already exist"
+fi
+
+# The archiver used to scan the events table every hour
+if aws events describe-rule --name ${OLD_RULE_NAME} --region ${AWS_REGION} > /dev/null 2>&1; then
+    echo "Removing the hourly archive schedule..."
+    aws events remove-targets --rule ${OLD_RULE_NAME} --ids 1 --region ${AWS_REGION} > /dev/null
+    aws events delete-rule --name ${OLD_RULE_NAME} --region ${AWS_REGION}
+fi
+
+# The events table stream (OLD_IMAGE, see 1_create_dynamodb_tables.sh)
+STREAM_ARN=$(aws dynamodb describe-table \
+    --table-name ${EVENTS_TABLE} \
+    --region ${AWS_REGION} \
+    --query 'Table.LatestStreamArn' --output text)
+
+if [ -z "$STREAM_ARN" ] || [ "$STREAM_ARN" == "None" ]; then
+    echo "${EVENTS_TABLE} has no stream; run 1_create_dynamodb_tables.sh first"
+    exit 1
+fi
+
+# Reading the stream needs dynamodb:GetRecords and friends
+aws iam attach-role-policy \
+    --role-name ${IAM_ROLE_ARN##*/} \
+    --policy-arn arn:aws:iam::aws:policy/service-role/AWSLambdaDynamoDBExecutionRole || echo "Policy may already be attached"
+
+# Only deletes made by TTL reach the archiver
+FILTER='{"Filters":[{"Pattern":"{\"eventName\":[\"REMOVE\"],\"userIdentity\":{\"type\":[\"Service\"],\"principalId\":[\"dynamodb.amazonaws.com\"]}}"}]}'
+
+# Connect the stream to the archiver Lambda
+MAPPING_UUID=$(aws lambda list-event-source-mappings \
+    --function-name ${ARCHIVE_EVENTS_FUNCTION} \
+    --event-source-arn ${STREAM_ARN} \
+    --region ${AWS_REGION} \
+    --query 'EventSourceMappings[0].UUID' --output text)
+
+if [ -z "$MAPPING_UUID" ] || [ "$MAPPING_UUID" == "None" ]; then
+    echo "Creating event source mapping..."
+    aws lambda create-event-source-mapping \
+        --function-name ${ARCHIVE_EVENTS_FUNCTION} \
+        --event-source-arn ${STREAM_ARN} \
+        --starting-position TRIM_HORIZON \
+        --batch-size ${BATCH_SIZE} \
+        --maximum-batching-window-in-seconds ${BATCH_WINDOW} \
+        --function-response-types ReportBatchItemFailures \
+        --filter-criteria "${FILTER}" \
+        --region ${AWS_REGION} > /dev/null
+else
+    echo "Updating event source mapping..."
+    aws lambda update-event-source-mapping \
+        --uuid ${MAPPING_UUID} \
+        --batch-size ${BATCH_SIZE} \
+        --maximum-batching-window-in-seconds ${BATCH_WINDOW} \
+        --function-response-types ReportBatchItemFailures \
+        --filter-criteria "${FILTER}" \
+        --region ${AWS_REGION} > /dev/null
+fi
+
+echo "Events archive connected successfully!"
@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+"""
+Print the lambdas/common modules a handler imports, directly or through
+other common modules, so each deployment package ships only those
+
+Usage: python3 common_modules.py ../../lambdas/get_events.py
+"""
+
+import ast
+import os
+import sys
+
+def imported_common_modules(path):
+    """Names of common.* modules imported anywhere in the file at path"""
+    with open(path) as f:
+        tree = ast.parse(f.read(), path)
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.ImportFrom) and node.module:
+            if node.module == 'common':
+                names.update(alias.name for alias in node.names)
+            elif node.module.startswith('common.'):
+                names.add(node.module.split('.')[1])
+        elif isinstance(node, ast.Import):
+            names.update(alias.name.split('.')[1] for alias in node.names if alias.name.startswith('common.'))
+    return names
+
+def common_closure(handler_path):
+    common_dir = os.path.join(os.path.dirname(os.path.abspath(handler_path)), 'common')
+    needed = set()
+    pending = imported_common_modules(handler_path)
+    while pending:
+        name = pending.pop()
+        module_path = os.path.join(common_dir, f"{name}.py")
+        if name in needed or not os.path.exists(module_path):
+            continue
+        needed.add(name)
+        pending |= imported_common_modules(module_path)
+    return sorted(needed)
+
+if __name__ == '__main__':
+    print(' '.join(f"{name}.py" for name in common_closure(sys.argv[1])))
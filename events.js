@@ -7,8 +7,13 @@ const Events = (function() {
     
     // Private state
     let events = [];
-    let pollingInterval = null;
+    let cursor = null;
+    let pollingTimeout = null;
+    let pollingActive = false;
+    const MAX_EVENTS = 200;
     const POLLING_INTERVAL_MS = 30000; // 30 seconds
+    // get_events holds a cursor poll open until new events arrive or this many seconds pass
+    const LONG_POLL_WAIT_SECONDS = 20;
     
     // Private methods
     function displayEvents() {
@@ -125,8 +130,9 @@ const Events = (function() {
                     
                     // Extract events from response
                     if (data.events && Array.isArray(data.events)) {
-                        // Store events
+                        // Store events and the cursor for incremental polls
                         events = data.events;
+                        cursor = data.next_cursor || null;
                         
                         // Check if we have new events
                         if (events.length > 0) {
@@ -154,24 +160,76 @@ const Events = (function() {
                 });
         },
         
-        // Start polling for events
+        // Fetch only events newer than the last cursor, waiting up to wait seconds for them
+        pollEvents: function(wait = 0) {
+            if (!cursor) {
+                return this.fetchEvents();
+            }
+            if (!Auth.isAuthenticated()) {
+                return Promise.reject('User not authenticated');
+            }
+            
+            const waitParam = wait > 0 ? `&wait=${wait}` : '';
+            return fetch(`${API.getEvents}?user_id=${Auth.getUserId()}&cursor=${encodeURIComponent(cursor)}${waitParam}`)
+                .then(response => response.json())
+                .then(data => {
+                    if (data.error || !Array.isArray(data.events)) {
+                        console.error('Error polling events:', data.error || data);
+                        return [];
+                    }
+                    
+                    cursor = data.next_cursor || cursor;
+                    const newEvents = data.events;
+                    if (newEvents.length > 0) {
+                        events = newEvents.concat(events).slice(0, MAX_EVENTS);
+                        displayEvents();
+                        
+                        if (typeof Conversations !== 'undefined' && Conversations.fetchConversations) {
+                            Conversations.fetchConversations();
+                        }
+                        
+                        Utils.showNotification(`${newEvents.length} new events received`);
+                    }
+                    return newEvents;
+                })
+                .catch(error => {
+                    console.error('Error polling events:', error);
+                    return [];
+                });
+        },
+        
+        // Start long-polling for events: each request is held until new
+        // events arrive, then the next one is sent right away
         startPolling: function() {
             // Stop existing polling if any
             this.stopPolling();
+            pollingActive = true;
             
-            // Start new polling
-            pollingInterval = setInterval(() => {
-                this.fetchEvents();
-            }, POLLING_INTERVAL_MS);
+            const poll = () => {
+                if (!pollingActive) return;
+                const started = Date.now();
+                this.pollEvents(LONG_POLL_WAIT_SECONDS)
+                    .catch(() => [])
+                    .then(newEvents => {
+                        if (!pollingActive) return;
+                        // An empty reply that came back at once means the request
+                        // was not held (error or no cursor yet), so back off
+                        const returnedEarly = Date.now() - started < 1000;
+                        const delay = (newEvents || []).length === 0 && returnedEarly ? POLLING_INTERVAL_MS : 0;
+                        pollingTimeout = setTimeout(poll, delay);
+                    });
+            };
+            pollingTimeout = setTimeout(poll, 0);
             
             console.log('Event polling started');
         },
         
         // Stop polling for events
         stopPolling: function() {
-            if (pollingInterval) {
-                clearInterval(pollingInterval);
-                pollingInterval = null;
+            if (pollingActive) {
+                pollingActive = false;
+                clearTimeout(pollingTimeout);
+                pollingTimeout = null;
                 console.log('Event polling stopped');
             }
         },
@@ -1,7 +1,12 @@
 // Events Module
 const Events = {
     events: [],
-    pollingInterval: null,
+    cursor: null,
+    pollingTimeout: null,
+    pollingActive: false,
+    MAX_EVENTS: 200,
+    // get_events holds a cursor poll open until new events arrive or this many seconds pass
+    LONG_POLL_WAIT_SECONDS: 20,
 
     // Load events
     async loadEvents(lastMinutes = 30) {
@@ -17,6 +22,7 @@ const Events = {
             }, `?user_id=${userId}&last_minutes=${lastMinutes}`);
 
             this.events = response.events || [];
+            this.cursor = response.next_cursor || null;
             this.renderEvents();
             return this.events;
         } catch (error) {
@@ -84,20 +90,62 @@ const Events = {
         return event.field || 'Event occurred';
     },
 
-    // Start polling
-    startPolling(intervalMs = 30000) {
-        this.stopPolling();
-        this.pollingInterval = setInterval(() => {
+    // Fetch only events newer than the last cursor and merge them in,
+    // waiting up to wait seconds for them
+    async pollNewEvents(wait = 0) {
+        if (!Auth.isAuthenticated()) {
+            return [];
+        }
+        if (!this.cursor) {
             const timeRange = document.getElementById('eventsTimeRange')?.value || 30;
-            this.loadEvents(timeRange);
-        }, intervalMs);
+            return this.loadEvents(timeRange);
+        }
+
+        try {
+            const userId = Auth.getUserId();
+            const response = await Utils.apiRequest('getEvents', {
+                method: 'GET'
+            }, `?user_id=${userId}&cursor=${encodeURIComponent(this.cursor)}${wait > 0 ? `&wait=${wait}` : ''}`);
+
+            const newEvents = response.events || [];
+            this.cursor = response.next_cursor || this.cursor;
+            if (newEvents.length > 0) {
+                this.events = [...newEvents, ...this.events].slice(0, this.MAX_EVENTS);
+                this.renderEvents();
+            }
+            return newEvents;
+        } catch (error) {
+            console.error('Error polling events:', error);
+            return [];
+        }
+    },
+
+    // Start long-polling: each request is held until new events arrive,
+    // then the next one is sent right away
+    startPolling(retryMs = 30000) {
+        this.stopPolling();
+        this.pollingActive = true;
+
+        const poll = async () => {
+            if (!this.pollingActive) return;
+            const started = Date.now();
+            const newEvents = await this.pollNewEvents(this.LONG_POLL_WAIT_SECONDS);
+            if (!this.pollingActive) return;
+            // An empty reply that came back at once was not held (error or
+            // no cursor yet), so back off instead of spinning
+            const returnedEarly = Date.now() - started < 1000;
+            const delay = (newEvents || []).length === 0 && returnedEarly ? retryMs : 0;
+            this.pollingTimeout = setTimeout(poll, delay);
+        };
+        this.pollingTimeout = setTimeout(poll, 0);
     },
 
     // Stop polling
     stopPolling() {
-        if (this.pollingInterval) {
-            clearInterval(this.pollingInterval);
-            this.pollingInterval = null;
+        this.pollingActive = false;
+        if (this.pollingTimeout) {
+            clearTimeout(this.pollingTimeout);
+            this.pollingTimeout = null;
         }
     }
 };
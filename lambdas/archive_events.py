@@ -0,0 +1,68 @@
+import base64
+import json
+import sys
+from collections import defaultdict
+
+from common.archive import item_to_record, partition_key, write_partition
+from common.aws import client_error, from_item
+from common.log import get_logger
+from common.metrics import instrument
+
+log = get_logger('archive_events')
+
+# Stream records of deletes made by DynamoDB TTL carry this identity
+TTL_PRINCIPAL = 'dynamodb.amazonaws.com'
+
+@instrument('archive_events')
+def lambda_handler(event, context):
+    """Copy events deleted by DynamoDB TTL from the events table into the archive.
+    
+    Invoked by the events table's stream (OLD_IMAGE) with a batch of
+    records. Events are grouped into per-account daily files, one write per
+    file. Records of a file that failed to write are reported as batch item
+    failures, so the stream retries from them; write_partition drops the
+    events a retry writes twice.
+    """
+    records = event.get('Records', [])
+    partitions = defaultdict(list)
+    for record in records:
+        if not is_ttl_delete(record):
+            continue
+        try:
+            entry = item_to_record(stream_image_to_item(record['dynamodb']['OldImage']))
+        except (KeyError, TypeError, ValueError) as e:
+            log.warning("Skipping unreadable event", sequence=record.get('dynamodb', {}).get('SequenceNumber'),
+                        error=str(e))
+            continue
+        partitions[partition_key(entry['user_id'], entry['timestamp'])].append(
+            (record['dynamodb']['SequenceNumber'], entry))
+    
+    archived = 0
+    failures = []
+    for key, entries in partitions.items():
+        try:
+            write_partition(key, [entry for _, entry in entries])
+            archived += len(entries)
+        except client_error() as e:
+            log.error("Error writing archive file", key=key, error=str(e))
+            failures.extend(sequence for sequence, _ in entries)
+    
+    log.info("Archived events", archived=archived, records=len(records), failed=len(failures))
+    return {'batchItemFailures': [{'itemIdentifier': sequence} for sequence in failures]}
+
+def is_ttl_delete(record):
+    """True for a stream record of an item DynamoDB TTL deleted."""
+    identity = record.get('userIdentity') or {}
+    return (record.get('eventName') == 'REMOVE' and identity.get('type') == 'Service'
+            and identity.get('principalId') == TTL_PRINCIPAL)
+
+def stream_image_to_item(image):
+    """Unmarshal a stream image; Lambda delivers binary attributes base64-encoded."""
+    return from_item({
+        name: {'B': base64.b64decode(value['B'])} if isinstance(value.get('B'), str) else value
+        for name, value in image.items()
+    })
+
+if __name__ == '__main__':
+    # Archive a saved stream event: python3 archive_events.py < event.json
+    print(json.dumps(lambda_handler(json.load(sys.stdin), None)))
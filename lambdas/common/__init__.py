@@ -0,0 +1,4 @@
+"""Helpers shared by the InstaAI Lambda functions.
+
+The deploy script copies this package next to each lambda_function.py.
+"""
@@ -0,0 +1,143 @@
+import gzip
+import json
+import os
+import tempfile
+from datetime import datetime, timezone
+from decimal import Decimal
+
+from common.aws import client_error, get_client
+from common.event_codec import decode_event_data
+from common.metrics import timed
+from common.response import dumps
+
+# Archived events live in one gzipped NDJSON file per account per UTC day:
+#   events/<user_id>/<YYYY-MM-DD>.ndjson.gz
+# in S3 when EVENTS_ARCHIVE_BUCKET is set, otherwise under EVENTS_ARCHIVE_DIR
+EVENTS_ARCHIVE_BUCKET = os.environ.get('EVENTS_ARCHIVE_BUCKET', '')
+EVENTS_ARCHIVE_DIR = os.environ.get('EVENTS_ARCHIVE_DIR', '/tmp/instaai-events-archive')
+
+# Stored for events without an owning account
+UNKNOWN_USER = '_unknown'
+
+class LocalBlobStore:
+    """Blob store on the local filesystem, a stand-in for S3."""
+    
+    def __init__(self, root):
+        self.root = root
+    
+    def get(self, key):
+        try:
+            with open(os.path.join(self.root, key), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+    
+    def put(self, key, data):
+        path = os.path.join(self.root, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temp file and rename, so readers never see a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    
+    def list(self, prefix):
+        try:
+            names = os.listdir(os.path.join(self.root, prefix))
+        except FileNotFoundError:
+            return []
+        return [prefix + name for name in names if not name.startswith('tmp')]
+
+class S3BlobStore:
+    """Blob store in an S3 bucket."""
+    
+    def __init__(self, bucket):
+        self.bucket = bucket
+        self.s3 = get_client('s3')
+    
+    def get(self, key):
+        try:
+            return self.s3.get_object(Bucket=self.bucket, Key=key)['Body'].read()
+        except client_error() as e:
+            if e.response['Error']['Code'] in ('NoSuchKey', '404'):
+                return None
+            raise
+    
+    def put(self, key, data):
+        self.s3.put_object(Bucket=self.bucket, Key=key, Body=data, ContentEncoding='gzip',
+                           ContentType='application/x-ndjson')
+    
+    def list(self, prefix):
+        keys = []
+        for page in self.s3.get_paginator('list_objects_v2').paginate(Bucket=self.bucket, Prefix=prefix):
+            keys.extend(obj['Key'] for obj in page.get('Contents', []))
+        return keys
+
+_store = None
+
+def get_blob_store():
+    """Return the configured blob store, created once per container."""
+    global _store
+    if _store is None:
+        _store = S3BlobStore(EVENTS_ARCHIVE_BUCKET) if EVENTS_ARCHIVE_BUCKET else LocalBlobStore(EVENTS_ARCHIVE_DIR)
+    return _store
+
+def partition_key(user_id, timestamp_ms):
+    """Return the archive file holding user_id's events for timestamp_ms."""
+    day = datetime.fromtimestamp(int(timestamp_ms) / 1000, tz=timezone.utc).strftime('%Y-%m-%d')
+    return f"events/{user_id}/{day}.ndjson.gz"
+
+def item_to_record(item):
+    """Convert an events table item into an archive record."""
+    record = {
+        'event_id': item['event_id'],
+        'user_id': item.get('user_id', UNKNOWN_USER),
+        'timestamp': int(item['timestamp']),
+        'event_type': item.get('event_type'),
+        'event_data': decode_event_data(item.get('event_data'))
+    }
+    for field in ('sender_id', 'event_time'):
+        if field in item:
+            record[field] = int(item[field]) if isinstance(item[field], Decimal) else item[field]
+    return record
+
+def read_partition(key, store=None):
+    """Return the records in one archive file, or [] if it does not exist."""
+    data = (store or get_blob_store()).get(key)
+    if not data:
+        return []
+    return [json.loads(line) for line in gzip.decompress(data).splitlines() if line]
+
+@timed('archive_write')
+def write_partition(key, records, store=None):
+    """Merge records into an archive file, dropping duplicate event_ids."""
+    store = store or get_blob_store()
+    merged = {r['event_id']: r for r in read_partition(key, store)}
+    merged.update((r['event_id'], r) for r in records)
+    
+    lines = [dumps(r) for r in sorted(merged.values(), key=lambda r: (r['timestamp'], r['event_id']))]
+    store.put(key, gzip.compress(('\n'.join(lines) + '\n').encode('utf-8')))
+    return len(merged)
+
+@timed('archive_read')
+def read_archived_events(user_id, start_ms, end_ms, limit):
+    """Return up to limit archived records for user_id in [start_ms, end_ms), newest first.
+    
+    Reads only the archive: lists the account's daily files, then reads the
+    ones in range from end_ms backwards. Both bounds must be valid
+    timestamps (see datetime). Returns (records, has_more).
+    """
+    store = get_blob_store()
+    start_day = partition_key(user_id, start_ms)
+    end_day = partition_key(user_id, end_ms - 1)
+    # Keys sort by day within an account
+    keys = sorted((key for key in store.list(f"events/{user_id}/") if start_day <= key <= end_day), reverse=True)
+    
+    records = []
+    for key in keys:
+        day_records = [r for r in read_partition(key, store) if start_ms <= r['timestamp'] < end_ms]
+        records.extend(sorted(day_records, key=lambda r: r['timestamp'], reverse=True))
+        if len(records) > limit:
+            break
+    
+    return records[:limit], len(records) > limit
@@ -0,0 +1,65 @@
+# boto3 is imported on first use rather than at module import: importing
+# it and building clients is most of a handler's cold start, and paths
+# like webhook verification or CORS preflight never touch AWS.
+
+from common.metrics import instrument_dynamodb_client
+
+_resource = None
+_tables = {}
+_clients = {}
+_serializer = None
+_deserializer = None
+
+def client_error():
+    """Return botocore's ClientError class, for `except client_error() as e:`.
+    
+    An except clause's expression is only evaluated while an exception is
+    being matched, so handlers never import botocore.exceptions on the
+    happy path.
+    """
+    from botocore.exceptions import ClientError
+    return ClientError
+
+def get_client(service):
+    """Return the low-level boto3 client for service, created once per container."""
+    client = _clients.get(service)
+    if client is None:
+        import boto3
+        client = _clients[service] = boto3.client(service)
+        if service == 'dynamodb':
+            instrument_dynamodb_client(client)
+    return client
+
+def get_table(name):
+    """Return the DynamoDB Table resource for name, created once per container.
+    
+    Prefer get_client('dynamodb') with to_item/from_item for single-item
+    calls; the resource layer is for batch_writer and paginated queries.
+    """
+    global _resource
+    table = _tables.get(name)
+    if table is None:
+        if _resource is None:
+            import boto3
+            _resource = boto3.resource('dynamodb')
+            instrument_dynamodb_client(_resource.meta.client)
+        table = _tables[name] = _resource.Table(name)
+    return table
+
+def to_item(data):
+    """Marshal a plain dict into DynamoDB attribute values for the client API."""
+    global _serializer
+    if _serializer is None:
+        from boto3.dynamodb.types import TypeSerializer
+        _serializer = TypeSerializer()
+    return {k: _serializer.serialize(v) for k, v in data.items()}
+
+def from_item(item):
+    """Unmarshal DynamoDB attribute values from the client API, or None."""
+    global _deserializer
+    if item is None:
+        return None
+    if _deserializer is None:
+        from boto3.dynamodb.types import TypeDeserializer
+        _deserializer = TypeDeserializer()
+    return {k: _deserializer.deserialize(v) for k, v in item.items()}
@@ -0,0 +1,82 @@
+import json
+import os
+import time
+
+from common.aws import from_item, get_client, to_item
+from common.metrics import timed
+
+CONVERSATIONS_TABLE_NAME = os.environ.get('CONVERSATIONS_TABLE_NAME', 'InstaAI-Conversations')
+# Upper bound on serving a cached list even if no webhook marked it dirty
+CONVERSATIONS_CACHE_MAX_AGE = int(os.environ.get('CONVERSATIONS_CACHE_MAX_AGE', '3600'))  # seconds
+
+def now_ms():
+    return int(time.time() * 1000)
+
+@timed('conversations_cache')
+def get_cached_conversations(user_id, allow_stale=False):
+    """Return (conversations, fetched_at) for user_id, or None if missing or stale.
+    
+    The list is stale once a webhook marked the account dirty after it was
+    fetched, or once it is older than CONVERSATIONS_CACHE_MAX_AGE. With
+    allow_stale, any cached list is returned.
+    """
+    response = get_client('dynamodb').get_item(
+        TableName=CONVERSATIONS_TABLE_NAME,
+        Key=to_item({'user_id': str(user_id)})
+    )
+    item = from_item(response.get('Item'))
+    if not item or 'data' not in item:
+        return None
+    fetched_at = int(item.get('fetched_at', 0))
+    if allow_stale:
+        return json.loads(item['data']), fetched_at
+    
+    if not is_unchanged_since(item, fetched_at):
+        return None
+    return json.loads(item['data']), fetched_at
+
+def is_unchanged_since(item, since_ms):
+    """True if item was not marked dirty at or after since_ms, and since_ms is recent enough."""
+    if int(item.get('dirty_at', 0)) >= since_ms:
+        return False
+    return now_ms() - since_ms <= CONVERSATIONS_CACHE_MAX_AGE * 1000
+
+@timed('conversations_cache')
+def conversations_unchanged_since(user_id, since_ms):
+    """True if the account has had no messaging webhooks since since_ms.
+    
+    Webhooks can be lost, so anything older than CONVERSATIONS_CACHE_MAX_AGE
+    counts as changed.
+    """
+    response = get_client('dynamodb').get_item(
+        TableName=CONVERSATIONS_TABLE_NAME,
+        Key=to_item({'user_id': str(user_id)}),
+        ProjectionExpression='dirty_at'
+    )
+    return is_unchanged_since(from_item(response.get('Item')) or {}, since_ms)
+
+@timed('conversations_cache')
+def put_cached_conversations(user_id, data, fetched_at):
+    """Cache a conversation list fetched from Graph.
+    
+    fetched_at should be taken before the Graph call, so a webhook that
+    arrives while the call is in flight still marks the result stale.
+    """
+    get_client('dynamodb').update_item(
+        TableName=CONVERSATIONS_TABLE_NAME,
+        Key=to_item({'user_id': str(user_id)}),
+        UpdateExpression="set #data = :d, fetched_at = :f",
+        ExpressionAttributeNames={'#data': 'data'},
+        ExpressionAttributeValues=to_item({':d': json.dumps(data), ':f': fetched_at})
+    )
+
+def mark_conversations_dirty(user_ids):
+    """Mark the cached conversation lists of user_ids as stale."""
+    dirty_at = now_ms()
+    for user_id in set(user_ids):
+        get_client('dynamodb').update_item(
+            TableName=CONVERSATIONS_TABLE_NAME,
+            Key=to_item({'user_id': str(user_id)}),
+            UpdateExpression="set dirty_at = :t",
+            ExpressionAttributeValues=to_item({':t': dirty_at})
+        )
@@ -0,0 +1,114 @@
+import os
+import threading
+import time
+from collections import Counter
+
+from common.aws import from_item, get_client, to_item
+from common.conversations_cache import CONVERSATIONS_TABLE_NAME, mark_conversations_dirty, now_ms
+
+# Tells waiting get_events calls that an account has new events. 'dynamodb'
+# keeps a per-account event sequence that waiters poll with cheap GetItems,
+# which works across Lambda containers; 'memory' wakes waiters in this
+# process directly (tests and local runs)
+EVENTS_BROKER_BACKEND = os.environ.get('EVENTS_BROKER_BACKEND', 'dynamodb')
+# The sequence sits on the account's conversations cache item
+EVENTS_WATERMARK_TABLE_NAME = os.environ.get('EVENTS_WATERMARK_TABLE_NAME',
+                                             os.environ.get('CONVERSATIONS_TABLE_NAME', 'InstaAI-Conversations'))
+EVENTS_BROKER_POLL_INTERVAL = float(os.environ.get('EVENTS_BROKER_POLL_INTERVAL', '0.5'))  # seconds
+
+# Every stored event advances its account's sequence by one, so the
+# sequence changes even when new events share a millisecond with events a
+# client has already read. Callers compare sequences for equality only.
+
+class DynamoBroker:
+    """Per-account stored-event count in DynamoDB."""
+    
+    def __init__(self, table_name, poll_interval):
+        self.table_name = table_name
+        self.poll_interval = poll_interval
+    
+    def publish(self, user_id, count, dirty_at=None):
+        values = {':n': count}
+        update = "add events_seq :n"
+        if dirty_at is not None and self.table_name == CONVERSATIONS_TABLE_NAME:
+            # One write for both markers on the account's conversations item
+            values[':t'] = dirty_at
+            update = "set dirty_at = :t " + update
+        elif dirty_at is not None:
+            mark_conversations_dirty([user_id])
+        get_client('dynamodb').update_item(
+            TableName=self.table_name,
+            Key=to_item({'user_id': str(user_id)}),
+            UpdateExpression=update,
+            ExpressionAttributeValues=to_item(values)
+        )
+    
+    def latest(self, user_id):
+        response = get_client('dynamodb').get_item(
+            TableName=self.table_name,
+            Key=to_item({'user_id': str(user_id)}),
+            ProjectionExpression='events_seq'
+        )
+        return int((from_item(response.get('Item')) or {}).get('events_seq', 0))
+    
+    def wait(self, user_id, after_seq, timeout):
+        """Return the sequence once it differs from after_seq, or when timeout runs out."""
+        deadline = time.monotonic() + timeout
+        while True:
+            seq = self.latest(user_id)
+            if seq != after_seq:
+                return seq
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return seq
+            time.sleep(min(self.poll_interval, remaining))
+
+class MemoryBroker:
+    """In-process broker, for tests and local runs in a single process."""
+    
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.sequences = {}
+    
+    def publish(self, user_id, count, dirty_at=None):
+        if dirty_at is not None:
+            mark_conversations_dirty([user_id])
+        with self.condition:
+            user_id = str(user_id)
+            self.sequences[user_id] = self.sequences.get(user_id, 0) + count
+            self.condition.notify_all()
+    
+    def latest(self, user_id):
+        with self.condition:
+            return self.sequences.get(str(user_id), 0)
+    
+    def wait(self, user_id, after_seq, timeout):
+        user_id = str(user_id)
+        with self.condition:
+            self.condition.wait_for(lambda: self.sequences.get(user_id, 0) != after_seq, timeout)
+            return self.sequences.get(user_id, 0)
+
+_broker = None
+
+def get_event_broker():
+    """Return the configured broker, created once per container."""
+    global _broker
+    if _broker is None:
+        if EVENTS_BROKER_BACKEND == 'memory':
+            _broker = MemoryBroker()
+        else:
+            _broker = DynamoBroker(EVENTS_WATERMARK_TABLE_NAME, EVENTS_BROKER_POLL_INTERVAL)
+    return _broker
+
+def publish_events(items, dirty_user_ids=()):
+    """Advance the sequence of every account with events in items.
+    
+    Accounts in dirty_user_ids also get their cached conversation list
+    marked stale, in the same write when the sequence lives on the
+    conversations table.
+    """
+    counts = Counter(item['user_id'] for item in items if 'user_id' in item)
+    dirty = {str(user_id) for user_id in dirty_user_ids}
+    dirty_at = now_ms()
+    for user_id, count in counts.items():
+        get_event_broker().publish(user_id, count, dirty_at if user_id in dirty else None)
@@ -0,0 +1,45 @@
+import json
+import os
+import zlib
+
+# 'zlib' writes compressed Binary payloads; 'json' keeps writing plain
+# strings (for rolling back before every reader understands the codec)
+EVENT_DATA_CODEC = os.environ.get('EVENT_DATA_CODEC', 'zlib')
+# Level 1 compresses small webhook payloads as well as 6 for less CPU
+ZLIB_LEVEL = int(os.environ.get('EVENT_DATA_ZLIB_LEVEL', '1'))
+
+# First byte of a Binary payload; plain string payloads are version 0
+CODEC_ZLIB_JSON = 1
+
+def encode_event_data(data):
+    """Encode a webhook payload for the event_data attribute."""
+    payload = json.dumps(data, separators=(',', ':'))
+    if EVENT_DATA_CODEC != 'zlib':
+        return payload
+    return bytes([CODEC_ZLIB_JSON]) + zlib.compress(payload.encode('utf-8'), ZLIB_LEVEL)
+
+def decode_event_data(value):
+    """Decode an event_data attribute written by any codec version.
+    
+    Accepts legacy JSON strings, raw bytes, and boto3 Binary values.
+    Raises ValueError for payloads it cannot read.
+    """
+    if value is None:
+        return {}
+    if isinstance(value, str):
+        return json.loads(value)
+    
+    # boto3 returns Binary attributes wrapped in a Binary object
+    raw = bytes(getattr(value, 'value', value))
+    if not raw:
+        raise ValueError("Empty event_data payload")
+    if raw[0] == CODEC_ZLIB_JSON:
+        try:
+            return json.loads(zlib.decompress(raw[1:]))
+        except zlib.error as e:
+            raise ValueError(f"Corrupt event_data payload: {str(e)}")
+    raise ValueError(f"Unknown event_data codec version {raw[0]}")
+
+def is_legacy_event_data(value):
+    """True if value was written before the codec (a JSON string)."""
+    return isinstance(value, str)
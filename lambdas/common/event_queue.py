@@ -0,0 +1,97 @@
+import fcntl
+import json
+import os
+import threading
+
+from common.aws import get_client
+
+# 'sqs' in AWS; 'memory' or 'file' stand in for SQS locally and in tests
+EVENTS_QUEUE_BACKEND = os.environ.get('EVENTS_QUEUE_BACKEND', 'sqs')
+EVENTS_QUEUE_URL = os.environ.get('EVENTS_QUEUE_URL', '')
+EVENTS_QUEUE_FILE = os.environ.get('EVENTS_QUEUE_FILE', '/tmp/instaai-webhook-queue.ndjson')
+
+def encode_delivery(body, timestamp):
+    """Serialize a webhook delivery for the queue."""
+    return json.dumps({'body': body, 'timestamp': timestamp})
+
+def decode_delivery(message):
+    """Return (body, timestamp) from a queued delivery."""
+    data = json.loads(message)
+    return data['body'], data['timestamp']
+
+class SqsQueue:
+    """Deliveries go to SQS; the consumer Lambda receives them via an event source mapping."""
+    
+    def __init__(self, queue_url):
+        self.queue_url = queue_url
+        self.sqs = get_client('sqs')
+    
+    def send(self, body, timestamp):
+        self.sqs.send_message(QueueUrl=self.queue_url, MessageBody=encode_delivery(body, timestamp))
+    
+    def drain(self, max_messages=10):
+        """Receive and delete up to max_messages deliveries (for local draining)."""
+        response = self.sqs.receive_message(
+            QueueUrl=self.queue_url,
+            MaxNumberOfMessages=min(max_messages, 10),
+            WaitTimeSeconds=1
+        )
+        messages = response.get('Messages', [])
+        if messages:
+            self.sqs.delete_message_batch(
+                QueueUrl=self.queue_url,
+                Entries=[{'Id': str(i), 'ReceiptHandle': m['ReceiptHandle']} for i, m in enumerate(messages)]
+            )
+        return [decode_delivery(m['Body']) for m in messages]
+
+class MemoryQueue:
+    """In-process queue, for tests and local runs in a single process."""
+    
+    def __init__(self):
+        self.messages = []
+        self.lock = threading.Lock()
+    
+    def send(self, body, timestamp):
+        with self.lock:
+            self.messages.append(encode_delivery(body, timestamp))
+    
+    def drain(self, max_messages=100):
+        with self.lock:
+            messages, self.messages = self.messages[:max_messages], self.messages[max_messages:]
+        return [decode_delivery(m) for m in messages]
+
+class FileQueue:
+    """NDJSON file queue, shared by processes on one machine."""
+    
+    def __init__(self, path):
+        self.path = path
+    
+    def send(self, body, timestamp):
+        with open(self.path, 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            f.write(encode_delivery(body, timestamp) + '\n')
+    
+    def drain(self, max_messages=100):
+        if not os.path.exists(self.path):
+            return []
+        with open(self.path, 'r+') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            lines = [line for line in f.read().splitlines() if line]
+            f.seek(0)
+            f.truncate()
+            f.writelines(line + '\n' for line in lines[max_messages:])
+        return [decode_delivery(line) for line in lines[:max_messages]]
+
+_queue = None
+
+def get_event_queue():
+    """Return the configured queue, created once per container."""
+    global _queue
+    if _queue is None:
+        if EVENTS_QUEUE_BACKEND == 'memory':
+            _queue = MemoryQueue()
+        elif EVENTS_QUEUE_BACKEND == 'file':
+            _queue = FileQueue(EVENTS_QUEUE_FILE)
+        else:
+            _queue = SqsQueue(EVENTS_QUEUE_URL)
+    return _queue
@@ -0,0 +1,81 @@
+import json
+import os
+import time
+
+from common.log import get_logger
+
+log = get_logger('governor')
+
+# Usage (percent of the Graph rate limit) above which background calls
+# slow down, and above which they are deferred entirely. Interactive
+# calls such as sends are never held back, so they keep the headroom.
+SOFT_LIMIT = float(os.environ.get('GRAPH_USAGE_SOFT_LIMIT', '60'))
+DEFER_LIMIT = float(os.environ.get('GRAPH_USAGE_DEFER_LIMIT', '85'))
+MAX_BACKGROUND_DELAY = float(os.environ.get('GRAPH_MAX_BACKGROUND_DELAY', '1.0'))  # seconds
+# Graph usage is a rolling one-hour window; readings older than this are ignored
+USAGE_TTL = int(os.environ.get('GRAPH_USAGE_TTL', '300'))  # seconds
+
+INTERACTIVE = 'interactive'
+BACKGROUND = 'background'
+
+# App-wide usage from X-App-Usage, and per-account usage from
+# X-Business-Use-Case-Usage: account -> (percent, blocked_until, observed_at)
+_app_usage = (0.0, 0.0, 0.0)
+_account_usage = {}
+
+def record_usage(account, headers):
+    """Update usage estimates from the headers of a Graph response."""
+    global _app_usage
+    now = time.time()
+    
+    app_header = _header(headers, 'X-App-Usage')
+    if app_header:
+        try:
+            _app_usage = (_max_percent(json.loads(app_header)), 0.0, now)
+        except ValueError:
+            log.warning("Unparseable X-App-Usage header", header=app_header)
+    
+    buc_header = _header(headers, 'X-Business-Use-Case-Usage')
+    if buc_header and account:
+        try:
+            percent, blocked_until = 0.0, 0.0
+            for entries in json.loads(buc_header).values():
+                for entry in entries:
+                    percent = max(percent, _max_percent(entry))
+                    regain_minutes = entry.get('estimated_time_to_regain_access') or 0
+                    blocked_until = max(blocked_until, now + float(regain_minutes) * 60)
+            _account_usage[str(account)] = (percent, blocked_until, now)
+        except (ValueError, AttributeError):
+            log.warning("Unparseable X-Business-Use-Case-Usage header", header=buc_header)
+
+def get_usage(account=None):
+    """Return the estimated usage percent for an account, including app-wide usage."""
+    now = time.time()
+    usage = _app_usage[0] if now - _app_usage[2] < USAGE_TTL else 0.0
+    percent, blocked_until, observed_at = _account_usage.get(str(account), (0.0, 0.0, 0.0))
+    if blocked_until > now:
+        return 100.0
+    if now - observed_at < USAGE_TTL:
+        usage = max(usage, percent)
+    return usage
+
+def should_defer(account=None, priority=BACKGROUND):
+    """True if a call of this priority should be skipped for now."""
+    return priority != INTERACTIVE and get_usage(account) >= DEFER_LIMIT
+
+def background_delay(account=None, priority=BACKGROUND):
+    """Seconds to wait before a call, growing from 0 at SOFT_LIMIT to the max at DEFER_LIMIT."""
+    if priority == INTERACTIVE:
+        return 0.0
+    usage = get_usage(account)
+    if usage <= SOFT_LIMIT:
+        return 0.0
+    fraction = min(1.0, (usage - SOFT_LIMIT) / max(DEFER_LIMIT - SOFT_LIMIT, 1))
+    return fraction * MAX_BACKGROUND_DELAY
+
+def _header(headers, name):
+    # requests and aiohttp headers are case-insensitive mappings
+    return headers.get(name) if headers else None
+
+def _max_percent(usage):
+    return max(float(usage.get(key) or 0) for key in ('call_count', 'total_cputime', 'total_time'))
@@ -0,0 +1,65 @@
+import os
+
+from common import governor, metrics
+
+# Overridable so benchmarks can point handlers at a local stub server
+GRAPH_HOST = os.environ.get('GRAPH_HOST', 'https://graph.instagram.com')
+GRAPH_API_URL = f"{GRAPH_HOST}/v22.0"
+OAUTH_TOKEN_URL = os.environ.get('OAUTH_TOKEN_URL', 'https://api.instagram.com/oauth/access_token')
+
+# Size the pool to the largest number of concurrent calls a handler makes
+MAX_WORKERS = int(os.environ.get('GRAPH_MAX_WORKERS', '5'))
+GRAPH_TIMEOUT = (
+    float(os.environ.get('GRAPH_CONNECT_TIMEOUT', '3.05')),
+    float(os.environ.get('GRAPH_READ_TIMEOUT', '10'))
+)
+GRAPH_RETRIES = int(os.environ.get('GRAPH_RETRIES', '2'))
+
+def _build_session():
+    """Create a keep-alive session that retries idempotent calls on 5xx."""
+    # Imported here so handlers that never call Graph don't pay for requests
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+    
+    retry = Retry(
+        total=GRAPH_RETRIES,
+        backoff_factor=0.3,
+        status_forcelist=(500, 502, 503, 504),
+        # Never retry POSTs: a retried send could deliver a message twice
+        allowed_methods=frozenset(['GET']),
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=MAX_WORKERS, max_retries=retry)
+    http = requests.Session()
+    http.mount('https://', adapter)
+    return http
+
+# Module-scoped so connections stay open across warm invocations; built on
+# the first request
+session = None
+
+def request(method, url, account=None, **kwargs):
+    """Send a request through the shared session.
+    
+    url may be absolute or a path relative to GRAPH_API_URL. Usage headers
+    on the response are recorded against account for the governor.
+    """
+    global session
+    if '://' not in url:
+        url = f"{GRAPH_API_URL}/{url.lstrip('/')}"
+    kwargs.setdefault('timeout', GRAPH_TIMEOUT)
+    if session is None:
+        session = _build_session()
+    with metrics.span('graph'):
+        response = session.request(method, url, **kwargs)
+    governor.record_usage(account, response.headers)
+    return response
+
+def get(url, params=None, **kwargs):
+    """GET through the shared session."""
+    return request('GET', url, params=params, **kwargs)
+
+def post(url, **kwargs):
+    """POST through the shared session."""
+    return request('POST', url, **kwargs)
@@ -0,0 +1,85 @@
+import json
+import os
+
+from common import governor, metrics
+from common.graph import GRAPH_API_URL, GRAPH_TIMEOUT, GRAPH_RETRIES
+
+# Maximum Graph requests in flight at once across a handler's fan-out
+GRAPH_ASYNC_CONCURRENCY = int(os.environ.get('GRAPH_ASYNC_CONCURRENCY', '20'))
+
+# One event loop for the container's lifetime, so the session and its
+# connection pool survive warm invocations (asyncio.run would close them).
+# It is created, and asyncio imported, on first use: importing asyncio is
+# a large part of a handler's cold start
+_loop = None
+_session = None
+_semaphore = None
+
+def run(coro):
+    """Run a coroutine on the shared loop and return its result."""
+    global _loop
+    if _loop is None:
+        import asyncio
+        _loop = asyncio.new_event_loop()
+    return _loop.run_until_complete(coro)
+
+def gather(coros):
+    """Run coroutines concurrently; exceptions are returned in place of results."""
+    async def _gather():
+        import asyncio
+        return await asyncio.gather(*coros, return_exceptions=True)
+    return run(_gather())
+
+async def _get_session():
+    global _session, _semaphore
+    if _session is None or _session.closed:
+        # Imported here so importing this module stays cheap on cold start
+        import asyncio
+        import aiohttp
+        connector = aiohttp.TCPConnector(limit=GRAPH_ASYNC_CONCURRENCY, keepalive_timeout=60, ttl_dns_cache=300)
+        timeout = aiohttp.ClientTimeout(sock_connect=GRAPH_TIMEOUT[0], sock_read=GRAPH_TIMEOUT[1])
+        _session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+        _semaphore = asyncio.Semaphore(GRAPH_ASYNC_CONCURRENCY)
+    return _session
+
+async def request(method, url, params=None, account=None, priority=governor.INTERACTIVE, **kwargs):
+    """Send a request, returning (status_code, result).
+    
+    url may be absolute or a path relative to GRAPH_API_URL. GETs that
+    fail with 5xx are retried with backoff; POSTs are never retried.
+    Background calls are slowed down as account usage nears the limit.
+    """
+    import asyncio
+    delay = governor.background_delay(account, priority)
+    if delay:
+        await asyncio.sleep(delay)
+
+    if '://' not in url:
+        url = f"{GRAPH_API_URL}/{url.lstrip('/')}"
+    if params:
+        params = {k: str(v) for k, v in params.items()}
+    
+    session = await _get_session()
+    attempt = 0
+    while True:
+        async with _semaphore:
+            # Concurrent calls overlap, so graph_async_ms can exceed wall time
+            with metrics.span('graph_async'):
+                async with session.request(method, url, params=params, **kwargs) as response:
+                    status_code = response.status
+                    text = await response.text()
+                    governor.record_usage(account, response.headers)
+        
+        if method == 'GET' and status_code >= 500 and attempt < GRAPH_RETRIES:
+            attempt += 1
+            await asyncio.sleep(0.3 * 2 ** (attempt - 1))
+            continue
+        return status_code, (json.loads(text) if text else {})
+
+async def get(url, params=None, **kwargs):
+    """GET through the shared session."""
+    return await request('GET', url, params=params, **kwargs)
+
+async def post(url, **kwargs):
+    """POST through the shared session."""
+    return await request('POST', url, **kwargs)
@@ -0,0 +1,236 @@
+import hashlib
+import json
+import os
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from common.aws import client_error, get_client, to_item
+from common.event_broker import publish_events
+from common.event_codec import encode_event_data
+from common.log import get_logger
+from common.metrics import timed
+
+log = get_logger('ingest')
+
+EVENTS_TABLE_NAME = os.environ.get("EVENTS_TABLE_NAME", "InstaAI-WebhookEvents")
+
+# Days an event stays in the table before DynamoDB TTL deletes it
+# (archive_events then copies it to the archive); 0 keeps events forever
+EVENTS_RETENTION_DAYS = int(os.environ.get('EVENTS_RETENTION_DAYS', '30'))
+
+# Event types that change an account's conversation list
+MESSAGING_EVENT_TYPES = {'message', 'message_echo', 'message_edit', 'reaction'}
+
+# How long this container remembers stored event IDs, so hot retries of
+# a delivery skip the write entirely
+SEEN_EVENTS_TTL = int(os.environ.get('SEEN_EVENTS_TTL', '600'))  # seconds
+SEEN_EVENTS_SIZE = int(os.environ.get('SEEN_EVENTS_SIZE', '10000'))
+
+# Parallel conditional writes per batch of events; stays under the
+# client's default pool of 10 connections
+STORE_EVENTS_WORKERS = int(os.environ.get('STORE_EVENTS_WORKERS', '8'))
+
+# Namespace for deterministic event IDs
+EVENT_ID_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, 'instaai:webhook-events')
+
+# event_id -> expires_at for events stored (or found stored) recently
+_seen = OrderedDict()
+
+store_executor = ThreadPoolExecutor(max_workers=STORE_EVENTS_WORKERS)
+
+def ingest_deliveries(deliveries):
+    """Parse webhook deliveries and store them, returning the stored records.
+    
+    deliveries is a list of (body, timestamp_ms) pairs, timestamp_ms being
+    when the webhook received the delivery (kept as received_at). Every
+    messaging or change item becomes its own record. Records already stored
+    by an earlier delivery of the same event are skipped and not returned.
+    """
+    items = []
+    for body, timestamp in deliveries:
+        # Meta batches several entries and messaging/change items into one
+        # delivery, so store each item as its own record
+        items.extend(split_webhook_events(body, timestamp))
+    
+    # Meta retries deliveries, so drop events already stored
+    items = store_new_events(items)
+    
+    # Wake get_events calls long-polling these accounts; messaging activity
+    # also changes the conversation list of its owner
+    try:
+        publish_events(items, dirty_user_ids={
+            item['user_id'] for item in items
+            if 'user_id' in item and item['event_type'] in MESSAGING_EVENT_TYPES
+        })
+    except client_error() as e:
+        log.warning("Error publishing events", error=str(e))
+    
+    return items
+
+@timed('store_events')
+def store_new_events(items):
+    """Write items that are not stored yet and return the ones written.
+    
+    event_id is derived from the event itself, so a retried delivery maps
+    to the same key. Each write is conditional on the key being new;
+    BatchWriteItem takes no conditions, so the writes run in parallel on
+    store_executor instead.
+    
+    timestamp (the index sort key and get_events cursor position) is set
+    here, at write time. Queued deliveries are stored late and out of
+    order, and a record sorted behind a client's cursor is never returned.
+    """
+    now = time.time()
+    pending = [item for item in items if _seen.get(item['event_id'], 0) <= now]
+    
+    client = get_client('dynamodb')
+    stored = []
+    for item, is_new in zip(pending, store_executor.map(lambda item: _put_new_event(client, item), pending)):
+        if is_new:
+            stored.append(item)
+        
+        _seen[item['event_id']] = now + SEEN_EVENTS_TTL
+        _seen.move_to_end(item['event_id'])
+        while len(_seen) > SEEN_EVENTS_SIZE:
+            _seen.popitem(last=False)
+    
+    if len(stored) < len(items):
+        log.info("Dropped duplicate events", count=len(items) - len(stored))
+    return stored
+
+def _put_new_event(client, item):
+    """Write item unless its event_id is stored already; True if written."""
+    item['timestamp'] = int(time.time() * 1000)
+    try:
+        client.put_item(
+            TableName=EVENTS_TABLE_NAME,
+            Item=to_item(item),
+            ConditionExpression='attribute_not_exists(event_id)'
+        )
+        return True
+    except client_error() as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+        log.debug("Skipping duplicate event", event_id=item['event_id'])
+        return False
+
+def split_webhook_events(body, received_at):
+    """Split a webhook delivery into one record per messaging or change item"""
+    items = []
+    for entry in body.get('entry') or [body]:
+        sub_events = [('messaging', m) for m in entry.get('messaging') or []]
+        sub_events += [('changes', c) for c in entry.get('changes') or []]
+        
+        # Keep entries without messaging/changes so nothing is dropped
+        if not sub_events:
+            sub_events = [(None, None)]
+        
+        for kind, sub_event in sub_events:
+            # Store each item in the shape of a single-item entry
+            event_data = {k: v for k, v in entry.items() if k not in ('messaging', 'changes')}
+            if body.get('object'):
+                event_data['object'] = body['object']
+            if kind:
+                event_data[kind] = [sub_event]
+            
+            event_type = get_event_type(kind, sub_event)
+            item = {
+                'event_id': get_event_id(entry, kind, sub_event, event_type, event_data),
+                'event_data': encode_event_data(event_data),
+                'event_type': event_type,
+                'received_at': received_at
+            }
+            
+            if EVENTS_RETENTION_DAYS > 0:
+                # TTL attribute, in epoch seconds
+                item['expires_at'] = received_at // 1000 + EVENTS_RETENTION_DAYS * 86400
+            
+            user_id = get_owner_id(entry, kind, sub_event)
+            if user_id:
+                item['user_id'] = str(user_id)
+            
+            sender_id = get_sender_id(kind, sub_event)
+            if sender_id:
+                item['sender_id'] = str(sender_id)
+            
+            event_time = (sub_event or {}).get('timestamp') or entry.get('time')
+            if event_time:
+                # Meta sends some times in seconds and others in milliseconds
+                event_time = int(event_time)
+                item['event_time'] = event_time * 1000 if event_time < 10**11 else event_time
+            
+            items.append(item)
+    return items
+
+def get_event_id(entry, kind, sub_event, event_type, event_data):
+    """Return a stable ID for an event, the same for every delivery of it"""
+    if kind == 'messaging':
+        # Reactions and edits carry the mid of the message they target, so
+        # the type and time tell them apart
+        for field in ('message', 'message_edit', 'reaction', 'read', 'postback'):
+            mid = (sub_event.get(field) or {}).get('mid')
+            if mid:
+                key = f"{event_type}:{mid}:{sub_event.get('timestamp', '')}"
+                break
+        else:
+            key = f"messaging:{json.dumps(sub_event, sort_keys=True)}"
+    elif kind == 'changes':
+        # Changes carry no ID; entry id + time plus the change itself
+        digest = hashlib.sha1(json.dumps(sub_event, sort_keys=True).encode()).hexdigest()
+        key = f"{event_type}:{entry.get('id', '')}:{entry.get('time', '')}:{digest}"
+    else:
+        key = f"entry:{json.dumps(event_data, sort_keys=True)}"
+    return str(uuid.uuid5(EVENT_ID_NAMESPACE, key))
+
+def get_owner_id(entry, kind, sub_event):
+    """Return the Instagram account the event belongs to"""
+    # entry.id is the business account that received the webhook
+    if entry.get('id'):
+        return entry['id']
+    if kind == 'messaging':
+        # Echoes are sent by the business account itself
+        if sub_event.get('message', {}).get('is_echo'):
+            return sub_event.get('sender', {}).get('id')
+        return sub_event.get('recipient', {}).get('id')
+    if kind == 'changes':
+        return (sub_event.get('value') or {}).get('from', {}).get('id')
+    return None
+
+def get_sender_id(kind, sub_event):
+    """Return the ID of whoever triggered the event"""
+    if kind == 'messaging':
+        return sub_event.get('sender', {}).get('id')
+    if kind == 'changes':
+        return (sub_event.get('value') or {}).get('from', {}).get('id')
+    return None
+
+def get_event_type(kind, sub_event):
+    """Classify a messaging or change item"""
+    if kind == 'changes':
+        return sub_event.get('field') or 'change'
+    if kind == 'messaging':
+        if 'message' in sub_event:
+            return 'message_echo' if sub_event['message'].get('is_echo') else 'message'
+        for event_type in ('reaction', 'read', 'postback', 'message_edit', 'referral', 'optin'):
+            if event_type in sub_event:
+                return event_type
+        return 'messaging'
+    return 'unknown'
+
+def extract_user_id(event_data):
+    """Extract Instagram user ID from webhook event if possible"""
+    try:
+        for entry in event_data.get('entry') or [event_data]:
+            for kind in ('messaging', 'changes'):
+                for sub_event in entry.get(kind) or []:
+                    user_id = get_owner_id(entry, kind, sub_event)
+                    if user_id:
+                        return user_id
+            if entry.get('id'):
+                return entry['id']
+    except Exception as e:
+        log.warning("Error extracting user_id", error=str(e))
+    
+    return None
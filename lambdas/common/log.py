@@ -0,0 +1,149 @@
+import json
+import os
+import random
+import re
+import sys
+import time
+import traceback
+
+# DEBUG, INFO, WARNING or ERROR
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+# Fraction of invocations whose request summary is logged, per route:
+#   LOG_SAMPLE_RATES="webhook=0.01,get_events=0.05"
+# Routes not listed use LOG_SAMPLE_RATE. Warnings and errors are never sampled.
+LOG_SAMPLE_RATE = float(os.environ.get('LOG_SAMPLE_RATE', '0.1'))
+LOG_SAMPLE_RATES = {
+    route.strip(): float(rate)
+    for route, _, rate in (pair.partition('=') for pair in os.environ.get('LOG_SAMPLE_RATES', '').split(','))
+    if route.strip() and rate
+}
+LOG_MAX_FIELD_CHARS = int(os.environ.get('LOG_MAX_FIELD_CHARS', '512'))
+LOG_MAX_LINE_CHARS = int(os.environ.get('LOG_MAX_LINE_CHARS', '4096'))
+
+LEVELS = {'DEBUG': 10, 'INFO': 20, 'WARNING': 30, 'ERROR': 40}
+
+# Keys whose values are never logged (compared lowercase)
+SECRET_KEYS = {
+    'access_token', 'client_secret', 'token', 'verify_token', 'hub.verify_token',
+    'authorization', 'cookie', 'password', 'appsecret_proof',
+    'x-hub-signature', 'x-hub-signature-256'
+}
+# Secrets embedded in URLs, query strings and raw JSON bodies
+SECRET_PARAMS = ('access_token', 'client_secret', 'verify_token')
+SECRET_JSON_KEYS = SECRET_PARAMS + ('token',)
+REDACTED = '[REDACTED]'
+
+_loggers = {}
+
+def secret_patterns(params, json_keys):
+    """Regexes for name=value query parameters and "name": "value" JSON pairs.
+    
+    Names must match exactly, so error_code=4 is kept when code is secret.
+    """
+    return (re.compile(r'(?<![\w.])((?:%s)=)[^&\s"\']+' % '|'.join(map(re.escape, params))),
+            re.compile(r'("(?:%s)"\s*:\s*")[^"]*' % '|'.join(map(re.escape, json_keys))))
+
+SECRET_PATTERNS = secret_patterns(SECRET_PARAMS, SECRET_JSON_KEYS)
+
+def redact(value, depth=0, secret_keys=SECRET_KEYS, patterns=SECRET_PATTERNS):
+    """Return value with secrets replaced and long strings and lists cut down."""
+    if isinstance(value, dict):
+        if depth > 6:
+            return '{...}'
+        return {k: REDACTED if str(k).lower() in secret_keys else redact(v, depth + 1, secret_keys, patterns)
+                for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        items = [redact(v, depth + 1, secret_keys, patterns) for v in value[:20]]
+        if len(value) > 20:
+            items.append(f"... {len(value) - 20} more")
+        return items
+    if isinstance(value, str):
+        for pattern in patterns:
+            value = pattern.sub(r'\1' + REDACTED, value)
+        if len(value) > LOG_MAX_FIELD_CHARS:
+            return f"{value[:LOG_MAX_FIELD_CHARS]}... ({len(value)} chars)"
+    return value
+
+class Logger:
+    """Writes one JSON object per line to stdout (CloudWatch Logs).
+    
+    Field values may be callables; they are called only if the line is
+    emitted, so expensive dumps cost nothing when filtered out.
+    """
+    
+    def __init__(self, route, secrets=()):
+        self.route = route
+        # Extra secret names for this route, e.g. the OAuth code in exchange_token
+        self.secret_keys = SECRET_KEYS | set(secrets)
+        self.patterns = secret_patterns(SECRET_PARAMS + tuple(secrets), SECRET_JSON_KEYS + tuple(secrets)) if secrets else SECRET_PATTERNS
+        self.level = LEVELS.get(LOG_LEVEL, 20)
+        self.sample_rate = LOG_SAMPLE_RATES.get(route, LOG_SAMPLE_RATE)
+    
+    def debug(self, msg, **fields):
+        if self.level <= 10:
+            self._emit('DEBUG', msg, fields)
+    
+    def info(self, msg, **fields):
+        if self.level <= 20:
+            self._emit('INFO', msg, fields)
+    
+    def warning(self, msg, **fields):
+        if self.level <= 30:
+            self._emit('WARNING', msg, fields)
+    
+    def error(self, msg, **fields):
+        self._emit('ERROR', msg, fields)
+    
+    def exception(self, msg, **fields):
+        """Log an error with the current exception's traceback."""
+        fields['traceback'] = lambda: traceback.format_exc(limit=5)
+        self._emit('ERROR', msg, fields)
+    
+    def request(self, event):
+        """Log a sampled summary of an API Gateway event.
+        
+        Logs method, path and redacted query parameters plus the body size;
+        the body itself only at DEBUG.
+        """
+        if self.level > 20 or random.random() >= self.sample_rate:
+            return
+        fields = {
+            'method': event.get('httpMethod') or event.get('requestContext', {}).get('httpMethod'),
+            'path': event.get('path'),
+            'query': event.get('queryStringParameters'),
+            'body_bytes': len(event.get('body') or ''),
+            'request_id': event.get('requestContext', {}).get('requestId'),
+            'sample_rate': self.sample_rate
+        }
+        fields = {k: v for k, v in fields.items() if v is not None}
+        if 'Records' in event:
+            fields['records'] = len(event['Records'])
+        if self.level <= 10:
+            fields['body'] = event.get('body')
+        self._emit('INFO', 'Request', fields)
+    
+    def _emit(self, level, msg, fields):
+        record = {'level': level, 'route': self.route, 'msg': msg, 'ts': int(time.time() * 1000)}
+        for key, value in fields.items():
+            if callable(value):
+                try:
+                    value = value()
+                except Exception as e:
+                    value = f"<unavailable: {e}>"
+            record[key] = redact(value, secret_keys=self.secret_keys, patterns=self.patterns)
+        
+        line = json.dumps(record, default=str, separators=(',', ':'))
+        if len(line) > LOG_MAX_LINE_CHARS:
+            line = json.dumps({'level': level, 'route': self.route, 'msg': msg, 'ts': record['ts'],
+                               'truncated': line[:LOG_MAX_LINE_CHARS]}, separators=(',', ':'))
+        sys.stdout.write(line + '\n')
+
+def get_logger(route, secrets=()):
+    """Return the logger for route (usually the handler name), created once.
+    
+    secrets names extra keys and parameters to redact in this route's lines.
+    """
+    logger = _loggers.get(route)
+    if logger is None:
+        logger = _loggers[route] = Logger(route, secrets)
+    return logger
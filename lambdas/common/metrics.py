@@ -0,0 +1,129 @@
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# Per-invocation phase timings and counters, written as one CloudWatch
+# embedded metric format (EMF) line when the handler returns
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true') == 'true'
+METRICS_NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'InstaAI')
+
+# Counter units for EMF; anything else is a Count
+COUNTER_UNITS = {'payload_bytes': 'Bytes'}
+
+_lock = threading.Lock()
+_timings = {}
+_counts = {}
+
+def record_time(phase, ms):
+    """Add ms to phase for the current invocation."""
+    with _lock:
+        _timings[phase] = _timings.get(phase, 0.0) + ms
+        _counts[f"{phase}_calls"] = _counts.get(f"{phase}_calls", 0) + 1
+
+def count(name, value=1):
+    """Add value to counter name for the current invocation."""
+    if not value:
+        return
+    with _lock:
+        _counts[name] = _counts.get(name, 0) + value
+
+@contextmanager
+def span(phase):
+    """Time the enclosed block as phase; repeated spans add up."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_time(phase, (time.perf_counter() - start) * 1000)
+
+def timed(phase):
+    """Decorator form of span."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(phase):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def instrument(function_name):
+    """Wrap a lambda_handler: reset metrics, time it, and emit one EMF line."""
+    def decorator(handler):
+        @functools.wraps(handler)
+        def wrapper(event, context):
+            reset()
+            start = time.perf_counter()
+            status = None
+            try:
+                result = handler(event, context)
+                if isinstance(result, dict):
+                    status = result.get('statusCode')
+                return result
+            finally:
+                total_ms = (time.perf_counter() - start) * 1000
+                if METRICS_ENABLED:
+                    emit(function_name, total_ms, status)
+        return wrapper
+    return decorator
+
+def reset():
+    with _lock:
+        _timings.clear()
+        _counts.clear()
+
+def snapshot():
+    """Return (timings, counts) for the current invocation."""
+    with _lock:
+        return dict(_timings), dict(_counts)
+
+def emit(function_name, total_ms, status=None):
+    """Write the current invocation's metrics as an EMF log line."""
+    timings, counts = snapshot()
+    record = {'Function': function_name, 'total_ms': round(total_ms, 2)}
+    metrics = [{'Name': 'total_ms', 'Unit': 'Milliseconds'}]
+    for phase, ms in sorted(timings.items()):
+        record[f"{phase}_ms"] = round(ms, 2)
+        metrics.append({'Name': f"{phase}_ms", 'Unit': 'Milliseconds'})
+    for name, value in sorted(counts.items()):
+        record[name] = round(value, 2) if isinstance(value, float) else value
+        metrics.append({'Name': name, 'Unit': COUNTER_UNITS.get(name, 'Count')})
+    if status is not None:
+        # A property, not a dimension, to keep metric cardinality low
+        record['status'] = status
+    
+    record['_aws'] = {
+        'Timestamp': int(time.time() * 1000),
+        'CloudWatchMetrics': [{
+            'Namespace': METRICS_NAMESPACE,
+            'Dimensions': [['Function']],
+            'Metrics': metrics
+        }]
+    }
+    sys.stdout.write(json.dumps(record, separators=(',', ':')) + '\n')
+
+# DynamoDB operations: reads and writes report capacity units separately
+_DDB_READS = {'GetItem', 'BatchGetItem', 'Query', 'Scan', 'TransactGetItems'}
+_DDB_CAPACITY_OPS = _DDB_READS | {'PutItem', 'UpdateItem', 'DeleteItem', 'BatchWriteItem', 'TransactWriteItems'}
+
+def _request_capacity(params, model, **kwargs):
+    if model.name in _DDB_CAPACITY_OPS:
+        params.setdefault('ReturnConsumedCapacity', 'TOTAL')
+
+def _record_capacity(parsed, model, **kwargs):
+    if model.name not in _DDB_CAPACITY_OPS:
+        return
+    consumed = parsed.get('ConsumedCapacity') or []
+    if isinstance(consumed, dict):
+        consumed = [consumed]
+    units = sum(c.get('CapacityUnits', 0) for c in consumed)
+    count('ddb_read_units' if model.name in _DDB_READS else 'ddb_write_units', units)
+    count('ddb_calls')
+
+def instrument_dynamodb_client(client):
+    """Make a DynamoDB client report consumed capacity into the metrics."""
+    client.meta.events.register('provide-client-params.dynamodb.*', _request_capacity)
+    client.meta.events.register('after-call.dynamodb.*', _record_capacity)
@@ -0,0 +1,118 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from common import governor, graph
+from common.log import get_logger
+
+log = get_logger('paging')
+
+MAX_PAGE_LIMIT = 100
+# Prefetched pages are kept this long for the client's next request
+PREFETCH_TTL = int(os.environ.get('GRAPH_PREFETCH_TTL', '30'))  # seconds
+PREFETCH_ENABLED = os.environ.get('GRAPH_PREFETCH', 'true') == 'true'
+
+# Shares the Graph connection pool size, reused across warm invocations
+executor = ThreadPoolExecutor(max_workers=graph.MAX_WORKERS)
+
+# (url, sorted params) -> (future, expires_at)
+_prefetched = {}
+
+def parse_limit(value):
+    """Return the page size for a limit query parameter, or None if unset.
+    
+    Raises ValueError unless value is a positive integer.
+    """
+    if not value:
+        return None
+    limit = int(value)
+    if limit < 1:
+        raise ValueError(f"limit must be positive: {value}")
+    return min(limit, MAX_PAGE_LIMIT)
+
+def page_params(params, limit=None, after=None):
+    """Return a copy of params with a capped limit and an after cursor."""
+    params = dict(params)
+    if limit:
+        params['limit'] = min(int(limit), MAX_PAGE_LIMIT)
+    if after:
+        params['after'] = after
+    return params
+
+def fetch_page(url, params, account=None):
+    """Fetch one page of a Graph edge, returning (status_code, result).
+    
+    A page prefetched by an earlier call is used if it is still fresh.
+    """
+    entry = _prefetched.pop(_key(url, params), None)
+    if entry and entry[1] > time.time():
+        try:
+            return entry[0].result()
+        except Exception as e:
+            log.warning("Prefetched page failed, fetching again", error=str(e))
+    return _get(url, params, account)
+
+def prefetch_next(url, params, result, account=None):
+    """Start fetching the page after result in the background.
+    
+    Skipped when the account is close to its Graph rate limit.
+    """
+    after = next_cursor(result)
+    if not after or not PREFETCH_ENABLED:
+        return
+    if governor.should_defer(account, governor.BACKGROUND):
+        log.info("Deferring prefetch", account=account, usage=lambda: round(governor.get_usage(account)))
+        return
+    
+    now = time.time()
+    for key in [k for k, (_, expires_at) in _prefetched.items() if expires_at <= now]:
+        _prefetched.pop(key, None)
+    
+    next_params = page_params(params, after=after)
+    key = _key(url, next_params)
+    if key not in _prefetched:
+        _prefetched[key] = (executor.submit(_get, url, next_params, account), now + PREFETCH_TTL)
+
+def iter_pages(url, params, max_pages=1, prefetch=True, account=None):
+    """Yield (status_code, result) for up to max_pages pages of a Graph edge.
+    
+    Follows paging.cursors.after. With prefetch, the next page is requested
+    while the caller processes the current one; the last page's successor
+    is kept for the client's next request.
+    """
+    status_code, result = fetch_page(url, params, account)
+    pages = 1
+    while True:
+        if prefetch and status_code == 200:
+            prefetch_next(url, params, result, account)
+        yield status_code, result
+        
+        after = next_cursor(result) if status_code == 200 else None
+        if not after or pages >= max_pages:
+            return
+        params = page_params(params, after=after)
+        status_code, result = fetch_page(url, params, account)
+        pages += 1
+
+def next_cursor(result):
+    """Return the after cursor if Graph reports another page."""
+    paging = result.get('paging') or {}
+    if 'next' not in paging:
+        return None
+    return (paging.get('cursors') or {}).get('after')
+
+def page_info(result):
+    """Paging info safe to return to API clients.
+    
+    Graph's next/previous URLs embed the access token, so only the
+    cursor is exposed.
+    """
+    after = next_cursor(result)
+    return {'after': after, 'has_more': after is not None}
+
+def _get(url, params, account=None):
+    response = graph.get(url, params=params, account=account)
+    return response.status_code, (response.json() if response.text else {})
+
+def _key(url, params):
+    return (url, tuple(sorted((k, str(v)) for k, v in params.items())))
@@ -0,0 +1,41 @@
+import os
+import time
+
+# Default per-account send rate; Graph allows bursts but throttles sustained sends
+SEND_RATE_PER_SECOND = float(os.environ.get('SEND_RATE_PER_SECOND', '5'))
+SEND_BURST = int(os.environ.get('SEND_BURST', '10'))
+
+class TokenBucket:
+    """Async token bucket: `rate` tokens per second, holding at most `capacity`."""
+    
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+    
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+    
+    async def acquire(self):
+        """Wait until a token is available, then take it."""
+        # The event loop is running, so asyncio is already loaded
+        import asyncio
+        while True:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+# user_id -> TokenBucket, kept for the lifetime of the warm container
+_buckets = {}
+
+def get_send_bucket(user_id):
+    """Return the send token bucket for an account."""
+    bucket = _buckets.get(user_id)
+    if bucket is None:
+        bucket = _buckets[user_id] = TokenBucket(SEND_RATE_PER_SECOND, SEND_BURST)
+    return bucket
@@ -0,0 +1,176 @@
+import base64
+import hashlib
+import json
+import re
+from datetime import date, datetime
+from decimal import Decimal
+from email.utils import formatdate
+
+from common import metrics
+
+# orjson is several times faster on large event and message payloads;
+# the stdlib encoder is the fallback when it is not packaged
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+PREFLIGHT_ALLOW_HEADERS = "Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token,If-None-Match"
+
+# Versioned ETags carry the watermark (ms) a response was built at and a
+# hash of the request it answers: W/"<version>-<scope hash>-<body hash>"
+VERSIONED_ETAG_PATTERN = re.compile(r'W/"(\d+)-([0-9a-f]{8})-[0-9a-f]+"')
+
+_header_cache = {}
+
+def _default(obj):
+    """Encode types the JSON backends don't handle natively."""
+    if isinstance(obj, Decimal):
+        # DynamoDB numbers: keep integers exact instead of going through float
+        return int(obj) if obj == obj.to_integral_value() else float(obj)
+    if isinstance(obj, (bytes, bytearray)):
+        return base64.b64encode(obj).decode('ascii')
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    # boto3 Binary
+    if hasattr(obj, 'value') and isinstance(obj.value, bytes):
+        return base64.b64encode(obj.value).decode('ascii')
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+def dumps(data):
+    """Serialize data to a compact JSON string."""
+    if orjson is not None:
+        return orjson.dumps(data, default=_default, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+    return json.dumps(data, default=_default, separators=(',', ':'))
+
+def headers(methods=None, content_type='application/json'):
+    """Return the CORS headers for methods, built once and shared.
+    
+    The returned dict is shared between responses; copy it before adding
+    headers (json_response() does this when given extra headers).
+    """
+    key = (methods, content_type)
+    cached = _header_cache.get(key)
+    if cached is None:
+        cached = {
+            "Content-Type": content_type,
+            "Access-Control-Allow-Origin": "*"
+        }
+        if methods:
+            cached["Access-Control-Allow-Methods"] = methods
+        _header_cache[key] = cached
+    return cached
+
+def json_response(status_code, data, methods=None, extra_headers=None):
+    """Build an API Gateway proxy response with a JSON body."""
+    with metrics.span('serialize'):
+        body = dumps(data)
+    return _body_response(status_code, body, methods, extra_headers)
+
+def _body_response(status_code, body, methods=None, extra_headers=None):
+    response_headers = headers(methods)
+    if extra_headers:
+        response_headers = {**response_headers, **extra_headers}
+    metrics.count('payload_bytes', len(body))
+    return {
+        'statusCode': status_code,
+        'headers': response_headers,
+        'body': body
+    }
+
+def request_header(event, name):
+    """Return a request header by case-insensitive name, or None."""
+    name = name.lower()
+    for key, value in (event.get('headers') or {}).items():
+        if key.lower() == name:
+            return value
+    return None
+
+def _scope_hash(scope):
+    return hashlib.sha1(scope.encode('utf-8')).hexdigest()[:8]
+
+def make_etag(body, version=None, scope=''):
+    """ETag for a response body; versioned if built at watermark version."""
+    digest = hashlib.sha1(body.encode('utf-8')).hexdigest()[:16]
+    if version is None:
+        return f'"{digest}"'
+    return f'W/"{int(version)}-{_scope_hash(scope)}-{digest}"'
+
+def cached_version(event, scope=''):
+    """Return (version, etag) from the client's If-None-Match, or (None, None).
+    
+    Only versioned ETags issued for the same scope count, so a handler can
+    compare the version with its watermark and answer 304 without building
+    the response.
+    """
+    for tag in (request_header(event, 'If-None-Match') or '').split(','):
+        match = VERSIONED_ETAG_PATTERN.fullmatch(tag.strip())
+        if match and match.group(2) == _scope_hash(scope):
+            return int(match.group(1)), match.group(0)
+    return None, None
+
+def _etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    # Weak comparison: W/"x" and "x" match
+    bare = etag[2:] if etag.startswith('W/') else etag
+    for tag in if_none_match.split(','):
+        tag = tag.strip()
+        if tag == '*' or (tag[2:] if tag.startswith('W/') else tag) == bare:
+            return True
+    return False
+
+def cache_headers(etag, last_modified_ms=None):
+    """Validator headers; clients must revalidate before reusing a body."""
+    cached = {
+        'ETag': etag,
+        'Cache-Control': 'no-cache',
+        'Access-Control-Expose-Headers': 'ETag, Last-Modified'
+    }
+    if last_modified_ms:
+        cached['Last-Modified'] = formatdate(int(last_modified_ms) / 1000, usegmt=True)
+    return cached
+
+def not_modified_response(etag, methods=None, last_modified_ms=None):
+    """304 for a client whose cached copy (etag) is still current."""
+    return {
+        'statusCode': 304,
+        'headers': {**headers(methods), **cache_headers(etag, last_modified_ms)},
+        'body': ''
+    }
+
+def conditional_json_response(event, status_code, data, methods=None, version=None, scope='', last_modified_ms=None):
+    """json_response with an ETag, answering 304 if If-None-Match matches it.
+    
+    With version (a watermark in ms the data is current as of) the ETag is
+    versioned for scope; see cached_version().
+    """
+    with metrics.span('serialize'):
+        body = dumps(data)
+    etag = make_etag(body, version, scope)
+    if _etag_matches(request_header(event, 'If-None-Match'), etag):
+        return not_modified_response(etag, methods, last_modified_ms)
+    return _body_response(status_code, body, methods, cache_headers(etag, last_modified_ms))
+
+def preflight_response(methods):
+    """Answer a CORS preflight (OPTIONS) request."""
+    return {
+        'statusCode': 200,
+        'headers': {
+            "Access-Control-Allow-Origin": "*",
+            "Access-Control-Allow-Methods": methods,
+            "Access-Control-Allow-Headers": PREFLIGHT_ALLOW_HEADERS,
+            "Access-Control-Max-Age": "86400"
+        },
+        'body': ""
+    }
+
+def text_response(status_code, text, methods=None):
+    """Build an API Gateway proxy response with a plain-text body."""
+    return {
+        'statusCode': status_code,
+        'headers': headers(methods, 'text/plain'),
+        'body': text
+    }
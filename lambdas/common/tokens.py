@@ -0,0 +1,70 @@
+import os
+import time
+from collections import OrderedDict
+
+from common.aws import from_item, get_client, to_item
+from common.log import get_logger
+from common.metrics import timed
+
+log = get_logger('tokens')
+
+TOKEN_TABLE_NAME = os.environ.get('TOKEN_TABLE_NAME', 'InstaAI-Tokens')
+# Cached items are re-read after this long, which is also how soon a token
+# stored or deleted through another container is noticed
+TOKEN_CACHE_TTL = float(os.environ.get('TOKEN_CACHE_TTL', '5'))  # seconds
+TOKEN_CACHE_SIZE = int(os.environ.get('TOKEN_CACHE_SIZE', '256'))
+
+# user_id -> (item or None, token_version, expires_at). Lives for the
+# lifetime of the warm container; None marks a missing or deleted user.
+_cache = OrderedDict()
+
+@timed('token_lookup')
+def get_token_item(user_id):
+    """Return the token item for user_id, or None if missing or deleted.
+    
+    Lookups are served from an in-process LRU cache for TOKEN_CACHE_TTL
+    seconds, then the whole item is read again (a projected read of
+    token_version alone costs the same). Deleted users (is_deleted) are
+    cached as negative entries. ClientError from DynamoDB is raised to the
+    caller.
+    """
+    user_id = str(user_id)
+    now = time.time()
+    
+    cached = _cache.get(user_id)
+    if cached and cached[2] > now:
+        _cache.move_to_end(user_id)
+        return cached[0]
+    
+    response = get_client('dynamodb').get_item(TableName=TOKEN_TABLE_NAME, Key=to_item({'user_id': user_id}))
+    item = from_item(response.get('Item'))
+    version = int(item.get('token_version', 0)) if item else None
+    if item and item.get('is_deleted'):
+        item = None
+    
+    # store_token and delete_user bump token_version
+    if cached and cached[1] != version:
+        log.info("Token version changed", user_id=user_id, old_version=cached[1], new_version=version)
+    
+    _cache[user_id] = (item, version, now + TOKEN_CACHE_TTL)
+    _cache.move_to_end(user_id)
+    while len(_cache) > TOKEN_CACHE_SIZE:
+        _cache.popitem(last=False)
+    
+    return item
+
+def get_access_token(user_id):
+    """Return the cached access token for user_id, or None."""
+    item = get_token_item(user_id)
+    return item.get('access_token') if item else None
+
+def invalidate_token(user_id):
+    """Drop user_id from this container's cache.
+    
+    Other containers read the item again within TOKEN_CACHE_TTL.
+    """
+    _cache.pop(str(user_id), None)
+
+def is_token_error(error):
+    """True if a Graph API error means the stored token is no longer valid."""
+    return isinstance(error, dict) and error.get('code') == 190
@@ -1,21 +1,22 @@
 import json
-import boto3
 import os
-import logging
 from datetime import datetime
+from common.aws import get_table
+from common.tokens import invalidate_token
+from common.response import json_response
+from common.log import get_logger
+from common.metrics import instrument
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
+log = get_logger('delete_user')
 
-# Initialize DynamoDB client and table
-dynamodb = boto3.resource('dynamodb')
 TOKEN_TABLE_NAME = os.environ.get('TOKEN_TABLE_NAME', 'InstaAI-Tokens')
-token_table = dynamodb.Table(TOKEN_TABLE_NAME)
 
+CORS_METHODS = "POST, OPTIONS"
+
+@instrument('delete_user')
 def lambda_handler(event, context):
     try:
-        logger.info(f"Received event: {json.dumps(event)}")
+        log.request(event)
         
         # Parse the request body
         body = json.loads(event.get('body', '{}'))
@@ -26,46 +27,36 @@ def lambda_handler(event, context):
         
         # Validate required parameters
         if not user_id:
-            return build_response(400, {'error': 'Missing user_id parameter'})
+            return json_response(400, {'error': 'Missing user_id parameter'}, CORS_METHODS)
         
         # Get item from the table
-        response = token_table.get_item(Key={'user_id': user_id})
+        response = get_table(TOKEN_TABLE_NAME).get_item(Key={'user_id': user_id})
         
         # Check if user exists
         item = response.get('Item')
         if not item:
-            return build_response(404, {'error': 'User not found'})
+            return json_response(404, {'error': 'User not found'}, CORS_METHODS)
         
         # Update the item with is_deleted flag
-        update_response = token_table.update_item(
+        update_response = get_table(TOKEN_TABLE_NAME).update_item(
             Key={'user_id': user_id},
-            UpdateExpression="set is_deleted = :d, updated_at = :u",
+            UpdateExpression="set is_deleted = :d, updated_at = :u add token_version :one",
             ExpressionAttributeValues={
                 ':d': is_deleted,
-                ':u': datetime.now().isoformat()
+                ':u': datetime.now().isoformat(),
+                ':one': 1
             },
             ReturnValues="UPDATED_NEW"
         )
+        invalidate_token(user_id)
         
-        logger.info(f"Update response: {update_response}")
+        log.info("User updated", user_id=user_id, attributes=update_response.get('Attributes'))
         
-        return build_response(200, {
+        return json_response(200, {
             'success': True,
             'message': 'User marked as deleted' if is_deleted else 'User deletion status updated'
-        })
+        }, CORS_METHODS)
         
     except Exception as e:
-        logger.exception(f"Error in delete_user: {str(e)}")
-        return build_response(500, {'error': str(e)})
-
-def build_response(status_code, body):
-    """Build a proper API response"""
-    return {
-        'statusCode': status_code,
-        'headers': {
-            'Content-Type': 'application/json',
-            'Access-Control-Allow-Origin': '*',
-            'Access-Control-Allow-Methods': 'POST, OPTIONS'
-        },
-        'body': json.dumps(body)
-    }
\ No newline at end of file
+        log.exception("Error in delete_user", error=str(e))
+        return json_response(500, {'error': str(e)}, CORS_METHODS)
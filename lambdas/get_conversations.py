@@ -1,117 +1,109 @@
-import json
-import os
-import boto3
-import requests
-from botocore.exceptions import ClientError
+from common import governor
+from common.aws import client_error
+from common.paging import fetch_page, page_info, page_params, parse_limit, prefetch_next
+from common.conversations_cache import get_cached_conversations, put_cached_conversations, now_ms
+from common.tokens import get_token_item, invalidate_token, is_token_error
+from common.response import cached_version, conditional_json_response, json_response, not_modified_response
+from common.log import get_logger
+from common.metrics import instrument
 
-# Initialize DynamoDB client and table
-dynamodb = boto3.resource('dynamodb')
-TOKEN_TABLE_NAME = os.environ.get('TOKEN_TABLE_NAME', 'InstaAI-Tokens')
-token_table = dynamodb.Table(TOKEN_TABLE_NAME)
+log = get_logger('get_conversations')
 
+CORS_METHODS = "GET, OPTIONS"
+
+@instrument('get_conversations')
 def lambda_handler(event, context):
     try:
-        print("Received Event:", json.dumps(event))
+        log.request(event)
         
         # Parse query parameters from the event
         query_params = event.get('queryStringParameters') or {}
         user_id = query_params.get('user_id')
+        after = query_params.get('after')
         
         if not user_id:
-            return {
-                'statusCode': 400,
-                'headers': {
-                    "Content-Type": "application/json",
-                    "Access-Control-Allow-Origin": "*",
-                    "Access-Control-Allow-Methods": "GET, OPTIONS"
-                },
-                'body': json.dumps({'error': 'Missing user_id parameter'})
-            }
+            return json_response(400, {'error': 'Missing user_id parameter'}, CORS_METHODS)
+        
+        try:
+            limit = parse_limit(query_params.get('limit'))
+        except ValueError:
+            return json_response(400, {'error': 'Invalid limit parameter'}, CORS_METHODS)
         
         # Ensure user_id is a string (DynamoDB key)
         user_id = str(user_id)
         
-        # Retrieve the stored access token from DynamoDB
+        # Retrieve the stored access token (cached across warm invocations)
         try:
-            response = token_table.get_item(Key={'user_id': user_id})
-            item = response.get('Item')
+            item = get_token_item(user_id)
             
             if not item:
-                return {
-                    'statusCode': 404,
-                    'headers': {
-                        "Content-Type": "application/json",
-                        "Access-Control-Allow-Origin": "*"
-                    },
-                    'body': json.dumps({'error': 'User token not found'})
-                }
+                return json_response(404, {'error': 'User token not found'})
                 
             access_token = item.get('access_token')
             if not access_token:
-                return {
-                    'statusCode': 401,
-                    'headers': {
-                        "Content-Type": "application/json",
-                        "Access-Control-Allow-Origin": "*"
-                    },
-                    'body': json.dumps({'error': 'Access token not found'})
-                }
-        except ClientError as e:
-            print(f"Error retrieving token: {e}")
-            return {
-                'statusCode': 500,
-                'headers': {
-                    "Content-Type": "application/json",
-                    "Access-Control-Allow-Origin": "*"
-                },
-                'body': json.dumps({'error': str(e)})
-            }
+                return json_response(401, {'error': 'Access token not found'})
+        except client_error() as e:
+            log.error("Error retrieving token", error=str(e))
+            return json_response(500, {'error': str(e)})
+        
+        # Serve the cached list unless a webhook has marked it dirty
+        # (refresh=true forces a Graph call). Near the Graph rate limit a
+        # stale list is served rather than spending calls on a refresh.
+        # Only the default first page is cached.
+        cached = None
+        if query_params.get('refresh') != 'true' and not limit and not after:
+            try:
+                cached = get_cached_conversations(
+                    user_id, allow_stale=governor.should_defer(user_id, governor.BACKGROUND))
+            except client_error() as e:
+                log.warning("Error reading conversations cache", error=str(e))
+        # Cached lists are versioned by fetched_at, so a client holding the
+        # same version gets a 304 without the list being serialized
+        scope = f"conversations:{user_id}"
+        if cached is not None:
+            conversations, fetched_at = cached
+            client_version, client_etag = cached_version(event, scope)
+            if client_version == fetched_at:
+                return not_modified_response(client_etag, CORS_METHODS, fetched_at)
+            log.info("Serving cached conversations", user_id=user_id)
+            return conditional_json_response(event, 200, conversations, CORS_METHODS,
+                                             version=fetched_at, scope=scope, last_modified_ms=fetched_at)
         
         # Build the Instagram Graph API URL for conversations
-        ig_api_url = "https://graph.instagram.com/v22.0/me/conversations"
-        params = {
+        ig_api_url = "me/conversations"
+        params = page_params({
             'platform': 'instagram',
             'fields': 'id,participants{id,username,profile_pic_url},updated_time',
             'access_token': access_token
-        }
+        }, limit, after)
         
         # Call the Instagram Graph API
-        api_response = requests.get(ig_api_url, params=params)
-        result = api_response.json()
-        print("Instagram API Response (truncated):", json.dumps(result)[:500])
+        fetched_at = now_ms()
+        status_code, result = fetch_page(ig_api_url, params, account=user_id)
+        log.debug("Graph response", status=status_code, body=lambda: result)
         
-        if api_response.status_code == 200:
-            return {
-                'statusCode': 200,
-                'headers': {
-                    "Content-Type": "application/json",
-                    "Access-Control-Allow-Origin": "*",
-                    "Access-Control-Allow-Methods": "GET, OPTIONS"
-                },
-                'body': json.dumps(result)
-            }
+        if status_code == 200:
+            # Start on the next page while this one is returned
+            prefetch_next(ig_api_url, params, result, account=user_id)
+            result['paging'] = page_info(result)
+            if not limit and not after:
+                try:
+                    put_cached_conversations(user_id, result, fetched_at)
+                except client_error() as e:
+                    log.warning("Error caching conversations", error=str(e))
+                return conditional_json_response(event, 200, result, CORS_METHODS,
+                                                 version=fetched_at, scope=scope, last_modified_ms=fetched_at)
+            return conditional_json_response(event, 200, result, CORS_METHODS)
         else:
             error_details = result.get('error', {})
-            return {
-                'statusCode': api_response.status_code,
-                'headers': {
-                    "Content-Type": "application/json",
-                    "Access-Control-Allow-Origin": "*"
-                },
-                'body': json.dumps({
-                    'error': error_details.get('message', 'Unknown error'),
-                    'error_code': error_details.get('code', 'unknown'),
-                    'error_subcode': error_details.get('error_subcode', 'unknown')
-                })
-            }
+            if is_token_error(error_details):
+                invalidate_token(user_id)
+            return json_response(status_code, {
+                'error': error_details.get('message', 'Unknown error'),
+                'error_code': error_details.get('code', 'unknown'),
+                'error_subcode': error_details.get('error_subcode', 'unknown')
+            })
             
     except Exception as e:
-        print(f"Lambda Error: {str(e)}")
-        return {
-            'statusCode': 500,
-            'headers': {
-                "Content-Type": "application/json",
-                "Access-Control-Allow-Origin": "*"
-            },
-            'body': json.dumps({'error': str(e)})
-        }
+        log.exception("Lambda Error", error=str(e))
+        return json_response(500, {'error': str(e)})
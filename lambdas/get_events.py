@@ -1,96 +1,271 @@
 import json
-import boto3
+import base64
 import os
+import time
 from datetime import datetime, timedelta
-from decimal import Decimal
+from common.archive import read_archived_events
+from common.aws import client_error, get_table
+from common.event_broker import get_event_broker
+from common.event_codec import decode_event_data
+from common.response import conditional_json_response, json_response
+from common.log import get_logger
+from common.metrics import instrument, span, timed
+
+log = get_logger('get_events')
 
-# Initialize DynamoDB client
-dynamodb = boto3.resource('dynamodb')
 EVENTS_TABLE_NAME = os.environ.get('EVENTS_TABLE_NAME', 'InstaAI-WebhookEvents')
-events_table = dynamodb.Table(EVENTS_TABLE_NAME)
+EVENTS_USER_INDEX = os.environ.get('EVENTS_USER_INDEX', 'user_id-timestamp-index')
+MAX_EVENTS = int(os.environ.get('MAX_EVENTS', '500'))
+# Longest a cursor poll may be held open waiting for new events; keep it
+# under the API Gateway (29s) and Lambda timeouts
+MAX_WAIT_SECONDS = float(os.environ.get('MAX_WAIT_SECONDS', '20'))
+# Cursor polls re-read this far behind the newest event already returned.
+# Events do not become visible in timestamp order (parallel writers, index
+# lag), so one stamped just before that event can show up after it; the
+# cursor remembers which events in the window it has returned
+CURSOR_OVERLAP_MS = int(os.environ.get('EVENTS_CURSOR_OVERLAP_MS', '5000'))
+# Event ID prefix kept in cursors to recognise returned events
+SEEN_ID_CHARS = 12
+# How long a stored event may take to show up in the user_id/timestamp
+# index (GSIs are eventually consistent). A cursor's event sequence only
+# proves it is current once a query ran at least this long after the
+# sequence was read
+EVENTS_INDEX_LAG_MS = int(os.environ.get('EVENTS_INDEX_LAG_MS', '1000'))
+
+CORS_METHODS = "GET, OPTIONS"
 
+@instrument('get_events')
 def lambda_handler(event, context):
     try:
-        print("Received Event:", json.dumps(event))
+        log.request(event)
         
         # Parse the request
         query_params = event.get('queryStringParameters', {}) or {}
         user_id = query_params.get('user_id')
-        last_minutes = int(query_params.get('last_minutes', '5'))
         
         if not user_id:
-            return {
-                'statusCode': 400,
-                'headers': {
-                    "Content-Type": "application/json",
-                    "Access-Control-Allow-Origin": "*",
-                    "Access-Control-Allow-Methods": "GET, OPTIONS"
-                },
-                'body': json.dumps({'error': 'Missing user_id parameter'})
-            }
+            return json_response(400, {'error': 'Missing user_id parameter'}, CORS_METHODS)
+        
+        try:
+            last_minutes = int(query_params.get('last_minutes') or 5)
+            limit = min(int(query_params.get('limit') or MAX_EVENTS), MAX_EVENTS)
+            if last_minutes < 0 or limit < 1:
+                raise ValueError
+        except ValueError:
+            return json_response(400, {'error': 'Invalid last_minutes or limit parameter'}, CORS_METHODS)
         
-        # Calculate timestamp for filtering events
-        filter_time = datetime.now() - timedelta(minutes=last_minutes)
-        filter_timestamp_ms = int(filter_time.timestamp() * 1000)  # Convert to milliseconds
+        # Ensure user_id is a string (index key)
+        user_id = str(user_id)
+        
+        # Historical range from the archive; never touches the events table
+        if query_params.get('archive') == 'true':
+            try:
+                # Nothing is archived before 1970 or after now
+                end_ms = min(int(query_params.get('end') or now_ms()), now_ms())
+                start_ms = max(int(query_params['start']), 0)
+                if start_ms >= end_ms:
+                    raise ValueError
+            except (KeyError, ValueError):
+                return json_response(400, {'error': 'archive queries need start (and optional end) in milliseconds, start before end and now'}, CORS_METHODS)
+            
+            records, has_more = read_archived_events(user_id, start_ms, end_ms, limit)
+            events = [record['event_data'] for record in records]
+            return conditional_json_response(event, 200, {
+                'events': events,
+                'count': len(events),
+                'has_more': has_more,
+                'source': 'archive'
+            }, CORS_METHODS)
         
-        # Scan for recent events related to this user
-        # Note: In a production environment, you should use a GSI with user_id
-        # and timestamp for more efficient querying
-        response = events_table.scan(
-            FilterExpression='#ts >= :ts AND contains(#data, :user_id)',
-            ExpressionAttributeNames={
-                '#ts': 'timestamp',
-                '#data': 'event_data'
-            },
-            ExpressionAttributeValues={
-                ':ts': filter_timestamp_ms,
-                ':user_id': user_id
-            }
-        )
+        # With a cursor, return only events newer than the client's high-watermark.
+        # Otherwise fall back to the last_minutes window.
+        cursor = query_params.get('cursor')
+        if cursor:
+            try:
+                cursor_ts, seen, cursor_seq, cursor_seq_at = decode_cursor(cursor)
+            except ValueError:
+                return json_response(400, {'error': 'Invalid cursor parameter'}, CORS_METHODS)
+            
+            # Skip the query entirely when the account's event sequence is
+            # the one the cursor was built at, i.e. nothing was stored since.
+            # A long poll holds the request until the sequence moves or wait
+            # runs out.
+            try:
+                wait = min(float(query_params.get('wait') or 0), MAX_WAIT_SECONDS)
+            except ValueError:
+                return json_response(400, {'error': 'Invalid wait parameter'}, CORS_METHODS)
+            # An unsettled cursor (seq_at set) was queried too soon after its
+            # sequence was read to have seen every event it counts
+            unsettled = cursor_seq_at is not None
+            seq, seq_at = read_event_seq(user_id, cursor_seq, 0 if unsettled else wait)
+            # Cursors from before the sequence existed, and accounts without
+            # one yet, always query
+            if seq and seq == cursor_seq:
+                if not unsettled:
+                    return conditional_json_response(event, 200, {
+                        'events': [],
+                        'count': 0,
+                        'next_cursor': cursor,
+                        'has_more': False
+                    }, CORS_METHODS)
+                # Query once more when the events it counts are surely indexed
+                delay_ms = cursor_seq_at + EVENTS_INDEX_LAG_MS - now_ms()
+                if delay_ms > 0:
+                    time.sleep(delay_ms / 1000)
+                seq_at = cursor_seq_at
+            
+            # Oldest first, so a truncated page still advances the cursor without gaps
+            queried_at = now_ms()
+            items = query_user_events(user_id, cursor_ts - CURSOR_OVERLAP_MS, limit + len(seen) + 1, newest_first=False)
+            items = [item for item in items if seen_key(item) not in seen]
+            has_more = len(items) > limit
+            # Respond newest first, like the windowed query
+            items = items[:limit][::-1]
+            if has_more:
+                # The rest of the page is still to come, so the next poll must query
+                seq = None
+        else:
+            # Calculate timestamp for filtering events
+            filter_time = datetime.now() - timedelta(minutes=last_minutes)
+            cursor_ts = int(filter_time.timestamp() * 1000)  # Convert to milliseconds
+            seen = {}
+            
+            # Put the account's event sequence in the first cursor too, so
+            # later polls can be skipped. It is read before the query:
+            # events stored meanwhile then move it past the cursor's.
+            seq, seq_at = read_event_seq(user_id)
+            
+            # Query the user_id/timestamp index for this user's recent events
+            queried_at = now_ms()
+            items = query_user_events(user_id, cursor_ts, limit)
+            has_more = False
         
-        # Get matching items
-        items = response.get('Items', [])
+        settled = queried_at - seq_at >= EVENTS_INDEX_LAG_MS
+        next_cursor = encode_cursor(items, cursor_ts, seen, seq, None if settled else seq_at)
         
         # Process events
         events = []
-        for item in items:
-            try:
-                # Parse event_data JSON string
-                event_data = json.loads(item.get('event_data', '{}'))
-                
-                # Add to events list
-                events.append(event_data)
-            except Exception as e:
-                print(f"Error parsing event data: {str(e)}")
-                # Skip invalid events
-                continue
+        with span('decode_events'):
+            for item in items:
+                try:
+                    # Decode event_data (compressed Binary or legacy JSON string)
+                    event_data = decode_event_data(item.get('event_data'))
+                    
+                    # Add to events list
+                    events.append(event_data)
+                except Exception as e:
+                    log.warning("Error parsing event data", event_id=item.get('event_id'), error=str(e))
+                    # Skip invalid events
+                    continue
         
-        # Return events
-        return {
-            'statusCode': 200,
-            'headers': {
-                "Content-Type": "application/json",
-                "Access-Control-Allow-Origin": "*",
-                "Access-Control-Allow-Methods": "GET, OPTIONS"
-            },
-            'body': json.dumps({
-                'events': events,
-                'count': len(events)
-            }, default=handle_decimal)
-        }
+        # Return events; an unchanged page gets a 304
+        return conditional_json_response(event, 200, {
+            'events': events,
+            'count': len(events),
+            'next_cursor': next_cursor,
+            'has_more': has_more
+        }, CORS_METHODS, last_modified_ms=int(items[0]['timestamp']) if items else None)
     except Exception as e:
-        print(f"Lambda Error: {str(e)}")
-        return {
-            'statusCode': 500,
-            'headers': {
-                "Content-Type": "application/json",
-                "Access-Control-Allow-Origin": "*"
-            },
-            'body': json.dumps({'error': str(e)})
-        }
+        log.exception("Lambda Error", error=str(e))
+        return json_response(500, {'error': str(e)})
 
-# Helper for DynamoDB Decimal serialization
-def handle_decimal(obj):
-    if isinstance(obj, Decimal):
-        return float(obj)
-    raise TypeError
\ No newline at end of file
+def now_ms():
+    return int(time.time() * 1000)
+
+def read_event_seq(user_id, after_seq=None, wait=0):
+    """Return (event sequence or None, ms when it was read) for user_id.
+    
+    With wait, hold until the sequence differs from after_seq or wait runs
+    out. A failed read returns None, which means running the query.
+    """
+    try:
+        if wait > 0:
+            with span('wait_events'):
+                seq = get_event_broker().wait(user_id, after_seq, wait)
+        else:
+            seq = get_event_broker().latest(user_id)
+    except client_error() as e:
+        # A throttled or failed read just means running the query
+        log.warning("Error reading events sequence", error=str(e))
+        seq = None
+    return seq, now_ms()
+
+@timed('query_events')
+def query_user_events(user_id, since_ms, limit, newest_first=True):
+    """Page through the user_id/timestamp index for events at or after since_ms."""
+    items = []
+    query_kwargs = {
+        'IndexName': EVENTS_USER_INDEX,
+        'KeyConditionExpression': '#uid = :user_id AND #ts >= :ts',
+        'ExpressionAttributeNames': {
+            '#uid': 'user_id',
+            '#ts': 'timestamp'
+        },
+        'ExpressionAttributeValues': {
+            ':user_id': user_id,
+            ':ts': since_ms
+        },
+        'ScanIndexForward': not newest_first
+    }
+    
+    while len(items) < limit:
+        query_kwargs['Limit'] = limit - len(items)
+        response = get_table(EVENTS_TABLE_NAME).query(**query_kwargs)
+        items.extend(response.get('Items', []))
+        
+        last_key = response.get('LastEvaluatedKey')
+        if not last_key:
+            break
+        query_kwargs['ExclusiveStartKey'] = last_key
+    
+    return items
+
+def seen_key(item):
+    """Short form of an event ID, as kept in cursors."""
+    return item['event_id'][:SEEN_ID_CHARS]
+
+def encode_cursor(items, cursor_ts, seen, seq=None, seq_at=None):
+    """Build the opaque cursor for the newest event in items.
+    
+    The cursor carries the high-watermark timestamp, the events returned
+    within CURSOR_OVERLAP_MS of it (seen: ID prefix -> timestamp), so the
+    overlapping re-read neither skips nor repeats events, and the account's
+    event sequence read before the query, if any. seq_at, when the sequence
+    was read, is only kept while the cursor is unsettled.
+    """
+    seen = dict(seen)
+    for item in items:
+        ts = int(item['timestamp'])
+        cursor_ts = max(cursor_ts, ts)
+        seen[seen_key(item)] = ts
+    
+    # Timestamps are stored as ages relative to the watermark to keep the cursor short
+    payload = {
+        'ts': cursor_ts,
+        'seen': {key: cursor_ts - ts for key, ts in sorted(seen.items()) if ts >= cursor_ts - CURSOR_OVERLAP_MS}
+    }
+    if seq is not None:
+        payload['seq'] = seq
+        if seq_at is not None:
+            payload['seq_at'] = seq_at
+    payload = json.dumps(payload, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor):
+    """Return (timestamp_ms, seen, event_seq, seq_at) from an opaque cursor.
+    
+    event_seq is None when the cursor has none, and seq_at None once it is settled.
+    
+    seen maps ID prefixes of returned events to their timestamps. Cursors
+    from before the overlap listed the IDs returned at timestamp_ms.
+    """
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        cursor_ts = int(payload['ts'])
+        seen = {key: cursor_ts - int(age) for key, age in (payload.get('seen') or {}).items()}
+        seen.update((event_id[:SEEN_ID_CHARS], cursor_ts) for event_id in payload.get('ids', []))
+        seq = int(payload['seq']) if payload.get('seq') is not None else None
+        seq_at = int(payload['seq_at']) if seq is not None and payload.get('seq_at') is not None else None
+        return cursor_ts, seen, seq, seq_at
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {str(e)}")
@@ -1,183 +1,411 @@
-import json
 import os
-import boto3
-import requests
-from botocore.exceptions import ClientError
+import time
 from datetime import datetime
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor
+from common import governor, graph_async
+from common.aws import client_error, get_client, get_table
+from common.paging import fetch_page, iter_pages, page_info, page_params, parse_limit, prefetch_next
+from common.tokens import get_token_item, invalidate_token, is_token_error
+from common.conversations_cache import conversations_unchanged_since, now_ms
+from common.response import cached_version, conditional_json_response, json_response, not_modified_response
+from common.log import get_logger
+from common.metrics import instrument, timed
+
+log = get_logger('get_messages')
 
-# Initialize DynamoDB resource and tables
-dynamodb = boto3.resource('dynamodb')
-TOKEN_TABLE_NAME = os.environ.get('TOKEN_TABLE_NAME', 'InstaAI-Tokens')
 MESSAGES_TABLE_NAME = os.environ.get('MESSAGES_TABLE_NAME', 'InstaAI-Messages')
-token_table = dynamodb.Table(TOKEN_TABLE_NAME)
-messages_table = dynamodb.Table(MESSAGES_TABLE_NAME)
 
+MESSAGE_FIELDS = "id,created_time,from,to,message"
+
+# 'sync' stores messages before building the response, 'background' overlaps
+# the write with response serialization, 'off' skips persistence.
+STORE_MESSAGES_MODE = os.environ.get('STORE_MESSAGES_MODE', 'sync')
+
+MESSAGES_CONVERSATION_INDEX = os.environ.get('MESSAGES_CONVERSATION_INDEX', 'conversation_id-created_time-index')
+MAX_STORED_MESSAGES = int(os.environ.get('MAX_STORED_MESSAGES', '500'))
+MAX_SYNC_PAGES = int(os.environ.get('MAX_SYNC_PAGES', '5'))
+
+# BatchGetItem accepts at most 100 keys per call
+BATCH_GET_SIZE = 100
+BATCH_GET_RETRIES = 5
+
+# Single worker reused across warm invocations for background persistence
+store_executor = ThreadPoolExecutor(max_workers=1)
+
+CORS_METHODS = "GET, OPTIONS"
+
+@instrument('get_messages')
 def lambda_handler(event, context):
     try:
-        print("Received Event:", json.dumps(event))
+        log.request(event)
         
         # Parse query parameters from the event
         query_params = event.get('queryStringParameters', {}) or {}
         user_id = query_params.get('user_id')
         conversation_id = query_params.get('conversation_id')
+        after = query_params.get('after')
         
         if not user_id:
-            return {
-                'statusCode': 400,
-                'headers': {
-                    "Content-Type": "application/json",
-                    "Access-Control-Allow-Origin": "*",
-                    "Access-Control-Allow-Methods": "GET, OPTIONS"
-                },
-                'body': json.dumps({'error': 'Missing user_id parameter'})
-            }
+            return json_response(400, {'error': 'Missing user_id parameter'}, CORS_METHODS)
+        
+        try:
+            limit = parse_limit(query_params.get('limit'))
+        except ValueError:
+            return json_response(400, {'error': 'Invalid limit parameter'}, CORS_METHODS)
         
         # Ensure user_id is a string
         user_id = str(user_id)
         
-        # Retrieve the access token for this user from DynamoDB
+        # Retrieve the access token for this user (cached across warm invocations)
         try:
-            response = token_table.get_item(Key={'user_id': user_id})
-            item = response.get('Item', {})
+            item = get_token_item(user_id)
             if not item:
-                return {
-                    'statusCode': 404,
-                    'headers': {"Content-Type": "application/json", "Access-Control-Allow-Origin": "*"},
-                    'body': json.dumps({'error': 'User token not found'})
-                }
+                return json_response(404, {'error': 'User token not found'})
             access_token = item.get('access_token')
             if not access_token:
-                return {
-                    'statusCode': 401,
-                    'headers': {"Content-Type": "application/json", "Access-Control-Allow-Origin": "*"},
-                    'body': json.dumps({'error': 'Access token not found'})
-                }
-        except ClientError as e:
-            print(f"Error retrieving token: {e}")
-            return {
-                'statusCode': 500,
-                'headers': {"Content-Type": "application/json", "Access-Control-Allow-Origin": "*"},
-                'body': json.dumps({'error': str(e)})
-            }
+                return json_response(401, {'error': 'Access token not found'})
+        except client_error() as e:
+            log.error("Error retrieving token", error=str(e))
+            return json_response(500, {'error': str(e)})
         
-        # Determine endpoint and fields based on the presence of conversation_id.
-        # - If conversation_id is provided: get messages in that conversation.
-        # - Otherwise, list conversations.
+        # With a conversation_id, serve history from the messages table and
+        # only ask Graph for messages newer than what is stored.
         if conversation_id:
-            ig_api_url = f"https://graph.instagram.com/v22.0/{conversation_id}"
-            fields = "messages"
-        else:
-            ig_api_url = "https://graph.instagram.com/v22.0/me/conversations"
-            fields = "id,updated_time"
+            return get_conversation_messages(event, user_id, conversation_id, access_token, limit, after)
         
-        params = {
-            'fields': fields,
+        # Otherwise, list conversations.
+        ig_api_url = "me/conversations"
+        params = page_params({
+            'fields': 'id,updated_time',
+            'platform': 'instagram',
             'access_token': access_token
-        }
-        if not conversation_id:
-            params['platform'] = 'instagram'
+        }, limit, after)
         
-        api_response = requests.get(ig_api_url, params=params)
-        if api_response.text:
-            result = api_response.json()
-        else:
-            result = {}
-        print("Instagram API Response (truncated):", json.dumps(result)[:500])
+        status_code, result = fetch_page(ig_api_url, params, account=user_id)
+        log.debug("Graph response", status=status_code, body=lambda: result)
         
-        if api_response.status_code == 200:
-            # If conversation_id is provided, fetch full details for each message.
-            if conversation_id and 'messages' in result and 'data' in result['messages']:
-                full_messages = fetch_full_messages(result['messages']['data'], access_token)
-                # Optionally, store these full messages in DynamoDB.
-                store_messages(full_messages, user_id, conversation_id)
-                response_body = {"messages": full_messages, "conversation_id": conversation_id}
-            else:
-                # No conversation_id means we are listing conversations.
-                response_body = result
-            
-            return {
-                'statusCode': 200,
-                'headers': {
-                    "Content-Type": "application/json",
-                    "Access-Control-Allow-Origin": "*",
-                    "Access-Control-Allow-Methods": "GET, OPTIONS"
-                },
-                'body': json.dumps(response_body)
-            }
+        if status_code == 200:
+            prefetch_next(ig_api_url, params, result, account=user_id)
+            result['paging'] = page_info(result)
+            return conditional_json_response(event, 200, result, CORS_METHODS)
         else:
             error_details = result.get('error', {})
-            return {
-                'statusCode': api_response.status_code,
-                'headers': {"Content-Type": "application/json", "Access-Control-Allow-Origin": "*"},
-                'body': json.dumps({
-                    'error': error_details.get('message', 'Unknown error'),
-                    'error_code': error_details.get('code', 'unknown'),
-                    'error_subcode': error_details.get('error_subcode', 'unknown')
-                })
-            }
+            if is_token_error(error_details):
+                invalidate_token(user_id)
+            return graph_error_response(status_code, error_details)
             
     except Exception as e:
-        print(f"Lambda Error: {str(e)}")
-        return {
-            'statusCode': 500,
-            'headers': {"Content-Type": "application/json", "Access-Control-Allow-Origin": "*"},
-            'body': json.dumps({'error': str(e)})
-        }
+        log.exception("Lambda Error", error=str(e))
+        return json_response(500, {'error': str(e)})
 
-def get_message_details(message_id, access_token):
-    """Retrieve full details for a given message_id."""
-    msg_url = f"https://graph.instagram.com/v22.0/{message_id}"
+def get_conversation_messages(event, user_id, conversation_id, access_token, limit=None, after=None):
+    """Return a conversation's messages from the table plus any newer ones from Graph.
+    
+    With an after cursor, return that page of older history from Graph instead.
+    """
+    if after:
+        return get_message_history_page(event, user_id, conversation_id, access_token, limit, after)
+    
+    # Responses are versioned by when they were built; if no messaging
+    # webhook has arrived for the account since the client's version, its
+    # copy is current and neither the table nor Graph is read
+    scope = f"messages:{user_id}:{conversation_id}:{limit or ''}"
+    client_version, client_etag = cached_version(event, scope)
+    if client_version:
+        try:
+            if conversations_unchanged_since(user_id, client_version):
+                return not_modified_response(client_etag, CORS_METHODS, client_version)
+        except client_error() as e:
+            log.warning("Error reading conversations watermark", error=str(e))
+    version = now_ms()
+    
+    try:
+        stored_messages = load_stored_messages(conversation_id)
+    except client_error() as e:
+        # e.g. the conversation index is still being built
+        log.warning("Error loading stored messages", error=str(e))
+        stored_messages = []
+    stored_ids = {msg['id'] for msg in stored_messages}
+    newest_time = stored_messages[-1].get('created_time', '') if stored_messages else ''
+    
+    try:
+        status_code, result, new_messages = fetch_new_messages(
+            conversation_id, access_token, stored_ids, newest_time, limit, account=user_id)
+    except Exception as e:
+        # Timeouts and connection errors: fall back to stored history if any
+        if not stored_messages:
+            raise
+        log.warning("Graph sync failed, serving stored messages", error=str(e))
+        status_code, result, new_messages = None, {}, []
+    
+    if status_code is not None and status_code != 200:
+        error_details = result.get('error', {})
+        if is_token_error(error_details):
+            invalidate_token(user_id)
+        if not stored_messages:
+            return graph_error_response(status_code, error_details)
+        log.warning("Graph sync failed, serving stored messages", status=status_code)
+    
+    log.info("Conversation synced", conversation_id=conversation_id, stored=len(stored_messages), new=len(new_messages))
+    
+    # The cursor continues from the last Graph page read; older pages may
+    # repeat stored messages, so clients should merge by id.
+    response_body = {
+        "messages": stored_messages + new_messages,
+        "conversation_id": conversation_id,
+        "paging": page_info(result),
+        "stale": status_code != 200
+    }
+    # A stale response must not be revalidated by version later
+    if status_code != 200:
+        version = None
+    return messages_response(event, response_body, new_messages, user_id, conversation_id, stored_ids,
+                             version=version, scope=scope)
+
+def get_message_history_page(event, user_id, conversation_id, access_token, limit, after):
+    """Return one page of a conversation's messages from Graph, starting at after."""
+    ig_api_url = f"{conversation_id}/messages"
+    params = page_params({'fields': MESSAGE_FIELDS, 'access_token': access_token}, limit, after)
+    
+    status_code, result = fetch_page(ig_api_url, params, account=user_id)
+    if status_code != 200:
+        error_details = result.get('error', {})
+        if is_token_error(error_details):
+            invalidate_token(user_id)
+        return graph_error_response(status_code, error_details)
+    
+    # Deep scrolling usually asks for the next page too
+    prefetch_next(ig_api_url, params, result, account=user_id)
+    
+    messages = hydrate_messages(result.get('data', []), access_token, account=user_id)
+    response_body = {
+        "messages": messages,
+        "conversation_id": conversation_id,
+        "paging": page_info(result)
+    }
+    return messages_response(event, response_body, messages, user_id, conversation_id)
+
+def messages_response(event, response_body, new_messages, user_id, conversation_id, existing_ids=None,
+                      version=None, scope=''):
+    """Build the 200 (or 304) response, storing new_messages per STORE_MESSAGES_MODE."""
+    pending_store = None
+    if new_messages and STORE_MESSAGES_MODE == 'background':
+        pending_store = store_executor.submit(store_messages, new_messages, user_id, conversation_id, existing_ids)
+    elif new_messages and STORE_MESSAGES_MODE != 'off':
+        store_messages(new_messages, user_id, conversation_id, existing_ids)
+    
+    response = conditional_json_response(event, 200, response_body, CORS_METHODS,
+                                         version=version, scope=scope, last_modified_ms=version)
+    
+    # Lambda freezes the container once the handler returns, so a
+    # background write must finish before then
+    if pending_store:
+        pending_store.result()
+    return response
+
+def graph_error_response(status_code, error_details):
+    """Pass a Graph API error through to the client."""
+    return json_response(status_code, {
+        'error': error_details.get('message', 'Unknown error'),
+        'error_code': error_details.get('code', 'unknown'),
+        'error_subcode': error_details.get('error_subcode', 'unknown')
+    })
+
+@timed('fetch_new_messages')
+def fetch_new_messages(conversation_id, access_token, stored_ids, newest_time, limit=None, account=None):
+    """Fetch messages newer than newest_time from Graph.
+    
+    Graph lists messages newest first, so pages are followed only while
+    every message on them is new. Returns (status_code, last_page, messages)
+    with messages in chronological order.
+    """
+    # Request message fields on the edge so the thread loads in one round trip
+    ig_api_url = f"{conversation_id}/messages"
+    params = page_params({'fields': MESSAGE_FIELDS, 'access_token': access_token}, limit)
+    
+    # On a first open (nothing stored) only the latest page is loaded
+    max_pages = MAX_SYNC_PAGES if stored_ids else 1
+    new_messages = []
+    status_code, result = None, {}
+    for status_code, result in iter_pages(ig_api_url, params, max_pages=max_pages, prefetch=False, account=account):
+        log.debug("Graph response", status=status_code, body=lambda: result)
+        if status_code != 200:
+            break
+        data = result.get('data', [])
+        fresh = [msg for msg in data if is_new_message(msg, stored_ids, newest_time)]
+        new_messages.extend(fresh)
+        
+        # Stop at the first page that reaches stored history
+        if len(fresh) < len(data):
+            break
+    
+    if status_code != 200:
+        if not new_messages:
+            return status_code, result, []
+        # A later page failed; keep the messages already read
+        result = {}
+    
+    new_messages = hydrate_messages(new_messages, access_token, account=account)
+    return 200, result, [msg for msg in new_messages if is_new_message(msg, stored_ids, newest_time)]
+
+def is_new_message(message, stored_ids, newest_time):
+    """True if message is not stored and not older than the newest stored one."""
+    if message.get('id') in stored_ids:
+        return False
+    created_time = message.get('created_time')
+    return created_time is None or created_time >= newest_time
+
+@timed('load_stored_messages')
+def load_stored_messages(conversation_id):
+    """Return up to MAX_STORED_MESSAGES of the latest stored messages, oldest first."""
+    items = []
+    query_kwargs = {
+        'IndexName': MESSAGES_CONVERSATION_INDEX,
+        'KeyConditionExpression': 'conversation_id = :c',
+        'ExpressionAttributeValues': {':c': conversation_id},
+        'ScanIndexForward': False
+    }
+    while len(items) < MAX_STORED_MESSAGES:
+        query_kwargs['Limit'] = MAX_STORED_MESSAGES - len(items)
+        response = get_table(MESSAGES_TABLE_NAME).query(**query_kwargs)
+        items.extend(response.get('Items', []))
+        
+        last_key = response.get('LastEvaluatedKey')
+        if not last_key:
+            break
+        query_kwargs['ExclusiveStartKey'] = last_key
+    
+    return [stored_item_to_message(item) for item in reversed(items)]
+
+def stored_item_to_message(item):
+    """Convert a messages table item back to the Graph message shape."""
+    message = {
+        'id': item['message_id'],
+        'created_time': item.get('created_time', '')
+    }
+    if 'message' in item:
+        message['message'] = item['message']
+    if 'sender_id' in item:
+        message['from'] = {'id': item['sender_id']}
+        if 'sender_username' in item:
+            message['from']['username'] = item['sender_username']
+    if 'recipient_id' in item:
+        message['to'] = {'data': [{'id': item['recipient_id']}]}
+    return message
+
+async def get_message_details(message_id, access_token, account=None):
+    """Retrieve full details for a given message_id.
+    
+    Hydration is background work, so it slows down as the account nears
+    its Graph rate limit.
+    """
+    msg_url = str(message_id)
     params = {
-        "fields": "id,created_time,from,to,message",
+        "fields": MESSAGE_FIELDS,
         "access_token": access_token
     }
-    response = requests.get(msg_url, params=params)
-    if response.status_code == 200 and response.text:
-        return response.json()
+    status_code, result = await graph_async.get(
+        msg_url, params=params, account=account, priority=governor.BACKGROUND)
+    if status_code == 200 and result:
+        return result
     else:
-        print(f"Failed to retrieve details for {message_id}: {response.status_code}")
+        log.warning("Failed to retrieve message details", message_id=message_id, status=status_code)
         return None
 
-def fetch_full_messages(message_list, access_token):
-    """Fetch full details for each message concurrently."""
+def hydrate_messages(message_list, access_token, account=None):
+    """Return full messages in chronological order.
+    
+    Messages already expanded by the conversation request are used as-is;
+    any that came back without details are fetched one by one.
+    """
+    expanded = [msg for msg in message_list if 'created_time' in msg]
+    missing = [msg for msg in message_list if 'id' in msg and 'created_time' not in msg]
+    if missing:
+        log.info("Fetching messages individually", count=len(missing))
+        expanded.extend(fetch_full_messages(missing, access_token, account))
+    
+    # created_time is ISO 8601 in UTC, so string order is chronological
+    return sorted(expanded, key=lambda msg: msg.get('created_time', ''))
+
+@timed('fetch_full_messages')
+def fetch_full_messages(message_list, access_token, account=None):
+    """Fetch full details for each message concurrently, preserving order."""
+    msg_ids = [msg['id'] for msg in message_list if 'id' in msg]
+    results = graph_async.gather([get_message_details(msg_id, access_token, account) for msg_id in msg_ids])
+    
     full_messages = []
-    with ThreadPoolExecutor(max_workers=5) as executor:
-        future_to_msg_id = {
-            executor.submit(get_message_details, msg['id'], access_token): msg['id']
-            for msg in message_list if 'id' in msg
-        }
-        for future in as_completed(future_to_msg_id):
-            msg_id = future_to_msg_id[future]
-            try:
-                details = future.result()
-                if details:
-                    full_messages.append(details)
-            except Exception as e:
-                print(f"Error fetching details for message {msg_id}: {e}")
+    for msg_id, details in zip(msg_ids, results):
+        if isinstance(details, Exception):
+            log.warning("Error fetching message details", message_id=msg_id, error=str(details))
+        elif details:
+            full_messages.append(details)
     return full_messages
 
-def store_messages(messages, user_id, conversation_id):
-    """Store detailed messages in DynamoDB for historical record."""
+@timed('store_messages')
+def store_messages(messages, user_id, conversation_id, existing_ids=None):
+    """Store detailed messages in DynamoDB for historical record.
+    
+    Messages already in the table are skipped, so reopening a conversation
+    neither rewrites them nor bumps their timestamp. Pass existing_ids when
+    the stored IDs are already known to skip the lookup. New messages go
+    out in batches; the batch writer resends any unprocessed items.
+    """
     try:
-        for message_details in messages:
-            if not message_details or 'id' not in message_details:
-                continue
-            
-            item = {
-                'message_id': message_details.get('id'),
-                'conversation_id': conversation_id,
-                'user_id': user_id,
-                'created_time': message_details.get('created_time', ''),
-                'timestamp': int(datetime.now().timestamp())
+        messages = [m for m in messages if m and 'id' in m]
+        if existing_ids is None:
+            existing_ids = get_stored_message_ids([m['id'] for m in messages])
+        
+        now = int(datetime.now().timestamp())
+        stored = 0
+        with get_table(MESSAGES_TABLE_NAME).batch_writer(overwrite_by_pkeys=['message_id']) as batch:
+            for message_details in messages:
+                if message_details['id'] in existing_ids:
+                    continue
+                
+                item = {
+                    'message_id': message_details.get('id'),
+                    'conversation_id': conversation_id,
+                    'user_id': user_id,
+                    'timestamp': now
+                }
+                # created_time is an index key, which cannot be an empty string
+                if message_details.get('created_time'):
+                    item['created_time'] = message_details['created_time']
+                if 'message' in message_details:
+                    item['message'] = message_details.get('message', '')
+                if 'from' in message_details and 'id' in message_details['from']:
+                    item['sender_id'] = message_details['from']['id']
+                    if 'username' in message_details['from']:
+                        item['sender_username'] = message_details['from']['username']
+                if 'to' in message_details and 'data' in message_details['to'] and len(message_details['to']['data']) > 0:
+                    item['recipient_id'] = message_details['to']['data'][0].get('id')
+                
+                batch.put_item(Item=item)
+                stored += 1
+        log.info("Stored new messages", count=stored)
+    except Exception as e:
+        log.exception("Error storing messages", error=str(e))
+
+def get_stored_message_ids(message_ids):
+    """Return the subset of message_ids already present in the messages table."""
+    existing_ids = set()
+    message_ids = list(dict.fromkeys(message_ids))
+    for i in range(0, len(message_ids), BATCH_GET_SIZE):
+        request = {
+            MESSAGES_TABLE_NAME: {
+                'Keys': [{'message_id': {'S': msg_id}} for msg_id in message_ids[i:i + BATCH_GET_SIZE]],
+                'ProjectionExpression': 'message_id'
             }
-            if 'message' in message_details:
-                item['message'] = message_details.get('message', '')
-            if 'from' in message_details and 'id' in message_details['from']:
-                item['sender_id'] = message_details['from']['id']
-            if 'to' in message_details and 'data' in message_details['to'] and len(message_details['to']['data']) > 0:
-                item['recipient_id'] = message_details['to']['data'][0].get('id')
+        }
+        attempt = 0
+        while request and attempt <= BATCH_GET_RETRIES:
+            response = get_client('dynamodb').batch_get_item(RequestItems=request)
+            for item in response.get('Responses', {}).get(MESSAGES_TABLE_NAME, []):
+                existing_ids.add(item['message_id']['S'])
             
-            messages_table.put_item(Item=item)
-    except Exception as e:
-        print(f"Error storing messages: {str(e)}")
+            # Retry throttled keys with exponential backoff
+            request = response.get('UnprocessedKeys')
+            if request:
+                attempt += 1
+                time.sleep(min(0.05 * 2 ** attempt, 1))
+    return existing_ids
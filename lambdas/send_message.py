@@ -1,17 +1,24 @@
 import json
 import os
-import boto3
-import requests
-from botocore.exceptions import ClientError
+from common import graph_async
+from common.aws import client_error
+from common.conversations_cache import mark_conversations_dirty
+from common.rate_limit import get_send_bucket
+from common.tokens import get_token_item, invalidate_token, is_token_error
+from common.response import json_response
+from common.log import get_logger
+from common.metrics import instrument
 
-# Initialize DynamoDB resource and table for tokens
-dynamodb = boto3.resource('dynamodb')
-TOKEN_TABLE_NAME = os.environ.get('TOKEN_TABLE_NAME', 'InstaAI-Tokens')
-token_table = dynamodb.Table(TOKEN_TABLE_NAME)
+log = get_logger('send_message')
 
+MAX_BULK_MESSAGES = int(os.environ.get('MAX_BULK_MESSAGES', '100'))
+
+CORS_METHODS = "POST, OPTIONS"
+
+@instrument('send_message')
 def lambda_handler(event, context):
     try:
-        print("Received Event:", json.dumps(event))
+        log.request(event)
         
         # Parse the request body. (Using "or '{}'" to default if body is None)
         body = json.loads(event.get('body') or '{}')
@@ -19,167 +26,198 @@ def lambda_handler(event, context):
         recipient_id = body.get('recipient_id')
         message_type = body.get('message_type', 'text').lower()
         
-        # Validate required parameters
-        if not user_id or not recipient_id:
-            return {
-                'statusCode': 400,
-                'headers': {
-                    "Content-Type": "application/json",
-                    "Access-Control-Allow-Origin": "*",
-                    "Access-Control-Allow-Methods": "POST, OPTIONS"
-                },
-                'body': json.dumps({'error': 'Missing required parameters: user_id and recipient_id'})
-            }
+        # Validate required parameters (bulk requests carry recipients per message)
+        if not user_id or not (recipient_id or isinstance(body.get('messages'), list)):
+            return json_response(400, {'error': 'Missing required parameters: user_id and recipient_id'}, CORS_METHODS)
         
         # Ensure IDs are strings
         user_id = str(user_id)
-        recipient_id = str(recipient_id)
+        recipient_id = str(recipient_id) if recipient_id else None
         
-        # Retrieve the access token for this user from DynamoDB
+        # Retrieve the access token for this user (cached across warm invocations)
         try:
-            response = token_table.get_item(Key={'user_id': user_id})
-            item = response.get('Item', {})
+            item = get_token_item(user_id)
             if not item:
-                return {
-                    'statusCode': 404,
-                    'headers': {"Content-Type": "application/json", "Access-Control-Allow-Origin": "*"},
-                    'body': json.dumps({'error': 'User token not found'})
-                }
+                return json_response(404, {'error': 'User token not found'})
             access_token = item.get('access_token')
             if not access_token:
-                return {
-                    'statusCode': 401,
-                    'headers': {"Content-Type": "application/json", "Access-Control-Allow-Origin": "*"},
-                    'body': json.dumps({'error': 'Access token not found'})
-                }
-        except ClientError as e:
-            print(f"Error retrieving token: {e}")
-            return {
-                'statusCode': 500,
-                'headers': {"Content-Type": "application/json", "Access-Control-Allow-Origin": "*"},
-                'body': json.dumps({'error': str(e)})
-            }
+                return json_response(401, {'error': 'Access token not found'})
+        except client_error() as e:
+            log.error("Error retrieving token", error=str(e))
+            return json_response(500, {'error': str(e)})
+        
+        # A "messages" list switches to bulk mode
+        if isinstance(body.get('messages'), list):
+            return send_bulk(user_id, access_token, body['messages'])
         
         # Build the payload for the message based on message_type
-        payload = {
-            "recipient": {"id": recipient_id}
-        }
+        payload, error = build_payload(body, recipient_id, message_type)
+        if error:
+            return json_response(400, {'error': error})
         
-        if message_type == "text":
-            message_text = body.get('message')
-            if not message_text:
-                return {
-                    'statusCode': 400,
-                    'headers': {"Content-Type": "application/json", "Access-Control-Allow-Origin": "*"},
-                    'body': json.dumps({'error': 'Missing message text for text message'})
-                }
-            payload["message"] = {"text": message_text}
-        elif message_type == "image":
-            attachment_url = body.get('attachment_url')
-            if not attachment_url:
-                return {
-                    'statusCode': 400,
-                    'headers': {"Content-Type": "application/json", "Access-Control-Allow-Origin": "*"},
-                    'body': json.dumps({'error': 'Missing attachment_url for image message'})
-                }
-            payload["message"] = {
-                "attachment": {
-                    "type": "image",
-                    "payload": {"url": attachment_url}
-                }
-            }
-        elif message_type in ["audio", "video"]:
-            attachment_url = body.get('attachment_url')
-            if not attachment_url:
-                return {
-                    'statusCode': 400,
-                    'headers': {"Content-Type": "application/json", "Access-Control-Allow-Origin": "*"},
-                    'body': json.dumps({'error': f'Missing attachment_url for {message_type} message'})
-                }
-            payload["message"] = {
-                "attachment": {
-                    "type": message_type,
-                    "payload": {"url": attachment_url}
-                }
-            }
-        elif message_type == "like_heart":
-            # Sending a sticker (heart reaction) does not need additional payload.
-            payload["message"] = {
-                "attachment": {"type": "like_heart"}
-            }
-        elif message_type == "media_share":
-            post_id = body.get('post_id')
-            if not post_id:
-                return {
-                    'statusCode': 400,
-                    'headers': {"Content-Type": "application/json", "Access-Control-Allow-Origin": "*"},
-                    'body': json.dumps({'error': 'Missing post_id for MEDIA_SHARE message'})
-                }
-            payload["message"] = {
-                "attachment": {
-                    "type": "MEDIA_SHARE",
-                    "payload": {"id": post_id}
-                }
-            }
-        elif body.get('sender_action'):
-            # For reactions: if sender_action is provided, include it along with the optional payload.
-            payload["sender_action"] = body.get("sender_action")
-            if body.get("payload"):
-                payload["payload"] = body.get("payload")
+        status_code, result = graph_async.run(post_message(access_token, payload, user_id))
+        log.info("Graph response", status=status_code, body=lambda: result)
+        
+        if status_code in [200, 201]:
+            mark_sent(user_id)
+            return json_response(status_code, {
+                'success': True,
+                'response': result
+            }, CORS_METHODS)
         else:
-            return {
-                'statusCode': 400,
-                'headers': {"Content-Type": "application/json", "Access-Control-Allow-Origin": "*"},
-                'body': json.dumps({'error': f'Unsupported or missing message_type: {message_type}'})
+            if is_token_error(result.get('error')):
+                invalidate_token(user_id)
+            return json_response(status_code, {
+                'error': result.get('error', {}).get('message', 'Unknown error'),
+                'error_code': result.get('error', {}).get('code', 'unknown'),
+                'error_subcode': result.get('error', {}).get('error_subcode', 'unknown')
+            })
+            
+    except Exception as e:
+        log.exception("Lambda Error", error=str(e))
+        return json_response(500, {'error': str(e)})
+
+def build_payload(body, recipient_id, message_type):
+    """Build the Send API payload for one message.
+    
+    Returns (payload, None), or (None, error_message) if the message is invalid.
+    """
+    payload = {
+        "recipient": {"id": recipient_id}
+    }
+    
+    if message_type == "text":
+        message_text = body.get('message')
+        if not message_text:
+            return None, 'Missing message text for text message'
+        payload["message"] = {"text": message_text}
+    elif message_type == "image":
+        attachment_url = body.get('attachment_url')
+        if not attachment_url:
+            return None, 'Missing attachment_url for image message'
+        payload["message"] = {
+            "attachment": {
+                "type": "image",
+                "payload": {"url": attachment_url}
             }
-        
-        # According to the documentation, use /me/messages endpoint.
-        ig_api_url = "https://graph.instagram.com/v22.0/me/messages"
-        
-        # Set headers with the access token in the Authorization header.
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {access_token}"
         }
-        
-        response = requests.post(ig_api_url, headers=headers, json=payload)
-        result = response.json()
-        print("Instagram API Response:", result)
-        
-        if response.status_code in [200, 201]:
-            return {
-                'statusCode': response.status_code,
-                'headers': {
-                    "Content-Type": "application/json",
-                    "Access-Control-Allow-Origin": "*",
-                    "Access-Control-Allow-Methods": "POST, OPTIONS"
-                },
-                'body': json.dumps({
-                    'success': True,
-                    'response': result
-                })
+    elif message_type in ["audio", "video"]:
+        attachment_url = body.get('attachment_url')
+        if not attachment_url:
+            return None, f'Missing attachment_url for {message_type} message'
+        payload["message"] = {
+            "attachment": {
+                "type": message_type,
+                "payload": {"url": attachment_url}
             }
-        else:
-            return {
-                'statusCode': response.status_code,
-                'headers': {
-                    "Content-Type": "application/json",
-                    "Access-Control-Allow-Origin": "*"
-                },
-                'body': json.dumps({
-                    'error': result.get('error', {}).get('message', 'Unknown error'),
-                    'error_code': result.get('error', {}).get('code', 'unknown'),
-                    'error_subcode': result.get('error', {}).get('error_subcode', 'unknown')
-                })
+        }
+    elif message_type == "like_heart":
+        # Sending a sticker (heart reaction) does not need additional payload.
+        payload["message"] = {
+            "attachment": {"type": "like_heart"}
+        }
+    elif message_type == "media_share":
+        post_id = body.get('post_id')
+        if not post_id:
+            return None, 'Missing post_id for MEDIA_SHARE message'
+        payload["message"] = {
+            "attachment": {
+                "type": "MEDIA_SHARE",
+                "payload": {"id": post_id}
             }
-            
-    except Exception as e:
-        print(f"Lambda Error: {str(e)}")
-        return {
-            'statusCode': 500,
-            'headers': {
-                "Content-Type": "application/json",
-                "Access-Control-Allow-Origin": "*"
-            },
-            'body': json.dumps({'error': str(e)})
         }
+    elif body.get('sender_action'):
+        # For reactions: if sender_action is provided, include it along with the optional payload.
+        payload["sender_action"] = body.get("sender_action")
+        if body.get("payload"):
+            payload["payload"] = body.get("payload")
+    else:
+        return None, f'Unsupported or missing message_type: {message_type}'
+    
+    return payload, None
+
+async def post_message(access_token, payload, account=None):
+    """Send one message through the /me/messages endpoint."""
+    # According to the documentation, use /me/messages endpoint.
+    ig_api_url = "me/messages"
+    
+    # Set headers with the access token in the Authorization header.
+    headers = {
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {access_token}"
+    }
+    return await graph_async.post(ig_api_url, headers=headers, json=payload, account=account)
+
+def mark_sent(user_id):
+    """Mark the account's cached conversations stale after a send.
+    
+    The echo webhook does too, but only once Meta delivers it; until then
+    conditional GETs of get_messages and get_conversations would answer 304.
+    """
+    try:
+        mark_conversations_dirty([user_id])
+    except client_error() as e:
+        log.warning("Error marking conversations dirty", error=str(e))
+
+def send_bulk(user_id, access_token, messages):
+    """Send a list of messages concurrently under the account's send rate limit.
+    
+    Each entry takes the same fields as a single send (recipient_id,
+    message_type, message, attachment_url, post_id, sender_action, payload).
+    Returns per-message status in request order.
+    """
+    if not messages or len(messages) > MAX_BULK_MESSAGES:
+        return json_response(400, {'error': f'messages must contain 1 to {MAX_BULK_MESSAGES} entries'})
+    
+    results = send_all(user_id, access_token, messages)
+    sent = sum(1 for result in results if result['success'])
+    if sent:
+        mark_sent(user_id)
+    
+    if any(is_token_error(result.get('error_details')) for result in results):
+        invalidate_token(user_id)
+    for result in results:
+        result.pop('error_details', None)
+    
+    return json_response(200, {
+        'success': sent == len(results),
+        'sent': sent,
+        'failed': len(results) - sent,
+        'results': results
+    }, CORS_METHODS)
+
+def send_all(user_id, access_token, messages):
+    """Send messages concurrently, taking a send token per message."""
+    bucket = get_send_bucket(user_id)
+    
+    async def send_one(index, message):
+        recipient_id = message.get('recipient_id') if isinstance(message, dict) else None
+        result = {'index': index, 'recipient_id': str(recipient_id) if recipient_id else None}
+        if not recipient_id:
+            return dict(result, success=False, status_code=400, error='Missing recipient_id')
+        
+        message_type = (message.get('message_type') or 'text').lower()
+        payload, error = build_payload(message, str(recipient_id), message_type)
+        if error:
+            return dict(result, success=False, status_code=400, error=error)
+        
+        await bucket.acquire()
+        try:
+            status_code, response = await post_message(access_token, payload, user_id)
+        except Exception as e:
+            return dict(result, success=False, status_code=502, error=str(e))
+        
+        if status_code in [200, 201]:
+            return dict(result, success=True, status_code=status_code, response=response)
+        error_details = response.get('error', {})
+        return dict(result, success=False, status_code=status_code,
+                    error=error_details.get('message', 'Unknown error'),
+                    error_code=error_details.get('code', 'unknown'),
+                    error_details=error_details)
+    
+    results = graph_async.gather([send_one(i, m) for i, m in enumerate(messages)])
+    # send_one reports Graph failures itself; anything else is a bug
+    for result in results:
+        if isinstance(result, Exception):
+            raise result
+    return results
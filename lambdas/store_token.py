@@ -1,36 +1,28 @@
 import json
-import boto3
 import os
-import logging
 from datetime import datetime
-import requests
+from common import graph
+from common.aws import get_table
+from common.tokens import invalidate_token
+from common.response import json_response, preflight_response
+from common.log import get_logger
+from common.metrics import instrument
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
+log = get_logger('store_token')
 
-# Initialize DynamoDB client
-dynamodb = boto3.resource('dynamodb')
 TOKEN_TABLE_NAME = os.environ.get('TOKEN_TABLE_NAME', 'InstaAI-Tokens')
-token_table = dynamodb.Table(TOKEN_TABLE_NAME)
 
+CORS_METHODS = "POST, OPTIONS"
+
+@instrument('store_token')
 def lambda_handler(event, context):
     try:
-        logger.info(f"Received Event: {json.dumps(event)}")
+        log.request(event)
         
         # Handle CORS preflight (OPTIONS request)
         http_method = event.get("httpMethod") or event.get("requestContext", {}).get("httpMethod", "")
         if http_method == "OPTIONS":
-            return {
-                "statusCode": 200,
-                "headers": {
-                    "Access-Control-Allow-Origin": "*",
-                    "Access-Control-Allow-Methods": "GET,POST,OPTIONS",
-                    "Access-Control-Allow-Headers": "Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token",
-                    "Access-Control-Max-Age": "86400"
-                },
-                "body": ""
-            }
+            return preflight_response("GET,POST,OPTIONS")
         
         # Parse the request body
         body = json.loads(event.get('body', '{}'))
@@ -39,28 +31,12 @@ def lambda_handler(event, context):
         
         # Validate required parameters
         if not access_token or not token_type:
-            return {
-                'statusCode': 400,
-                'headers': {
-                    "Content-Type": "application/json",
-                    "Access-Control-Allow-Origin": "*",
-                    "Access-Control-Allow-Methods": "POST, OPTIONS"
-                },
-                'body': json.dumps({'error': 'Missing required parameters: access_token and token_type'})
-            }
+            return json_response(400, {'error': 'Missing required parameters: access_token and token_type'}, CORS_METHODS)
         
         # Validate token by calling Instagram API
         validation = validate_token(access_token)
         if not validation.get('valid'):
-            return {
-                'statusCode': 400,
-                'headers': {
-                    "Content-Type": "application/json",
-                    "Access-Control-Allow-Origin": "*",
-                    "Access-Control-Allow-Methods": "POST, OPTIONS"
-                },
-                'body': json.dumps({'error': 'Invalid token', 'details': validation})
-            }
+            return json_response(400, {'error': 'Invalid token', 'details': validation}, CORS_METHODS)
         
         # Extract required fields from validation response
         user_id = validation.get('user_id')
@@ -69,61 +45,57 @@ def lambda_handler(event, context):
         
         # Convert user_id to string to ensure it matches the DynamoDB schema
         user_id_str = str(user_id)
-        logger.info(f"Storing details for user_id: {user_id_str}, username: {username}")
+        log.info("Storing token", user_id=user_id_str, username=username)
         
-        # Store the token and metadata in DynamoDB
+        # Store the token and metadata in DynamoDB. Warm containers of other
+        # lambdas read the new token within TOKEN_CACHE_TTL; token_version
+        # is bumped so they can log the change, and storing a token again
+        # restores a previously deleted user.
         current_time = datetime.now().isoformat()
-        item = {
+        get_table(TOKEN_TABLE_NAME).update_item(
+            Key={'user_id': user_id_str},
+            UpdateExpression=(
+                "set access_token = :t, token_type = :tt, username = :n, #id = :i, "
+                "created_at = if_not_exists(created_at, :c), updated_at = :c "
+                "add token_version :one "
+                "remove is_deleted"
+            ),
+            ExpressionAttributeNames={'#id': 'id'},
+            ExpressionAttributeValues={
+                ':t': access_token,
+                ':tt': token_type,
+                ':n': username,
+                ':i': insta_id,
+                ':c': current_time,
+                ':one': 1
+            }
+        )
+        invalidate_token(user_id_str)
+        
+        return json_response(200, {
+            'status': 'success',
+            'message': 'Token stored successfully',
             'user_id': user_id_str,
-            'access_token': access_token,
-            'token_type': token_type,
             'username': username,
             'id': insta_id,
-            'created_at': current_time,
-            'updated_at': current_time
-        }
-        
-        token_table.put_item(Item=item)
-        
-        return {
-            'statusCode': 200,
-            'headers': {
-                "Content-Type": "application/json",
-                "Access-Control-Allow-Origin": "*",
-                "Access-Control-Allow-Methods": "POST, OPTIONS"
-            },
-            'body': json.dumps({
-                'status': 'success',
-                'message': 'Token stored successfully',
-                'user_id': user_id_str,
-                'username': username,
-                'id': insta_id,
-                'token_type': token_type
-            })
-        }
+            'token_type': token_type
+        }, CORS_METHODS)
             
     except Exception as e:
-        logger.exception(f"Lambda Error: {str(e)}")
-        return {
-            'statusCode': 500,
-            'headers': {
-                "Content-Type": "application/json",
-                "Access-Control-Allow-Origin": "*"
-            },
-            'body': json.dumps({'error': str(e)})
-        }
+        log.exception("Lambda Error", error=str(e))
+        return json_response(500, {'error': str(e)})
         
 def validate_token(token):
     """Validate the token by calling the Instagram Graph API"""
     try:
-        url = "https://graph.instagram.com/v22.0/me"
+        url = "me"
         params = {
             'fields': 'user_id,username',
             'access_token': token
         }
         
-        response = requests.get(url, params=params)
-        logger.info(f"Token validation response status: {response.status_code}")
+        response = graph.get(url, params=params)
+        log.info("Token validation response", status=response.status_code)
         
         if response.status_code == 200:
             data = response.json()
@@ -153,5 +125,5 @@ def validate_token(token):
                 'code': error_data.get('code', 'unknown')
             }
     except Exception as e:
-        logger.exception(f"Token validation error: {str(e)}")
+        log.exception("Token validation error", error=str(e))
         return {'valid': False, 'reason': str(e)}
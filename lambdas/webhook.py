@@ -1,20 +1,27 @@
 import json
-import boto3
-import uuid
 import os
 from datetime import datetime
+from common.event_queue import get_event_queue
+from common.ingest import ingest_deliveries
+from common.response import json_response, text_response
+from common.log import get_logger
+from common.metrics import instrument
+
+log = get_logger('webhook')
 
 # Store verification token in environment variables
 VERIFY_TOKEN = os.environ.get("VERIFY_TOKEN", "InstaAI_Webhook_Verify_1234")
-EVENTS_TABLE_NAME = os.environ.get("EVENTS_TABLE_NAME", "InstaAI-WebhookEvents")
 
-# Initialize DynamoDB client
-dynamodb = boto3.resource('dynamodb')
-events_table = dynamodb.Table(EVENTS_TABLE_NAME)
+# 'sync' stores events before acknowledging; 'queue' enqueues the raw
+# delivery, acknowledges at once, and leaves storage to webhook_consumer
+INGEST_MODE = os.environ.get("INGEST_MODE", "sync")
+
+CORS_METHODS = "GET, POST"
 
+@instrument('webhook')
 def lambda_handler(event, context):
     try:
-        print("Received Event:", json.dumps(event))
+        log.request(event)
         
         # Ensure 'httpMethod' exists
         method = event.get('httpMethod', '')
@@ -26,103 +33,37 @@ def lambda_handler(event, context):
             token = params.get('hub.verify_token', '')
             challenge = params.get('hub.challenge', '')
             
-            print(f"mode: {mode}, token: {token}, challenge: {challenge}")
-            
             if mode == 'subscribe' and token == VERIFY_TOKEN:
-                print(f"Returning Challenge: {challenge}")
-                return {
-                    'statusCode': 200,
-                    'headers': {
-                        "Content-Type": "text/plain",
-                        "Access-Control-Allow-Origin": "*",
-                        "Access-Control-Allow-Methods": "GET, POST"
-                    },
-                    'body': challenge
-                }
+                log.info("Webhook verified", mode=mode)
+                return text_response(200, challenge, CORS_METHODS)
             else:
-                print("Verification failed")
-                return {
-                    'statusCode': 403,
-                    'body': 'Verification failed'
-                }
+                log.warning("Webhook verification failed", mode=mode)
+                return text_response(403, 'Verification failed')
         
         # Handle Instagram Webhook Event (POST request)
         elif method == 'POST':
             body = json.loads(event.get('body', '{}'))
-            event_id = str(uuid.uuid4())
             timestamp = int(datetime.now().timestamp() * 1000)  # milliseconds
             
-            # Extract user_id if present for more efficient querying
-            user_id = extract_user_id(body)
-            
-            # Save to DynamoDB
-            item = {
-                'event_id': event_id,
-                'event_data': json.dumps(body),
-                'timestamp': timestamp
-            }
-            
-            # Add user_id if found
-            if user_id:
-                item['user_id'] = user_id
-            
-            events_table.put_item(Item=item)
-            
-            return {
-                'statusCode': 200,
-                'headers': {
-                    "Content-Type": "application/json",
-                    "Access-Control-Allow-Origin": "*",
-                    "Access-Control-Allow-Methods": "GET, POST"
-                },
-                'body': json.dumps({
-                    'status': 'received', 
-                    'event_id': event_id,
+            # Ack-first: hand the raw delivery to the queue and let the
+            # consumer parse and store it in batches
+            if INGEST_MODE == 'queue':
+                get_event_queue().send(body, timestamp)
+                return json_response(200, {
+                    'status': 'queued',
                     'timestamp': timestamp
-                })
-            }
-        else:
-            return {
-                'statusCode': 400,
-                'body': json.dumps({'error': 'Invalid request method'})
-            }
-    except Exception as e:
-        print(f"Lambda Error: {str(e)}")
-        return {
-            'statusCode': 500,
-            'headers': {
-                "Content-Type": "application/json",
-                "Access-Control-Allow-Origin": "*",
-                "Access-Control-Allow-Methods": "GET, POST"
-            },
-            'body': json.dumps({'error': str(e)})
-        }
-
-def extract_user_id(event_data):
-    """Extract Instagram user ID from webhook event if possible"""
-    try:
-        # Check entry array
-        if 'entry' in event_data and len(event_data['entry']) > 0:
-            entry = event_data['entry'][0]
+                }, CORS_METHODS)
             
-            # Look for messaging events
-            if 'messaging' in entry and len(entry['messaging']) > 0:
-                messaging = entry['messaging'][0]
-                
-                # Check recipient (the page/business receiving the message)
-                if 'recipient' in messaging and 'id' in messaging['recipient']:
-                    return messaging['recipient']['id']
+            items = ingest_deliveries([(body, timestamp)])
             
-            # Look for changes array for other event types
-            if 'changes' in entry and len(entry['changes']) > 0:
-                changes = entry['changes'][0]
-                
-                # Check value object
-                if 'value' in changes and 'from' in changes['value']:
-                    from_data = changes['value']['from']
-                    if 'id' in from_data:
-                        return from_data['id']
+            return json_response(200, {
+                'status': 'received', 
+                'event_ids': [item['event_id'] for item in items],
+                'count': len(items),
+                'timestamp': timestamp
+            }, CORS_METHODS)
+        else:
+            return json_response(400, {'error': 'Invalid request method'})
     except Exception as e:
-        print(f"Error extracting user_id: {str(e)}")
-    
-    return None
\ No newline at end of file
+        log.exception("Lambda Error", error=str(e))
+        return json_response(500, {'error': str(e)}, CORS_METHODS)
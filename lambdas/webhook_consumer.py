@@ -0,0 +1,45 @@
+import json
+from common.event_queue import decode_delivery, get_event_queue
+from common.ingest import ingest_deliveries
+from common.log import get_logger
+from common.metrics import instrument
+
+log = get_logger('webhook_consumer')
+
+# Maximum deliveries drained per batch from a local queue
+DRAIN_BATCH_SIZE = 100
+
+@instrument('webhook_consumer')
+def lambda_handler(event, context):
+    """Store webhook deliveries queued by webhook.py in ack-first mode.
+    
+    Invoked by the SQS event source mapping with up to a batch of
+    deliveries in event['Records']. Events from every delivery in the
+    batch are written together with parallel conditional puts.
+    """
+    deliveries = []
+    for record in event.get('Records', []):
+        try:
+            deliveries.append(decode_delivery(record['body']))
+        except (KeyError, ValueError) as e:
+            # A malformed message would fail on every retry, so drop it
+            log.warning("Skipping malformed queue message", message_id=record.get('messageId'), error=str(e))
+    
+    items = ingest_deliveries(deliveries) if deliveries else []
+    log.info("Stored webhook events", events=len(items), deliveries=len(deliveries))
+    return {'deliveries': len(deliveries), 'events': len(items)}
+
+def drain_local_queue(max_batches=None):
+    """Drain a memory or file queue in batches; returns the number of events stored."""
+    stored = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        deliveries = get_event_queue().drain(DRAIN_BATCH_SIZE)
+        if not deliveries:
+            break
+        stored += len(ingest_deliveries(deliveries))
+        batches += 1
+    return stored
+
+if __name__ == '__main__':
+    print(json.dumps({'events': drain_local_queue()}))
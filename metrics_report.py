@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Script to summarize the per-invocation metric lines handlers write
+(common/metrics.py) as p50/p95/p99 per function and phase
+
+Usage: python3 metrics_report.py <log file>...   (or pipe logs on stdin)
+       aws logs tail /aws/lambda/InstaAI-GetMessages --since 1h | python3 metrics_report.py
+"""
+
+import fileinput
+import json
+from collections import defaultdict
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a sorted list"""
+    index = max(0, min(len(values) - 1, round(pct / 100 * len(values)) - 1))
+    return values[index]
+
+def parse_metric_lines(lines):
+    """Yield the EMF records in lines, skipping anything else"""
+    for line in lines:
+        start = line.find('{')
+        if start < 0 or '"_aws"' not in line:
+            continue
+        try:
+            record = json.loads(line[start:])
+        except ValueError:
+            continue
+        if 'Function' in record and '_aws' in record:
+            yield record
+
+def summarize(records):
+    """Map function -> metric name -> sorted values"""
+    summary = defaultdict(lambda: defaultdict(list))
+    for record in records:
+        names = [m['Name'] for d in record['_aws'].get('CloudWatchMetrics', []) for m in d.get('Metrics', [])]
+        for name in names:
+            if isinstance(record.get(name), (int, float)):
+                summary[record['Function']][name].append(record[name])
+    for metrics in summary.values():
+        for values in metrics.values():
+            values.sort()
+    return summary
+
+if __name__ == '__main__':
+    summary = summarize(parse_metric_lines(fileinput.input()))
+    if not summary:
+        print("No metric lines found")
+    for function, metrics in sorted(summary.items()):
+        invocations = len(metrics.get('total_ms', []))
+        print(f"\n{function} ({invocations} invocations)")
+        print(f"  {'metric':<32} {'n':>6} {'p50':>10} {'p95':>10} {'p99':>10}")
+        # total first, then the slowest phases, then counters
+        ordered = sorted(metrics, key=lambda n: (n != 'total_ms', not n.endswith('_ms'), -percentile(metrics[n], 50), n))
+        for name in ordered:
+            values = metrics[name]
+            p50, p95, p99 = (percentile(values, p) for p in (50, 95, 99))
+            print(f"  {name:<32} {len(values):>6} {p50:>10.1f} {p95:>10.1f} {p99:>10.1f}")
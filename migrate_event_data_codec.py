@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Script to re-encode webhook events stored as plain JSON strings with the
+compressed event_data codec. get_events reads both formats, so this can
+run at any time after the codec is deployed
+"""
+
+import os
+import sys
+
+import boto3
+from botocore.exceptions import ClientError
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lambdas'))
+from common.event_codec import decode_event_data, encode_event_data, is_legacy_event_data
+
+EVENTS_TABLE_NAME = os.environ.get('EVENTS_TABLE_NAME', 'InstaAI-WebhookEvents')
+
+def migrate(table, dry_run=False):
+    """Scan for string event_data and rewrite it in the current codec"""
+    scan_kwargs = {
+        'FilterExpression': 'attribute_type(event_data, :s)',
+        'ExpressionAttributeValues': {':s': 'S'},
+        'ProjectionExpression': 'event_id, event_data'
+    }
+    scanned = migrated = skipped = 0
+    bytes_before = bytes_after = 0
+    
+    while True:
+        response = table.scan(**scan_kwargs)
+        for item in response.get('Items', []):
+            scanned += 1
+            old_value = item.get('event_data')
+            try:
+                new_value = encode_event_data(decode_event_data(old_value))
+            except ValueError:
+                skipped += 1
+                continue
+            
+            if is_legacy_event_data(new_value):
+                # EVENT_DATA_CODEC=json; nothing to migrate to
+                skipped += 1
+                continue
+            
+            bytes_before += len(old_value.encode('utf-8'))
+            bytes_after += len(new_value)
+            
+            if not dry_run:
+                try:
+                    # Skip items rewritten since the scan read them
+                    table.update_item(
+                        Key={'event_id': item['event_id']},
+                        UpdateExpression='set event_data = :new',
+                        ConditionExpression='event_data = :old',
+                        ExpressionAttributeValues={':new': new_value, ':old': old_value}
+                    )
+                except ClientError as e:
+                    if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                        raise
+                    skipped += 1
+                    continue
+            migrated += 1
+        
+        last_key = response.get('LastEvaluatedKey')
+        if not last_key:
+            break
+        scan_kwargs['ExclusiveStartKey'] = last_key
+    
+    return scanned, migrated, skipped, bytes_before, bytes_after
+
+if __name__ == '__main__':
+    dry_run = '--dry-run' in sys.argv
+    table = boto3.resource('dynamodb').Table(EVENTS_TABLE_NAME)
+    scanned, migrated, skipped, bytes_before, bytes_after = migrate(table, dry_run=dry_run)
+    action = "Would migrate" if dry_run else "Migrated"
+    print(f"Scanned {scanned} events with string event_data")
+    print(f"{action} {migrated} events, skipped {skipped}")
+    if bytes_before:
+        print(f"event_data size: {bytes_before} -> {bytes_after} bytes ({100 * bytes_after // bytes_before}%)")